@@ -17,3 +17,6 @@ admin.site.register(VisitOccurrence)
 admin.site.register(Measurement)
 admin.site.register(FactRelationship)
 admin.site.register(ConceptRelationship)
+admin.site.register(InterestArea)
+admin.site.register(InterestAreaTrigger)
+admin.site.register(InterestAreaMark)
@@ -0,0 +1,59 @@
+import json
+
+import requests
+from app_saude.utils.benchmark import Benchmark
+from django.core.management.base import BaseCommand, CommandError
+
+COLUMNS = ["scenario", "requests", "errors", "p50_ms", "p95_ms", "max_ms", "queries_p50", "queries_max"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede latência (p50/p95) e número de queries dos principais endpoints contra a população sintética "
+        "criada por generate_population."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenarios",
+            nargs="+",
+            choices=list(Benchmark.SCENARIOS),
+            help="Cenários a executar (padrão: todos)",
+        )
+        parser.add_argument("--iterations", type=int, default=20, help="Requisições medidas por cenário")
+        parser.add_argument("--warmup", type=int, default=2, help="Requisições de aquecimento (não medidas)")
+        parser.add_argument("--label", default="pop", help="Prefixo dos usuários da população")
+        parser.add_argument("--seed", type=int, default=0, help="Semente para a escolha dos usuários")
+        parser.add_argument("--json", dest="json_path", help="Salva os resultados neste arquivo JSON")
+        parser.add_argument(
+            "--base-url",
+            help="Envia as requisições por HTTP a um servidor em execução (ex.: http://127.0.0.1:8001) "
+            "que use o mesmo banco, em vez de chamar as views no próprio processo",
+        )
+
+    def handle(self, *args, **options):
+        benchmark = Benchmark(
+            label=options["label"],
+            iterations=options["iterations"],
+            warmup=options["warmup"],
+            seed=options["seed"],
+            base_url=options["base_url"],
+        )
+        try:
+            results = benchmark.run(options["scenarios"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        except requests.RequestException as e:
+            raise CommandError(f"Falha ao acessar {options['base_url']}: {e}")
+
+        widths = [max(len(column), *(len(str(row[column])) for row in results)) for column in COLUMNS]
+        self.stdout.write("  ".join(column.ljust(width) for column, width in zip(COLUMNS, widths)))
+        for row in results:
+            self.stdout.write("  ".join(str(row[column]).ljust(width) for column, width in zip(COLUMNS, widths)))
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Resultados salvos em {options['json_path']}")
+
+        self.stdout.write(self.style.SUCCESS("✔️  Benchmark concluído."))
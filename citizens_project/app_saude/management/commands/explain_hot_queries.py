@@ -0,0 +1,47 @@
+from app_saude.utils.hot_queries import (
+    HOT_QUERIES,
+    explain_text,
+    indexes_in_plan,
+    query_plan,
+    sample_parameters,
+)
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Mostra o plano (EXPLAIN) de cada consulta frequente sobre observation e se ela usa o índice "
+        "parcial previsto, com parâmetros tirados dos usuários com mais dados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queries",
+            nargs="+",
+            choices=[hot_query.name for hot_query in HOT_QUERIES],
+            help="Consultas a explicar (padrão: todas)",
+        )
+        parser.add_argument("--analyze", action="store_true", help="Executa as consultas (EXPLAIN ANALYZE, BUFFERS)")
+
+    def handle(self, *args, **options):
+        sample = sample_parameters()
+        hot_queries = [q for q in HOT_QUERIES if not options["queries"] or q.name in options["queries"]]
+        using_index = 0
+
+        for hot_query in hot_queries:
+            query = hot_query.build(sample)
+            indexes = indexes_in_plan(query_plan(query))
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{hot_query.name} (índice previsto: {hot_query.index})"))
+            self.stdout.write(explain_text(query, analyze=options["analyze"]))
+            if hot_query.index in indexes:
+                using_index += 1
+                self.stdout.write(self.style.SUCCESS(f"usa {hot_query.index}"))
+            else:
+                self.stdout.write(
+                    self.style.WARNING(f"não usa {hot_query.index} (índices: {', '.join(sorted(indexes)) or 'nenhum'})")
+                )
+            self.stdout.write("")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✔️  {using_index} de {len(hot_queries)} consultas usam o índice previsto.")
+        )
@@ -0,0 +1,61 @@
+import argparse
+import datetime
+import time
+from pathlib import Path
+
+from app_saude.utils.omop_export import EXPORT_CHUNK_SIZE, EXPORT_TABLES, write_csv, write_parquet
+from django.core.management.base import BaseCommand, CommandError
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"data inválida: {value} (use AAAA-MM-DD)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta tabelas do OMOP CDM (person, observation, measurement, drug_exposure, "
+        "visit_occurrence, fact_relationship) em CSV ou Parquet, lendo em lotes com cursor no servidor."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Pasta de destino (um arquivo por tabela)")
+        parser.add_argument(
+            "--tables",
+            nargs="+",
+            choices=list(EXPORT_TABLES),
+            default=list(EXPORT_TABLES),
+            help="Tabelas a exportar (padrão: todas)",
+        )
+        parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Formato de saída")
+        parser.add_argument("--start", type=parse_date, help="Data inicial, inclusiva (AAAA-MM-DD)")
+        parser.add_argument("--end", type=parse_date, help="Data final, inclusiva (AAAA-MM-DD)")
+        parser.add_argument("--care-site", type=int, help="Exporta só pessoas vinculadas a este care_site_id")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="Linhas lidas do banco por lote")
+
+    def handle(self, *args, **options):
+        if options["format"] == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise CommandError("Exportar em Parquet requer o pacote pyarrow (pip install pyarrow).")
+
+        output = Path(options["output"])
+        output.mkdir(parents=True, exist_ok=True)
+        filters = {"start": options["start"], "end": options["end"], "care_site_id": options["care_site"]}
+
+        for name in options["tables"]:
+            table = EXPORT_TABLES[name]
+            path = output / f"{name}.{options['format']}"
+            started = time.monotonic()
+            if options["format"] == "parquet":
+                count = write_parquet(table, path, chunk_size=options["chunk_size"], **filters)
+            else:
+                with open(path, "w", newline="", encoding="utf-8") as fileobj:
+                    count = write_csv(table, fileobj, chunk_size=options["chunk_size"], **filters)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{path.name}: {count} linhas exportadas em {elapsed:.1f}s")
+
+        self.stdout.write(self.style.SUCCESS(f"✔️  Exportação OMOP concluída em {output}"))
@@ -0,0 +1,349 @@
+import json
+import os
+import time
+from pathlib import Path
+
+from app_saude.utils.concept import concept_registry
+from app_saude.utils.vocabulary import invalidate_vocabulary_bundle
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+# Athena export files and the columns of each one (the files are tab separated, with a header).
+ATHENA_FILES = {
+    "VOCABULARY": [
+        "vocabulary_id",
+        "vocabulary_name",
+        "vocabulary_reference",
+        "vocabulary_version",
+        "vocabulary_concept_id",
+    ],
+    "DOMAIN": ["domain_id", "domain_name", "domain_concept_id"],
+    "CONCEPT_CLASS": ["concept_class_id", "concept_class_name", "concept_class_concept_id"],
+    "CONCEPT": [
+        "concept_id",
+        "concept_name",
+        "domain_id",
+        "vocabulary_id",
+        "concept_class_id",
+        "standard_concept",
+        "concept_code",
+        "valid_start_date",
+        "valid_end_date",
+        "invalid_reason",
+    ],
+    "CONCEPT_SYNONYM": ["concept_id", "concept_synonym_name", "language_concept_id"],
+    "CONCEPT_RELATIONSHIP": [
+        "concept_id_1",
+        "concept_id_2",
+        "relationship_id",
+        "valid_start_date",
+        "valid_end_date",
+        "invalid_reason",
+    ],
+}
+
+# Bytes sent to COPY per write.
+COPY_CHUNK_BYTES = 1024 * 1024
+
+# Vocabulary, domain, class and concept reference each other, so they are merged in one
+# transaction (Django creates the foreign keys DEFERRABLE INITIALLY DEFERRED).
+MERGE_STEPS = {
+    "concepts": ["VOCABULARY", "DOMAIN", "CONCEPT_CLASS", "CONCEPT"],
+    "synonyms": ["CONCEPT_SYNONYM"],
+    "relationships": ["CONCEPT_RELATIONSHIP"],
+}
+
+MERGE_SQL = {
+    "VOCABULARY": """
+        INSERT INTO vocabulary (vocabulary_id, vocabulary_name, vocabulary_concept_id, created_at, updated_at)
+        SELECT DISTINCT ON (s.vocabulary_id)
+            s.vocabulary_id, left(s.vocabulary_name, 255), s.vocabulary_concept_id::integer, now(), now()
+        FROM athena_stage_vocabulary s
+        ORDER BY s.vocabulary_id
+        ON CONFLICT (vocabulary_id) DO UPDATE SET
+            vocabulary_name = EXCLUDED.vocabulary_name,
+            vocabulary_concept_id = EXCLUDED.vocabulary_concept_id,
+            updated_at = EXCLUDED.updated_at
+        WHERE (vocabulary.vocabulary_name, vocabulary.vocabulary_concept_id)
+            IS DISTINCT FROM (EXCLUDED.vocabulary_name, EXCLUDED.vocabulary_concept_id)
+    """,
+    "DOMAIN": """
+        INSERT INTO domain (domain_id, domain_name, domain_concept_id, created_at, updated_at)
+        SELECT DISTINCT ON (s.domain_id)
+            s.domain_id, left(s.domain_name, 255), s.domain_concept_id::integer, now(), now()
+        FROM athena_stage_domain s
+        ORDER BY s.domain_id
+        ON CONFLICT (domain_id) DO UPDATE SET
+            domain_name = EXCLUDED.domain_name,
+            domain_concept_id = EXCLUDED.domain_concept_id,
+            updated_at = EXCLUDED.updated_at
+        WHERE (domain.domain_name, domain.domain_concept_id)
+            IS DISTINCT FROM (EXCLUDED.domain_name, EXCLUDED.domain_concept_id)
+    """,
+    "CONCEPT_CLASS": """
+        INSERT INTO concept_class (concept_class_id, concept_class_name, concept_class_concept_id, created_at, updated_at)
+        SELECT DISTINCT ON (s.concept_class_id)
+            s.concept_class_id, left(s.concept_class_name, 255), s.concept_class_concept_id::integer, now(), now()
+        FROM athena_stage_concept_class s
+        ORDER BY s.concept_class_id
+        ON CONFLICT (concept_class_id) DO UPDATE SET
+            concept_class_name = EXCLUDED.concept_class_name,
+            concept_class_concept_id = EXCLUDED.concept_class_concept_id,
+            updated_at = EXCLUDED.updated_at
+        WHERE (concept_class.concept_class_name, concept_class.concept_class_concept_id)
+            IS DISTINCT FROM (EXCLUDED.concept_class_name, EXCLUDED.concept_class_concept_id)
+    """,
+    # Unknown domains/vocabularies/classes become NULL instead of failing the whole load.
+    "CONCEPT": """
+        INSERT INTO concept (
+            concept_id, concept_name, domain_id, vocabulary_id, concept_class_id, concept_code,
+            valid_start_date, valide_end_date, created_at, updated_at
+        )
+        SELECT DISTINCT ON (s.concept_id::integer)
+            s.concept_id::integer, left(s.concept_name, 255), d.domain_id, v.vocabulary_id, c.concept_class_id,
+            left(s.concept_code, 50), to_date(s.valid_start_date, 'YYYYMMDD'), to_date(s.valid_end_date, 'YYYYMMDD'),
+            now(), now()
+        FROM athena_stage_concept s
+        LEFT JOIN domain d ON d.domain_id = s.domain_id
+        LEFT JOIN vocabulary v ON v.vocabulary_id = s.vocabulary_id
+        LEFT JOIN concept_class c ON c.concept_class_id = s.concept_class_id
+        ORDER BY s.concept_id::integer
+        ON CONFLICT (concept_id) DO UPDATE SET
+            concept_name = EXCLUDED.concept_name,
+            domain_id = EXCLUDED.domain_id,
+            vocabulary_id = EXCLUDED.vocabulary_id,
+            concept_class_id = EXCLUDED.concept_class_id,
+            concept_code = EXCLUDED.concept_code,
+            valid_start_date = EXCLUDED.valid_start_date,
+            valide_end_date = EXCLUDED.valide_end_date,
+            updated_at = EXCLUDED.updated_at
+        WHERE (
+            concept.concept_name, concept.domain_id, concept.vocabulary_id, concept.concept_class_id,
+            concept.concept_code, concept.valid_start_date, concept.valide_end_date
+        ) IS DISTINCT FROM (
+            EXCLUDED.concept_name, EXCLUDED.domain_id, EXCLUDED.vocabulary_id, EXCLUDED.concept_class_id,
+            EXCLUDED.concept_code, EXCLUDED.valid_start_date, EXCLUDED.valide_end_date
+        )
+    """,
+    "CONCEPT_SYNONYM": """
+        INSERT INTO concept_synonym (concept_id, concept_synonym_name, language_concept_id, created_at, updated_at)
+        SELECT DISTINCT s.concept_id::integer, left(s.concept_synonym_name, 1000), s.language_concept_id::integer,
+            now(), now()
+        FROM athena_stage_concept_synonym s
+        JOIN concept c ON c.concept_id = s.concept_id::integer
+        JOIN concept l ON l.concept_id = s.language_concept_id::integer
+        WHERE NOT EXISTS (
+            SELECT 1 FROM concept_synonym cs
+            WHERE cs.concept_id = s.concept_id::integer
+              AND cs.language_concept_id = s.language_concept_id::integer
+              AND cs.concept_synonym_name = left(s.concept_synonym_name, 1000)
+        )
+    """,
+    # Only relationships still valid in Athena (no invalid_reason) are loaded.
+    "CONCEPT_RELATIONSHIP": """
+        INSERT INTO app_saude_conceptrelationship (concept_1_id, concept_2_id, relationship_id, created_at, updated_at)
+        SELECT DISTINCT s.concept_id_1::integer, s.concept_id_2::integer, s.relationship_id, now(), now()
+        FROM athena_stage_concept_relationship s
+        JOIN concept c1 ON c1.concept_id = s.concept_id_1::integer
+        JOIN concept c2 ON c2.concept_id = s.concept_id_2::integer
+        WHERE s.invalid_reason IS NULL
+          AND NOT EXISTS (
+            SELECT 1 FROM app_saude_conceptrelationship r
+            WHERE r.concept_1_id = s.concept_id_1::integer
+              AND r.concept_2_id = s.concept_id_2::integer
+              AND r.relationship_id = s.relationship_id
+          )
+    """,
+}
+
+# Concepts referenced by vocabularies, domains and classes but absent from CONCEPT.csv get
+# an empty placeholder row, as the seed commands do.
+PLACEHOLDER_CONCEPTS_SQL = """
+    INSERT INTO concept (concept_id, created_at, updated_at)
+    SELECT DISTINCT ref.concept_id, now(), now()
+    FROM (
+        SELECT vocabulary_concept_id AS concept_id FROM vocabulary
+        UNION SELECT domain_concept_id FROM domain
+        UNION SELECT concept_class_concept_id FROM concept_class
+    ) ref
+    WHERE ref.concept_id IS NOT NULL
+    ON CONFLICT (concept_id) DO NOTHING
+"""
+
+
+class ProgressReader:
+    """File wrapper that reports how much of the file COPY has consumed."""
+
+    def __init__(self, raw, total_bytes, report, every_bytes=64 * 1024 * 1024):
+        self.raw = raw
+        self.total_bytes = total_bytes
+        self.report = report
+        self.every_bytes = every_bytes
+        self.read_bytes = 0
+        self.next_report = every_bytes
+
+    def read(self, size=-1):
+        chunk = self.raw.read(size)
+        self.read_bytes += len(chunk)
+        if self.read_bytes >= self.next_report:
+            self.report(self.read_bytes, self.total_bytes)
+            self.next_report += self.every_bytes
+        return chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa um download do Athena (CONCEPT.csv, CONCEPT_SYNONYM.csv, CONCEPT_RELATIONSHIP.csv, "
+        "VOCABULARY.csv, DOMAIN.csv e CONCEPT_CLASS.csv) via COPY para tabelas de staging e "
+        "mescla os dados nas tabelas do app. Retoma a partir do checkpoint se interrompido."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Pasta com os arquivos CSV do Athena")
+        parser.add_argument(
+            "--checkpoint",
+            help="Arquivo de checkpoint (padrão: <path>/.load_athena_checkpoint.json)",
+        )
+        parser.add_argument("--restart", action="store_true", help="Ignora o checkpoint e recomeça do zero")
+        parser.add_argument(
+            "--keep-staging", action="store_true", help="Mantém as tabelas de staging ao final da importação"
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("load_athena precisa de PostgreSQL (usa COPY FROM STDIN).")
+
+        source = Path(options["path"]).resolve()
+        if not source.is_dir():
+            raise CommandError(f"Pasta não encontrada: {source}")
+
+        files = {name: source / f"{name}.csv" for name in ATHENA_FILES if (source / f"{name}.csv").exists()}
+        if not files:
+            raise CommandError(f"Nenhum arquivo do Athena encontrado em {source}")
+
+        checkpoint_path = Path(options["checkpoint"] or source / ".load_athena_checkpoint.json")
+        checkpoint = self.load_checkpoint(checkpoint_path, source, options["restart"])
+
+        for name, path in files.items():
+            self.copy_file(name, path, checkpoint, checkpoint_path)
+
+        for step, names in MERGE_STEPS.items():
+            present = [name for name in names if name in files]
+            if present:
+                self.merge(step, present, checkpoint, checkpoint_path)
+
+        # The merges bypass the ORM, so the caches fed by model signals are cleared here.
+        concept_registry.invalidate()
+        invalidate_vocabulary_bundle()
+
+        if not options["keep_staging"]:
+            with connection.cursor() as cursor:
+                for name in ATHENA_FILES:
+                    cursor.execute(f"DROP TABLE IF EXISTS {self.stage_table(name)}")
+            checkpoint_path.unlink(missing_ok=True)
+
+        self.stdout.write(self.style.SUCCESS("✔️  Vocabulário do Athena importado com sucesso."))
+
+    # Checkpoint
+
+    def load_checkpoint(self, path, source, restart):
+        if path.exists() and not restart:
+            checkpoint = json.loads(path.read_text())
+            if checkpoint.get("source") == str(source):
+                done = ", ".join(sorted(checkpoint["steps"])) or "nenhuma"
+                self.stdout.write(self.style.NOTICE(f"Retomando do checkpoint {path} (etapas concluídas: {done})"))
+                return checkpoint
+        return {"source": str(source), "steps": {}}
+
+    def save_checkpoint(self, path, checkpoint, step, info):
+        checkpoint["steps"][step] = info
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(checkpoint, indent=2))
+        os.replace(tmp_path, path)
+
+    # COPY into staging
+
+    @staticmethod
+    def stage_table(name):
+        return f"athena_stage_{name.lower()}"
+
+    @staticmethod
+    def fingerprint(path):
+        stat = path.stat()
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def copy_file(self, name, path, checkpoint, checkpoint_path):
+        step = f"copy:{name}"
+        table = self.stage_table(name)
+        done = checkpoint["steps"].get(step)
+        if done and done["file"] == self.fingerprint(path) and (done["rows"] == 0 or self.stage_has_rows(table)):
+            self.stdout.write(f"{path.name}: já copiado ({done['rows']} linhas), pulando")
+            return
+
+        columns = ATHENA_FILES[name]
+        total_bytes = path.stat().st_size
+        started = time.monotonic()
+
+        def report(read_bytes, total):
+            self.stdout.write(f"{path.name}: {read_bytes * 100 // max(total, 1)}% ({read_bytes // 2**20} MiB)")
+
+        with open(path, "rb") as raw:
+            header = raw.readline().decode("utf-8-sig").rstrip("\r\n").split("\t")
+            unknown = set(header) - set(columns)
+            if unknown:
+                raise CommandError(f"{path.name}: colunas inesperadas {sorted(unknown)}")
+
+            # UNLOGGED: staging data is disposable and skips the WAL.
+            column_defs = ", ".join(f"{column} text" for column in columns)
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"CREATE UNLOGGED TABLE IF NOT EXISTS {table} ({column_defs})")
+                cursor.execute(f"TRUNCATE {table}")
+                # CSV with a quote character that never appears: Athena files are unquoted TSV.
+                with cursor.copy(
+                    f"COPY {table} ({', '.join(header)}) FROM STDIN "
+                    "WITH (FORMAT csv, DELIMITER E'\\t', QUOTE E'\\b', NULL '')"
+                ) as copy:
+                    reader = ProgressReader(raw, total_bytes, report)
+                    while chunk := reader.read(COPY_CHUNK_BYTES):
+                        copy.write(chunk)
+                rows = cursor.rowcount
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{path.name}: {rows} linhas copiadas em {elapsed:.1f}s")
+        # The merges done from the previous staging (a resumed run, or --keep-staging) must run again.
+        for key in [key for key in checkpoint["steps"] if key.startswith("merge:")]:
+            del checkpoint["steps"][key]
+        self.save_checkpoint(checkpoint_path, checkpoint, step, {"file": self.fingerprint(path), "rows": rows})
+
+    @staticmethod
+    def stage_has_rows(table):
+        # UNLOGGED tables come back empty after a crash, so the checkpoint alone is not enough.
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table])
+            if not cursor.fetchone()[0]:
+                return False
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+            return cursor.fetchone()[0]
+
+    # Set-based merge into the app tables
+
+    def merge(self, step, names, checkpoint, checkpoint_path):
+        key = f"merge:{step}"
+        if key in checkpoint["steps"]:
+            self.stdout.write(f"Mesclagem '{step}': já concluída, pulando")
+            return
+
+        started = time.monotonic()
+        counts = {}
+        with transaction.atomic(), connection.cursor() as cursor:
+            for name in names:
+                cursor.execute(MERGE_SQL[name])
+                counts[name] = cursor.rowcount
+                self.stdout.write(f"{name}: {cursor.rowcount} linhas inseridas/atualizadas")
+            if step == "concepts":
+                cursor.execute(PLACEHOLDER_CONCEPTS_SQL)
+                counts["placeholders"] = cursor.rowcount
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Mesclagem '{step}' concluída em {elapsed:.1f}s")
+        self.save_checkpoint(checkpoint_path, checkpoint, key, counts)
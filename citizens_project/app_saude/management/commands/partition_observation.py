@@ -0,0 +1,74 @@
+from app_saude.utils.partitioning import (
+    MONTHS_AHEAD,
+    SCHEMES,
+    extend_month_partitions,
+    observation_partitioning,
+    observation_partitions,
+    pending_migrations,
+    rebuild_observation,
+)
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Particiona a tabela observation (PARTITION BY do PostgreSQL) por conceito ou por mês de observation_date, "
+        "copiando os dados existentes, ou a desfaz de volta para uma tabela comum. A tabela fica bloqueada "
+        "durante a cópia."
+    )
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument(
+            "--by",
+            choices=list(SCHEMES),
+            help="concept: uma partição por conceito frequente (diário, pedido de ajuda, área de interesse, "
+            "código de vínculo); month: uma partição por mês",
+        )
+        group.add_argument("--undo", action="store_true", help="Volta observation a ser uma tabela comum")
+        group.add_argument(
+            "--extend",
+            action="store_true",
+            help="Cria as partições mensais que faltam até --months-ahead meses à frente (rodar todo mês)",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=MONTHS_AHEAD,
+            help=f"Meses futuros com partição já criada, no particionamento por mês (padrão: {MONTHS_AHEAD})",
+        )
+
+    def handle(self, *args, **options):
+        current = observation_partitioning()
+
+        if options["extend"]:
+            if current != "month":
+                raise CommandError("observation não está particionada por mês.")
+            created = extend_month_partitions(options["months_ahead"])
+            self.stdout.write(self.style.SUCCESS(f"✔️  {created} partições mensais criadas."))
+            return
+
+        scheme = None if options["undo"] else options["by"]
+        pending = pending_migrations() if scheme else []
+        if pending:
+            raise CommandError(f"Há migrações pendentes ({', '.join(pending)}): rode migrate antes de particionar.")
+        if scheme == current:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"observation já está particionada por {current}."
+                    if current
+                    else "observation já é uma tabela comum."
+                )
+            )
+            return
+
+        rebuild_observation(scheme, months_ahead=options["months_ahead"])
+        for name, bound in observation_partitions():
+            self.stdout.write(f"  {name}: {bound}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✔️  observation particionada por {scheme}."
+                if scheme
+                else "✔️  observation voltou a ser uma tabela comum."
+            )
+        )
@@ -0,0 +1,33 @@
+from app_saude.models import ProviderHelpCounter
+from django.core.management.base import BaseCommand
+
+
+def format_counts(counts):
+    return "—" if counts is None else f"{counts[0]} ativos / {counts[1]} resolvidos"
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os contadores de pedidos de ajuda (provider_help_counter) a partir das observações "
+        "e dos vínculos, e corrige as linhas divergentes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Só lista as divergências, sem corrigir")
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            drifted = ProviderHelpCounter.objects.drift()
+        else:
+            drifted = ProviderHelpCounter.objects.reconcile()
+
+        for row in drifted:
+            self.stdout.write(
+                f"provider {row['provider_id']} / person {row['person_id']}: "
+                f"{format_counts(row['stored'])} -> {format_counts(row['expected'])}"
+            )
+
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"✔️  {len(drifted)} contadores divergentes (nada foi alterado)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✔️  {len(drifted)} contadores corrigidos."))
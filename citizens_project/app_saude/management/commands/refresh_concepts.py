@@ -0,0 +1,20 @@
+from app_saude.utils.concept import concept_registry
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Recarrega o registro de conceitos em memória a partir do banco de dados, neste processo e, em até "
+        "CACHE_GENERATION_CHECK_SECONDS segundos, nos workers do servidor."
+    )
+
+    def handle(self, *args, **kwargs):
+        concept_registry.invalidate()
+        count = concept_registry.load()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✔️  Registro de conceitos recarregado ({count} conceitos locais); os workers o recarregam em até "
+                f"{settings.CACHE_GENERATION_CHECK_SECONDS}s."
+            )
+        )
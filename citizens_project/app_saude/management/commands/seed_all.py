@@ -1,3 +1,4 @@
+from app_saude.utils.vocabulary import rebuild_vocabulary_bundle
 from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 
@@ -20,4 +21,6 @@ class Command(BaseCommand):
             except Exception as e:
                 self.stdout.write(self.style.ERROR(f"Erro ao executar {seed}: {e}"))
                 raise CommandError(f"Erro ao executar {seed}")
+        bundle = rebuild_vocabulary_bundle()
+        self.stdout.write(self.style.NOTICE(f"Pacote de vocabulário reconstruído ({bundle['etag']})."))
         self.stdout.write(self.style.SUCCESS("Todos os seeds executados com sucesso!"))
@@ -1,18 +1,17 @@
 from app_saude.models import *
+from app_saude.utils.seeding import seed_rows
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 
 class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
+        concept_classes = []
 
         def concept_class(id, name, concept_id):
-            return ConceptClass.objects.get_or_create(
-                concept_class_id=id,
-                defaults={
-                    "concept_class_name": name,
-                    "concept_class_concept": Concept.objects.get_or_create(concept_id=concept_id)[0],
-                },
+            concept_classes.append(
+                {"concept_class_id": id, "concept_class_name": name, "concept_class_concept_id": concept_id}
             )
 
         # concept_class (IMPORTED FROM ATHENA 14/05/2025)
@@ -467,4 +466,11 @@ class Command(BaseCommand):
         # Custom concept classes
         concept_class("Brazil States", "Brazil States", 2000000010)
 
+        # Existing rows are left untouched; only missing ones (and the concepts they point to) are created.
+        with transaction.atomic():
+            placeholders = [{"concept_id": row["concept_class_concept_id"]} for row in concept_classes]
+            seed_rows(Concept, placeholders, update_existing=False)
+            result = seed_rows(ConceptClass, concept_classes, update_existing=False)
+
+        self.stdout.write(str(result))
         self.stdout.write(self.style.SUCCESS("✔️  Concept classes populated successfully."))
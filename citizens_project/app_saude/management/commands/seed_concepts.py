@@ -1,39 +1,30 @@
 from app_saude.models import *
+from app_saude.utils.seeding import seed_rows
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 
 class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
+        concepts = []
+        synonyms = []
 
         def add_concept(cid, name, class_id, code, domain_id, vocabulary_id, pt_name=None):
-            defaults = {
-                "concept_name": name,
-                "concept_code": code,
-            }
-
-            if class_id is not None:
-                defaults["concept_class"] = ConceptClass.objects.get(concept_class_id=class_id)
-
-            if domain_id is not None:
-                defaults["domain"] = Domain.objects.get(domain_id=domain_id)
-
-            if vocabulary_id is not None:
-                defaults["vocabulary_id"] = vocabulary_id
-
-            concept, _ = Concept.objects.update_or_create(
-                concept_id=cid,
-                defaults=defaults,
+            # A None class, domain or vocabulary keeps whatever is stored (see keep_when_none below)
+            concepts.append(
+                {
+                    "concept_id": cid,
+                    "concept_name": name,
+                    "concept_code": code,
+                    "concept_class_id": class_id,
+                    "domain_id": domain_id,
+                    "vocabulary_id": vocabulary_id,
+                }
             )
 
             if pt_name:
-                ConceptSynonym.objects.update_or_create(
-                    concept=concept,
-                    language_concept_id=4181536,
-                    defaults={
-                        "concept_synonym_name": pt_name,
-                    },
-                )
+                synonyms.append({"concept_id": cid, "language_concept_id": 4181536, "concept_synonym_name": pt_name})
 
         # Portuguese concept
         add_concept(4181536, "Portuguese language", "Qualifier Value", "297504001", "Language", "SNOMED", "Português")
@@ -148,4 +139,21 @@ class Command(BaseCommand):
         add_concept(2000009001, "AOI_Diary", None, "AOI_DIARY", None, None, "Diario area de interesse")
         add_concept(2000009002, "Text_Diary", None, "TEXT_DIARY", None, None, "Diario area de interesse")
 
+        optional_fields = ("concept_class_id", "domain_id", "vocabulary_id")
+        with transaction.atomic():
+            concepts_result = seed_rows(
+                Concept,
+                concepts,
+                fields=("concept_name", "concept_code", *optional_fields),
+                keep_when_none=optional_fields,
+            )
+            synonyms_result = seed_rows(
+                ConceptSynonym,
+                synonyms,
+                key=("concept_id", "language_concept_id"),
+                fields=("concept_synonym_name",),
+            )
+
+        self.stdout.write(str(concepts_result))
+        self.stdout.write(str(synonyms_result))
         self.stdout.write(self.style.SUCCESS("✔️  Concepts populated successfully."))
@@ -1,19 +1,16 @@
 from app_saude.models import *
+from app_saude.utils.seeding import seed_rows
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 
 class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
+        domains = []
 
         def domain(id, name, concept_id):
-            return Domain.objects.get_or_create(
-                domain_id=id,
-                defaults={
-                    "domain_name": name,
-                    "domain_concept": Concept.objects.get_or_create(concept_id=concept_id)[0],
-                },
-            )
+            domains.append({"domain_id": id, "domain_name": name, "domain_concept_id": concept_id})
 
         # domains (IMPORTED FROM ATHENA 14/05/2025)
         domain("Gender", "Gender", 2)
@@ -73,4 +70,11 @@ class Command(BaseCommand):
 
         # Custom domains
 
+        # Existing rows are left untouched; only missing ones (and the concepts they point to) are created.
+        with transaction.atomic():
+            placeholders = [{"concept_id": row["domain_concept_id"]} for row in domains]
+            seed_rows(Concept, placeholders, update_existing=False)
+            result = seed_rows(Domain, domains, update_existing=False)
+
+        self.stdout.write(str(result))
         self.stdout.write(self.style.SUCCESS("✔️  Domain classes populated successfully."))
@@ -1,8 +1,7 @@
-import json
-
-from app_saude.models import Observation
+from app_saude.models import InterestArea, InterestAreaTrigger, Observation
 from app_saude.utils.concept import get_concept_by_code
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 
 
@@ -88,17 +87,27 @@ class Command(BaseCommand):
             interest_area_triggers[interest_area].append(trigger)
 
         for interest_area, triggers in interest_area_triggers.items():
-            interest_area_data = {
-                "name": interest_area,
-                "is_attention_point": False,
-                "marked_by": [],
-                "triggers": triggers,
-            }
+            with transaction.atomic():
+                area = InterestArea.objects.filter(person=None, name=interest_area).first()
+                if area is None:
+                    observation = Observation.objects.create(
+                        observation_concept_id=get_concept_by_code("INTEREST_AREA").concept_id,
+                        value_as_string=interest_area,
+                        observation_date=timezone.now(),
+                    )
+                    area = InterestArea.objects.create(observation=observation, name=interest_area)
 
-            Observation.objects.update_or_create(
-                observation_concept_id=get_concept_by_code("INTEREST_AREA").concept_id,
-                value_as_string=json.dumps(interest_area_data, ensure_ascii=False),
-                defaults={"observation_date": timezone.now()},
-            )
+                area.triggers.all().delete()
+                InterestAreaTrigger.objects.bulk_create(
+                    [
+                        InterestAreaTrigger(
+                            interest_area=area,
+                            name=trigger["name"],
+                            type=trigger["type"],
+                            position=position,
+                        )
+                        for position, trigger in enumerate(triggers)
+                    ]
+                )
 
         self.stdout.write(self.style.SUCCESS("✔️  Interest areas and triggers seeded successfully."))
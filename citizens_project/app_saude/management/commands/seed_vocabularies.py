@@ -1,19 +1,16 @@
 from app_saude.models import *
+from app_saude.utils.seeding import seed_rows
 from django.core.management.base import BaseCommand
+from django.db import transaction
 
 
 class Command(BaseCommand):
 
     def handle(self, *args, **kwargs):
+        vocabularies = []
 
         def vocabulary(id, name, concept_id):
-            return Vocabulary.objects.get_or_create(
-                vocabulary_id=id,
-                defaults={
-                    "vocabulary_name": name,
-                    "vocabulary_concept": Concept.objects.get_or_create(concept_id=concept_id)[0],
-                },
-            )
+            vocabularies.append({"vocabulary_id": id, "vocabulary_name": name, "vocabulary_concept_id": concept_id})
 
         # vocabulary (IMPORTED FROM ATHENA 14/05/2025)
         vocabulary("DPD", "Drug Product Database (Health Canada)", 231)
@@ -171,4 +168,11 @@ class Command(BaseCommand):
 
         # Custom vocabularies
 
+        # Existing rows are left untouched; only missing ones (and the concepts they point to) are created.
+        with transaction.atomic():
+            placeholders = [{"concept_id": row["vocabulary_concept_id"]} for row in vocabularies]
+            seed_rows(Concept, placeholders, update_existing=False)
+            result = seed_rows(Vocabulary, vocabularies, update_existing=False)
+
+        self.stdout.write(str(result))
         self.stdout.write(self.style.SUCCESS("✔️  Vocabulary populated successfully."))
@@ -0,0 +1,114 @@
+"""
+Prometheus metrics.
+
+Request, throttle and login metrics are updated in-process. Under gunicorn,
+PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py) makes every worker write
+its samples to that directory, and /metrics aggregates all of them, so a
+scrape sees the whole server whichever worker answers it. Domain gauges are
+read from the database at scrape time instead.
+"""
+
+import logging
+import os
+
+from django.db.models import Sum
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+from rest_framework.exceptions import Throttled
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from .models import Person, Provider, ProviderHelpCounter
+
+logger = logging.getLogger("app_saude")
+
+# Label for requests that did not resolve to a named URL, so unknown paths
+# cannot blow up the number of series.
+UNNAMED_VIEW = "unnamed"
+
+REQUESTS = Counter(
+    "saude_http_requests_total",
+    "HTTP requests by URL name, method and status code.",
+    ["view", "method", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "saude_http_request_duration_seconds",
+    "HTTP request wall time by URL name.",
+    ["view", "method"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    "saude_http_request_db_queries",
+    "Database queries issued per HTTP request, by URL name.",
+    ["view", "method"],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+THROTTLED_REQUESTS = Counter(
+    "saude_http_throttled_requests_total",
+    "Requests rejected by DRF throttling, by URL name.",
+    ["view"],
+)
+GOOGLE_LOGINS = Counter(
+    "saude_google_logins_total",
+    "Google login attempts by outcome.",
+    ["outcome"],
+)
+
+
+def view_label(request) -> str:
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None or not resolver_match.url_name:
+        return UNNAMED_VIEW
+    return resolver_match.url_name
+
+
+def observe_request(request, response, duration: float, query_count: int):
+    view = view_label(request)
+    REQUESTS.labels(view=view, method=request.method, status=response.status_code).inc()
+    REQUEST_LATENCY.labels(view=view, method=request.method).observe(duration)
+    REQUEST_QUERIES.labels(view=view, method=request.method).observe(query_count)
+
+
+def exception_handler(exc, context):
+    """DRF EXCEPTION_HANDLER: counts throttled requests, then defers to DRF."""
+    if isinstance(exc, Throttled):
+        THROTTLED_REQUESTS.labels(view=view_label(context["request"])).inc()
+    return drf_exception_handler(exc, context)
+
+
+class DomainCollector:
+    """Domain gauges, computed from the database on each scrape."""
+
+    def collect(self):
+        try:
+            # The counter table holds one row per linked pair: no scan of observation per scrape.
+            active_helps = ProviderHelpCounter.objects.aggregate(active=Sum("active_count", default=0))["active"]
+            persons = Person.objects.count()
+            providers = Provider.objects.count()
+        except Exception as e:
+            logger.error(
+                "Error collecting domain metrics",
+                extra={"error": str(e), "error_type": type(e).__name__, "action": "domain_metrics_error"},
+            )
+            return
+
+        yield GaugeMetricFamily(
+            "saude_active_help_observations",
+            "HELP observations still ACTIVE, sent by persons to their linked providers.",
+            value=active_helps,
+        )
+        yield GaugeMetricFamily("saude_persons", "Registered persons.", value=persons)
+        yield GaugeMetricFamily("saude_providers", "Registered providers.", value=providers)
+
+
+def metrics_registry():
+    """
+    Registry to expose: every worker's samples in multiprocess mode, this
+    process's otherwise, plus the domain gauges.
+    """
+    registry = CollectorRegistry()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    registry.register(DomainCollector())
+    return registry
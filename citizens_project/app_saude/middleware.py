@@ -0,0 +1,159 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import observe_request
+
+logger = logging.getLogger("app_saude")
+
+# Longest slice of the slowest statement kept in the log record.
+SLOW_SQL_LOG_LENGTH = 1000
+
+
+class QueryMetrics:
+    """
+    ``connection.execute_wrapper`` callable that counts and times every query.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_sql = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.total_time += elapsed
+            if elapsed >= self.slowest_time:
+                self.slowest_time = elapsed
+                self.slowest_sql = sql
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, query count, total DB time and the slowest SQL of each request.
+
+    The numbers go out as a ``Server-Timing`` header (``app``, ``db``), to the
+    Prometheus metrics in app_saude.metrics and through the ``app_saude``
+    logger: DEBUG for every request, WARNING when the request goes over
+    REQUEST_QUERY_BUDGET queries or REQUEST_LATENCY_BUDGET_MS milliseconds.
+    Queries run while a streaming response is being consumed happen after
+    this point and are not counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = QueryMetrics()
+        started = time.perf_counter()
+        with connection.execute_wrapper(metrics):
+            response = self.get_response(request)
+        return self.record(request, response, time.perf_counter() - started, metrics)
+
+    async def __acall__(self, request):
+        metrics = QueryMetrics()
+        started = time.perf_counter()
+        # Under ASGI the ORM runs in the request's sync_to_async thread, which
+        # has its own connection: the wrapper has to be installed from there.
+        await sync_to_async(self.add_wrapper)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(self.remove_wrapper)(metrics)
+        return self.record(request, response, time.perf_counter() - started, metrics)
+
+    @staticmethod
+    def add_wrapper(metrics):
+        connection.execute_wrappers.append(metrics)
+
+    @staticmethod
+    def remove_wrapper(metrics):
+        connection.execute_wrappers.remove(metrics)
+
+    def record(self, request, response, duration, metrics):
+        observe_request(request, response, duration, metrics.count)
+        duration_ms = duration * 1000
+        db_time_ms = metrics.total_time * 1000
+
+        response["Server-Timing"] = (
+            f'app;dur={duration_ms - db_time_ms:.1f}, db;dur={db_time_ms:.1f};desc="{metrics.count} queries"'
+        )
+
+        over_budget = metrics.count > settings.REQUEST_QUERY_BUDGET or duration_ms > settings.REQUEST_LATENCY_BUDGET_MS
+        if not over_budget and not logger.isEnabledFor(logging.DEBUG):
+            return response
+
+        resolver_match = getattr(request, "resolver_match", None)
+        extra = {
+            "method": request.method,
+            "path": request.path,
+            "route": resolver_match.route if resolver_match else None,
+            "status_code": response.status_code,
+            "user_id": getattr(getattr(request, "user", None), "id", None),
+            "duration_ms": round(duration_ms, 1),
+            "query_count": metrics.count,
+            "db_time_ms": round(db_time_ms, 1),
+            "slowest_query_ms": round(metrics.slowest_time * 1000, 1),
+            "slowest_sql": (metrics.slowest_sql or "")[:SLOW_SQL_LOG_LENGTH],
+        }
+        if over_budget:
+            logger.warning(
+                "Request over budget",
+                extra={
+                    **extra,
+                    "query_budget": settings.REQUEST_QUERY_BUDGET,
+                    "latency_budget_ms": settings.REQUEST_LATENCY_BUDGET_MS,
+                    "action": "request_over_budget",
+                },
+            )
+        else:
+            logger.debug("Request metrics", extra={**extra, "action": "request_metrics"})
+        return response
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that also runs as async middleware.
+
+    WhiteNoise's own middleware is sync-only; placed first in MIDDLEWARE it
+    would run every ASGI request, async views included, in a thread.
+    """
+
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        # Only the autorefresh lookup (DEBUG) touches the disk.
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
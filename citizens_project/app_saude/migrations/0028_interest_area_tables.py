@@ -0,0 +1,128 @@
+# Generated by Django 5.2 on 2026-10-17 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_saude", "0027_remove_conceptsynonym_id_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InterestArea",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True, db_comment="Creation timestamp")),
+                ("updated_at", models.DateTimeField(auto_now=True, db_comment="Update timestamp")),
+                (
+                    "observation",
+                    models.OneToOneField(
+                        db_comment="INTEREST_AREA Observation backing this area",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="interest_area",
+                        serialize=False,
+                        to="app_saude.observation",
+                    ),
+                ),
+                ("name", models.CharField(db_comment="Name of the interest area", max_length=255)),
+                (
+                    "shared_with_provider",
+                    models.BooleanField(db_comment="Visibility to linked providers", default=False),
+                ),
+                (
+                    "person",
+                    models.ForeignKey(
+                        blank=True,
+                        db_comment="Owner of the area (empty for the seeded templates)",
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="interest_areas",
+                        to="app_saude.person",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "interest_area",
+                "db_table_comment": "Interest areas followed by a person.",
+            },
+        ),
+        migrations.CreateModel(
+            name="InterestAreaMark",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_comment="Creation timestamp")),
+                ("updated_at", models.DateTimeField(auto_now=True, db_comment="Update timestamp")),
+                (
+                    "interest_area",
+                    models.ForeignKey(
+                        db_comment="Interest area marked as attention point",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="marks",
+                        to="app_saude.interestarea",
+                    ),
+                ),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        db_comment="Provider who marked the area",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="interest_area_marks",
+                        to="app_saude.provider",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "interest_area_mark",
+                "db_table_comment": "Providers that marked an interest area as attention point.",
+            },
+        ),
+        migrations.CreateModel(
+            name="InterestAreaTrigger",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True, db_comment="Creation timestamp")),
+                ("updated_at", models.DateTimeField(auto_now=True, db_comment="Update timestamp")),
+                (
+                    "interest_area_trigger_id",
+                    models.AutoField(
+                        db_comment="Primary key of Interest Area Trigger", primary_key=True, serialize=False
+                    ),
+                ),
+                ("name", models.TextField(db_comment="Question shown to the person")),
+                (
+                    "type",
+                    models.CharField(
+                        db_comment="Answer type: boolean, text, int or scale", default="boolean", max_length=10
+                    ),
+                ),
+                ("response", models.TextField(blank=True, db_comment="Latest answer given by the person", null=True)),
+                (
+                    "position",
+                    models.PositiveSmallIntegerField(db_comment="Order of the trigger within its area", default=0),
+                ),
+                (
+                    "interest_area",
+                    models.ForeignKey(
+                        db_comment="Interest area asking this question",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="triggers",
+                        to="app_saude.interestarea",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "interest_area_trigger",
+                "db_table_comment": "Questions (triggers) attached to an interest area.",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="interestarea",
+            constraint=models.UniqueConstraint(fields=("person", "name"), name="uq_interest_area_person_name"),
+        ),
+        migrations.AddConstraint(
+            model_name="interestareamark",
+            constraint=models.UniqueConstraint(fields=("interest_area", "provider"), name="uq_interest_area_mark"),
+        ),
+    ]
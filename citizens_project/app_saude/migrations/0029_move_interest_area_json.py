@@ -0,0 +1,124 @@
+# Generated by Django 5.2 on 2026-10-17 19:30
+
+import json
+
+from django.db import migrations
+
+
+def _load(value):
+    try:
+        data = json.loads(value) if value else {}
+    except (TypeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _provider_names(apps):
+    Provider = apps.get_model("app_saude", "Provider")
+    names = {}
+    for provider in Provider.objects.select_related("user").order_by("provider_id"):
+        full_name = f"{provider.user.first_name} {provider.user.last_name}".strip()
+        names.setdefault(provider.social_name or full_name, provider.provider_id)
+    return names
+
+
+def json_to_tables(apps, schema_editor):
+    Concept = apps.get_model("app_saude", "Concept")
+    Observation = apps.get_model("app_saude", "Observation")
+    InterestArea = apps.get_model("app_saude", "InterestArea")
+    InterestAreaTrigger = apps.get_model("app_saude", "InterestAreaTrigger")
+    InterestAreaMark = apps.get_model("app_saude", "InterestAreaMark")
+
+    concept_ids = list(Concept.objects.filter(concept_code="INTEREST_AREA").values_list("concept_id", flat=True))
+    if not concept_ids:
+        return
+
+    provider_names = _provider_names(apps)
+    used_names = set()
+    areas, triggers, marks, renamed = [], [], [], []
+    observations = Observation.objects.filter(observation_concept_id__in=concept_ids).order_by("observation_id")
+
+    for observation in observations.iterator():
+        data = _load(observation.value_as_string)
+        name = str(data.get("name") or "").strip()[:255] or f"Área {observation.observation_id}"
+        if observation.person_id is not None and (observation.person_id, name) in used_names:
+            # (person, name) is unique now; older duplicates keep their id as a suffix.
+            suffix = f" ({observation.observation_id})"
+            name = name[: 255 - len(suffix)] + suffix
+        used_names.add((observation.person_id, name))
+
+        area = InterestArea(
+            observation_id=observation.observation_id,
+            person_id=observation.person_id,
+            name=name,
+            shared_with_provider=bool(data.get("shared_with_provider", False)),
+        )
+        areas.append(area)
+
+        for position, trigger in enumerate(data.get("triggers") or []):
+            if not isinstance(trigger, dict):
+                continue
+            response = trigger.get("response")
+            triggers.append(
+                InterestAreaTrigger(
+                    interest_area_id=observation.observation_id,
+                    name=str(trigger.get("name") or ""),
+                    type=trigger.get("type") or "boolean",
+                    response=None if response is None else str(response),
+                    position=position,
+                )
+            )
+
+        # marked_by held display names; names that no longer match a provider are dropped.
+        marked_providers = {provider_names[n] for n in data.get("marked_by") or [] if n in provider_names}
+        for provider_id in sorted(marked_providers):
+            marks.append(InterestAreaMark(interest_area_id=observation.observation_id, provider_id=provider_id))
+
+        if observation.value_as_string != name:
+            observation.value_as_string = name
+            renamed.append(observation)
+
+    InterestArea.objects.bulk_create(areas, batch_size=1000)
+    InterestAreaTrigger.objects.bulk_create(triggers, batch_size=1000)
+    InterestAreaMark.objects.bulk_create(marks, batch_size=1000)
+    Observation.objects.bulk_update(renamed, ["value_as_string"], batch_size=1000)
+
+
+def tables_to_json(apps, schema_editor):
+    InterestArea = apps.get_model("app_saude", "InterestArea")
+    Observation = apps.get_model("app_saude", "Observation")
+
+    areas = InterestArea.objects.prefetch_related("triggers", "marks__provider__user")
+    for area in areas.iterator(chunk_size=500):
+        marked_by = []
+        for mark in sorted(area.marks.all(), key=lambda m: m.pk):
+            provider = mark.provider
+            marked_by.append(provider.social_name or f"{provider.user.first_name} {provider.user.last_name}".strip())
+        data = {
+            "name": area.name,
+            "marked_by": marked_by,
+            "shared_with_provider": area.shared_with_provider,
+            "triggers": [
+                {"name": t.name, "type": t.type, "response": t.response}
+                for t in sorted(area.triggers.all(), key=lambda t: t.position)
+            ],
+        }
+        Observation.objects.filter(observation_id=area.observation_id).update(
+            value_as_string=json.dumps(data, ensure_ascii=False)
+        )
+
+    # The tables outlive this migration (0028 creates them); empty them so json_to_tables can run again.
+    apps.get_model("app_saude", "InterestAreaMark").objects.all().delete()
+    apps.get_model("app_saude", "InterestAreaTrigger").objects.all().delete()
+    InterestArea.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_saude", "0028_interest_area_tables"),
+    ]
+
+    operations = [
+        migrations.RunPython(json_to_tables, tables_to_json),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-17 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_saude", "0029_move_interest_area_json"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PersonProviderLink",
+            fields=[],
+            options={
+                "proxy": True,
+                "indexes": [],
+                "constraints": [],
+            },
+            bases=("app_saude.factrelationship",),
+        ),
+        migrations.AddIndex(
+            model_name="factrelationship",
+            index=models.Index(
+                fields=["fact_id_1", "relationship_concept", "domain_concept_1", "domain_concept_2"],
+                include=("fact_id_2",),
+                name="idx_factrel_fact_1_lookup",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="factrelationship",
+            index=models.Index(
+                fields=["fact_id_2", "relationship_concept", "domain_concept_1", "domain_concept_2"],
+                include=("fact_id_1",),
+                name="idx_factrel_fact_2_lookup",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-17 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_saude", "0030_fact_relationship_link_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                fields=["person", "observation_concept", "-observation_date", "-observation_id"],
+                name="idx_obs_person_concept_date",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                fields=["provider", "observation_concept", "-observation_date", "-observation_id"],
+                name="idx_obs_provider_concept_date",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="visitoccurrence",
+            index=models.Index(
+                fields=["person", "-visit_start_date", "-visit_occurrence_id"], name="idx_visit_person_start"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="visitoccurrence",
+            index=models.Index(
+                fields=["provider", "-visit_start_date", "-visit_occurrence_id"], name="idx_visit_provider_start"
+            ),
+        ),
+    ]
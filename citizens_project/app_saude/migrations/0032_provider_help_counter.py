@@ -0,0 +1,97 @@
+# Generated by Django 5.2 on 2026-10-17 20:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_helps(apps, schema_editor):
+    Concept = apps.get_model("app_saude", "Concept")
+    FactRelationship = apps.get_model("app_saude", "FactRelationship")
+    Observation = apps.get_model("app_saude", "Observation")
+    ProviderHelpCounter = apps.get_model("app_saude", "ProviderHelpCounter")
+
+    concepts = dict(
+        Concept.objects.filter(
+            concept_code__in=["HELP", "ACTIVE", "RESOLVED", "PERSON", "PROVIDER", "PERSON_PROVIDER"]
+        ).values_list("concept_code", "concept_id")
+    )
+    if len(concepts) < 6:
+        return
+
+    linked_pairs = set(
+        FactRelationship.objects.filter(
+            domain_concept_1_id=concepts["PERSON"],
+            domain_concept_2_id=concepts["PROVIDER"],
+            relationship_concept_id=concepts["PERSON_PROVIDER"],
+        ).values_list("fact_id_2", "fact_id_1")
+    )
+    helps = (
+        Observation.objects.filter(observation_concept_id=concepts["HELP"], provider__isnull=False)
+        .values("provider_id", "person_id")
+        .annotate(
+            active=Count("pk", filter=Q(value_as_concept_id=concepts["ACTIVE"])),
+            resolved=Count("pk", filter=Q(value_as_concept_id=concepts["RESOLVED"])),
+        )
+        .order_by()
+    )
+    ProviderHelpCounter.objects.bulk_create(
+        (
+            ProviderHelpCounter(
+                provider_id=row["provider_id"],
+                person_id=row["person_id"],
+                active_count=row["active"],
+                resolved_count=row["resolved"],
+            )
+            for row in helps
+            if (row["provider_id"], row["person_id"]) in linked_pairs
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_saude", "0031_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProviderHelpCounter",
+            fields=[
+                (
+                    "pk",
+                    models.CompositePrimaryKey(
+                        "provider_id", "person_id", blank=True, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                ("active_count", models.PositiveIntegerField(db_comment="Help requests still ACTIVE", default=0)),
+                ("resolved_count", models.PositiveIntegerField(db_comment="Help requests RESOLVED", default=0)),
+                (
+                    "person",
+                    models.ForeignKey(
+                        db_comment="Person who sent the help requests",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="help_counters",
+                        to="app_saude.person",
+                    ),
+                ),
+                (
+                    "provider",
+                    models.ForeignKey(
+                        db_comment="Provider the help requests were sent to",
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="help_counters",
+                        to="app_saude.provider",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "provider_help_counter",
+                "db_table_comment": "Help request counts per provider and person, maintained with the observations.",
+            },
+        ),
+        migrations.RunPython(count_helps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2 on 2026-10-17 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_saude", "0032_provider_help_counter"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="observation",
+            name="idx_obs_person_concept_date",
+        ),
+        migrations.RemoveIndex(
+            model_name="observation",
+            name="idx_obs_provider_concept_date",
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                condition=models.Q(("observation_concept_id", 2000006000)),
+                fields=["person", "-observation_date", "-observation_id"],
+                name="idx_obs_diary_person_date",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                condition=models.Q(("observation_concept_id", 2000007000)),
+                fields=["provider", "-observation_date", "-observation_id"],
+                name="idx_obs_help_provider_date",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                condition=models.Q(("observation_concept_id", 2000007000), ("value_as_concept_id", 2000007001)),
+                fields=["provider", "person", "observation_date"],
+                name="idx_obs_help_active",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                condition=models.Q(("observation_concept_id", 2000007000), ("observation_source_value__isnull", False)),
+                fields=["person", "observation_source_value"],
+                name="idx_obs_help_idempotency",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                condition=models.Q(("observation_concept_id", 2000004000)),
+                fields=["value_as_string", "-observation_date"],
+                name="idx_obs_link_code",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                condition=models.Q(("observation_concept_id", 2000004000)),
+                fields=["provider"],
+                name="idx_obs_link_code_provider",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="observation",
+            index=models.Index(
+                condition=models.Q(("observation_concept_id", 2000008000)),
+                fields=["person", "-observation_date"],
+                name="idx_obs_interest_area_person",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app_saude", "0033_observation_partial_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheGeneration",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        db_comment="Cache the generation belongs to", max_length=50, primary_key=True, serialize=False
+                    ),
+                ),
+                ("generation", models.PositiveBigIntegerField(db_comment="Bumped on every invalidation", default=0)),
+            ],
+            options={
+                "db_table": "cache_generation",
+                "db_table_comment": "Invalidation counters of the caches kept in each process.",
+            },
+        ),
+    ]
@@ -1,6 +1,10 @@
+from collections import Counter
+
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import connection, models, transaction
+from django.utils.functional import cached_property
 
 
 class TimestampedModel(models.Model):
@@ -104,6 +108,42 @@ class Concept(TimestampedModel):
         db_table_comment = "OMOP-compliant table for standardized concepts."
 
 
+class CacheGenerationManager(models.Manager):
+    def current(self, name: str) -> int:
+        """Generation of the cache ``name``; 0 until it is first bumped."""
+        return self.filter(name=name).values_list("generation", flat=True).first() or 0
+
+    def bump(self, name: str):
+        """Start a new generation of the cache ``name``, visible to other processes once the transaction commits."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.model._meta.db_table} (name, generation) VALUES (%s, 1)
+                ON CONFLICT (name) DO UPDATE SET generation = {self.model._meta.db_table}.generation + 1
+                """,
+                [name],
+            )
+
+
+class CacheGeneration(models.Model):
+    """
+    A counter per process-local cache (concept registry, vocabulary bundle,
+    linked id sets), bumped whenever the rows behind it change. Each process
+    compares it with the generation it loaded, so an invalidation done by one
+    worker (or by a management command) reaches every other one, whatever the
+    cache backend.
+    """
+
+    name = models.CharField(primary_key=True, max_length=50, db_comment="Cache the generation belongs to")
+    generation = models.PositiveBigIntegerField(default=0, db_comment="Bumped on every invalidation")
+
+    objects = CacheGenerationManager()
+
+    class Meta:
+        db_table = "cache_generation"
+        db_table_comment = "Invalidation counters of the caches kept in each process."
+
+
 class ConceptRelationship(TimestampedModel):
     concept_1 = models.ForeignKey(Concept, on_delete=models.CASCADE, related_name="source_concept_rels")
     concept_2 = models.ForeignKey(Concept, on_delete=models.CASCADE, related_name="target_concept_rels")
@@ -333,6 +373,15 @@ class DrugExposure(TimestampedModel):
         db_table_comment = "Records of drug prescriptions or administration."
 
 
+# Concept ids given by seed_concepts, for the partial index conditions on
+# observation (an index predicate cannot look the concept up by code).
+PROVIDER_LINK_CODE_CONCEPT_ID = 2000004000
+DIARY_ENTRY_CONCEPT_ID = 2000006000
+HELP_CONCEPT_ID = 2000007000
+ACTIVE_CONCEPT_ID = 2000007001
+INTEREST_AREA_CONCEPT_ID = 2000008000
+
+
 class Observation(TimestampedModel):
     observation_id = models.AutoField(primary_key=True, db_comment="Primary key of Observation")
     person: Person = models.ForeignKey(
@@ -385,6 +434,52 @@ class Observation(TimestampedModel):
     class Meta:
         db_table = "observation"
         db_table_comment = "Captured patient-reported observations."
+        # One partial index per kind of observation and access pattern, so each
+        # only holds the rows it serves. The queries they back are listed in
+        # app_saude.utils.hot_queries (see the explain_hot_queries command).
+        indexes = [
+            # Diaries of a person, in keyset pagination order (see app_saude.pagination).
+            models.Index(
+                fields=["person", "-observation_date", "-observation_id"],
+                condition=models.Q(observation_concept_id=DIARY_ENTRY_CONCEPT_ID),
+                name="idx_obs_diary_person_date",
+            ),
+            # Helps received by a provider, in keyset pagination order.
+            models.Index(
+                fields=["provider", "-observation_date", "-observation_id"],
+                condition=models.Q(observation_concept_id=HELP_CONCEPT_ID),
+                name="idx_obs_help_provider_date",
+            ),
+            # Latest active help per linked person (provider persons list).
+            models.Index(
+                fields=["provider", "person", "observation_date"],
+                condition=models.Q(observation_concept_id=HELP_CONCEPT_ID, value_as_concept_id=ACTIVE_CONCEPT_ID),
+                name="idx_obs_help_active",
+            ),
+            # Retries of a help request (Idempotency-Key of SendHelpView).
+            models.Index(
+                fields=["person", "observation_source_value"],
+                condition=models.Q(observation_concept_id=HELP_CONCEPT_ID, observation_source_value__isnull=False),
+                name="idx_obs_help_idempotency",
+            ),
+            # Link code lookup by code, and the provider's current code.
+            models.Index(
+                fields=["value_as_string", "-observation_date"],
+                condition=models.Q(observation_concept_id=PROVIDER_LINK_CODE_CONCEPT_ID),
+                name="idx_obs_link_code",
+            ),
+            models.Index(
+                fields=["provider"],
+                condition=models.Q(observation_concept_id=PROVIDER_LINK_CODE_CONCEPT_ID),
+                name="idx_obs_link_code_provider",
+            ),
+            # Interest areas of a person.
+            models.Index(
+                fields=["person", "-observation_date"],
+                condition=models.Q(observation_concept_id=INTEREST_AREA_CONCEPT_ID),
+                name="idx_obs_interest_area_person",
+            ),
+        ]
 
 
 class VisitOccurrence(TimestampedModel):
@@ -439,6 +534,12 @@ class VisitOccurrence(TimestampedModel):
     class Meta:
         db_table = "visit_occurrence"
         db_table_comment = "Interactions between patients and healthcare providers."
+        indexes = [
+            models.Index(fields=["person", "-visit_start_date", "-visit_occurrence_id"], name="idx_visit_person_start"),
+            models.Index(
+                fields=["provider", "-visit_start_date", "-visit_occurrence_id"], name="idx_visit_provider_start"
+            ),
+        ]
 
 
 class Measurement(TimestampedModel):
@@ -499,3 +600,435 @@ class FactRelationship(TimestampedModel):
         db_table = "fact_relationship"
         db_table_comment = "Relates different entities (facts) within OMOP."
         unique_together = ("fact_id_1", "fact_id_2", "relationship_concept_id")
+        indexes = [
+            # Covering indexes for both lookup directions, so link checks stay index-only scans.
+            models.Index(
+                fields=["fact_id_1", "relationship_concept", "domain_concept_1", "domain_concept_2"],
+                include=["fact_id_2"],
+                name="idx_factrel_fact_1_lookup",
+            ),
+            models.Index(
+                fields=["fact_id_2", "relationship_concept", "domain_concept_1", "domain_concept_2"],
+                include=["fact_id_1"],
+                name="idx_factrel_fact_2_lookup",
+            ),
+        ]
+
+
+class PersonProviderLinkManager(models.Manager):
+    """
+    Access to the Person -> Provider links stored in fact_relationship
+    (PERSON/PROVIDER domains, PERSON_PROVIDER relationship).
+    """
+
+    def _link_concepts(self) -> dict:
+        # Imported here: utils.concept depends on this module.
+        from .utils.concept import get_concept_by_code
+
+        return {
+            "domain_concept_1_id": get_concept_by_code("PERSON").concept_id,
+            "domain_concept_2_id": get_concept_by_code("PROVIDER").concept_id,
+            "relationship_concept_id": get_concept_by_code("PERSON_PROVIDER").concept_id,
+        }
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**self._link_concepts())
+
+    @cached_property
+    def generation(self):
+        # Imported here: utils.generations depends on this module.
+        from .utils.generations import GenerationWatch
+
+        return GenerationWatch("person_provider_link")
+
+    def cache_key(self, side: str, object_id: int) -> str:
+        return f"person_provider_link:{self.generation.current()}:{side}:{object_id}"
+
+    def _cached_ids(self, key: str, queryset: models.QuerySet) -> set[int]:
+        ids = cache.get(key)
+        if ids is None:
+            ids = set(queryset)
+            cache.set(key, ids, settings.LINKAGE_CACHE_TIMEOUT)
+        return ids
+
+    def providers_for(self, person_id: int) -> set[int]:
+        """
+        Ids of the providers linked to a person, cached per link generation.
+
+        Another worker's link or unlink shows up here within
+        CACHE_GENERATION_CHECK_SECONDS; authorizing one pair goes through
+        is_linked() or linked_among() instead.
+        """
+        return self._cached_ids(
+            self.cache_key("person", person_id),
+            self.filter(fact_id_1=person_id).values_list("fact_id_2", flat=True),
+        )
+
+    def persons_for(self, provider_id: int) -> set[int]:
+        """Ids of the persons linked to a provider, cached like providers_for()."""
+        return self._cached_ids(
+            self.cache_key("provider", provider_id),
+            self.filter(fact_id_2=provider_id).values_list("fact_id_1", flat=True),
+        )
+
+    def invalidate(self):
+        """Drop the cached id sets in every process (see GenerationWatch.bump)."""
+        self.generation.bump()
+
+    def linked_among(self, person_id: int, provider_ids) -> set[int]:
+        """Which of provider_ids are linked to the person, read from the database."""
+        return set(self.filter(fact_id_1=person_id, fact_id_2__in=provider_ids).values_list("fact_id_2", flat=True))
+
+    def between(self, person_id: int, provider_id: int) -> models.QuerySet:
+        return self.filter(fact_id_1=person_id, fact_id_2=provider_id)
+
+    def is_linked(self, person_id: int, provider_id: int) -> bool:
+        return self.between(person_id, provider_id).exists()
+
+    def link(self, person_id: int, provider_id: int) -> tuple["PersonProviderLink", bool]:
+        return self.get_or_create(fact_id_1=person_id, fact_id_2=provider_id, **self._link_concepts())
+
+    def unlink(self, person_id: int, provider_id: int) -> int:
+        deleted, _ = self.between(person_id, provider_id).delete()
+        return deleted
+
+
+class PersonProviderLink(FactRelationship):
+    """
+    Typed view over FactRelationship for Person <-> Provider links.
+
+    fact_id_1 holds the person_id and fact_id_2 the provider_id.
+    """
+
+    objects = PersonProviderLinkManager()
+
+    class Meta:
+        proxy = True
+
+    @property
+    def person_id(self) -> int:
+        return self.fact_id_1
+
+    @property
+    def provider_id(self) -> int:
+        return self.fact_id_2
+
+
+class ProviderHelpCounterManager(models.Manager):
+    """
+    Maintenance of the help request counters.
+
+    Every write is an upsert (or delete) of the counter rows, meant to run in
+    the transaction of the observation or link change it reflects, after that
+    change. reconcile() recomputes the counters from observation and
+    fact_relationship and repairs the rows that drifted.
+    """
+
+    def _help_concepts(self) -> dict:
+        # Imported here: utils.concept depends on this module.
+        from .utils.concept import get_concept_by_code
+
+        return {
+            "help": get_concept_by_code("HELP").concept_id,
+            "active": get_concept_by_code("ACTIVE").concept_id,
+            "resolved": get_concept_by_code("RESOLVED").concept_id,
+        }
+
+    def record_sent(self, observations):
+        """
+        Count the new ACTIVE help ``observations`` (one person, any providers).
+
+        Pairs unlinked since the request checked the links get no row, as the
+        counts are read without looking at the links.
+        """
+        sent = Counter((observation.provider_id, observation.person_id) for observation in observations)
+        if not sent:
+            return
+        pairs = sorted(sent)
+        link = PersonProviderLink.objects._link_concepts()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.model._meta.db_table} AS counter (provider_id, person_id, active_count, resolved_count)
+                SELECT sent.provider_id, sent.person_id, sent.helps, 0
+                FROM unnest(%s::integer[], %s::integer[], %s::integer[]) AS sent(provider_id, person_id, helps)
+                WHERE EXISTS (
+                    SELECT 1 FROM {FactRelationship._meta.db_table} link
+                    WHERE link.fact_id_1 = sent.person_id AND link.fact_id_2 = sent.provider_id
+                      AND link.domain_concept_1_id = %s AND link.domain_concept_2_id = %s
+                      AND link.relationship_concept_id = %s
+                )
+                ON CONFLICT (provider_id, person_id)
+                DO UPDATE SET active_count = counter.active_count + EXCLUDED.active_count
+                """,
+                [
+                    [pair[0] for pair in pairs],
+                    [pair[1] for pair in pairs],
+                    [sent[pair] for pair in pairs],
+                    link["domain_concept_1_id"],
+                    link["domain_concept_2_id"],
+                    link["relationship_concept_id"],
+                ],
+            )
+
+    def record_resolved(self, observation, was_active=True):
+        """
+        Move the help ``observation`` from the active to the resolved count.
+
+        As in record_sent(), nothing is counted for a pair unlinked since the
+        request checked the link.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.model._meta.db_table} AS counter (provider_id, person_id, active_count, resolved_count)
+                SELECT %(provider_id)s, %(person_id)s, 0, 1
+                WHERE EXISTS (
+                    SELECT 1 FROM {FactRelationship._meta.db_table} link
+                    WHERE link.fact_id_1 = %(person_id)s AND link.fact_id_2 = %(provider_id)s
+                      AND link.domain_concept_1_id = %(domain_concept_1_id)s
+                      AND link.domain_concept_2_id = %(domain_concept_2_id)s
+                      AND link.relationship_concept_id = %(relationship_concept_id)s
+                )
+                ON CONFLICT (provider_id, person_id)
+                DO UPDATE SET active_count = GREATEST(counter.active_count - %(was_active)s, 0),
+                              resolved_count = counter.resolved_count + 1
+                """,
+                {
+                    "provider_id": observation.provider_id,
+                    "person_id": observation.person_id,
+                    "was_active": int(was_active),
+                    **PersonProviderLink.objects._link_concepts(),
+                },
+            )
+
+    def rebuild(self, person_id: int, provider_id: int):
+        """Recount the helps of a pair from its observations (when it gets linked)."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.model._meta.db_table} (provider_id, person_id, active_count, resolved_count)
+                SELECT %(provider_id)s, %(person_id)s,
+                       count(*) FILTER (WHERE value_as_concept_id = %(active)s),
+                       count(*) FILTER (WHERE value_as_concept_id = %(resolved)s)
+                FROM {Observation._meta.db_table}
+                WHERE person_id = %(person_id)s AND provider_id = %(provider_id)s
+                  AND observation_concept_id = %(help)s
+                ON CONFLICT (provider_id, person_id)
+                DO UPDATE SET active_count = EXCLUDED.active_count, resolved_count = EXCLUDED.resolved_count
+                """,
+                {"person_id": person_id, "provider_id": provider_id, **self._help_concepts()},
+            )
+
+    def forget(self, person_id: int | None = None, provider_id: int | None = None) -> int:
+        """Drop the counters of a person and/or a provider (when they get unlinked)."""
+        lookups = {}
+        if person_id is not None:
+            lookups["person_id"] = person_id
+        if provider_id is not None:
+            lookups["provider_id"] = provider_id
+        if not lookups:
+            return 0
+        deleted, _ = self.filter(**lookups).delete()
+        return deleted
+
+    def counts_for(self, provider_id: int) -> dict:
+        """
+        Active and resolved helps sent to ``provider_id`` by the persons linked
+        to it: a range read on the primary key.
+        """
+        counts = self.filter(provider_id=provider_id).aggregate(
+            active=models.Sum("active_count", default=0),
+            resolved=models.Sum("resolved_count", default=0),
+        )
+        return {**counts, "total": counts["active"] + counts["resolved"]}
+
+    def drift(self) -> list[dict]:
+        """
+        Counter rows that differ from what observation and fact_relationship
+        say, with their ``stored`` and ``expected`` counts (None when the row
+        is missing or belongs to a pair that is no longer linked).
+        """
+        from .utils.concept import get_concept_by_code
+
+        params = {
+            **self._help_concepts(),
+            "person_domain": get_concept_by_code("PERSON").concept_id,
+            "provider_domain": get_concept_by_code("PROVIDER").concept_id,
+            "person_provider": get_concept_by_code("PERSON_PROVIDER").concept_id,
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH expected AS (
+                    SELECT link.fact_id_2 AS provider_id, link.fact_id_1 AS person_id,
+                           count(help.observation_id) FILTER (WHERE help.value_as_concept_id = %(active)s)
+                               AS active_count,
+                           count(help.observation_id) FILTER (WHERE help.value_as_concept_id = %(resolved)s)
+                               AS resolved_count
+                    FROM {FactRelationship._meta.db_table} link
+                    LEFT JOIN {Observation._meta.db_table} help
+                        ON help.person_id = link.fact_id_1 AND help.provider_id = link.fact_id_2
+                       AND help.observation_concept_id = %(help)s
+                    WHERE link.domain_concept_1_id = %(person_domain)s
+                      AND link.domain_concept_2_id = %(provider_domain)s
+                      AND link.relationship_concept_id = %(person_provider)s
+                    GROUP BY link.fact_id_2, link.fact_id_1
+                )
+                SELECT COALESCE(expected.provider_id, counter.provider_id),
+                       COALESCE(expected.person_id, counter.person_id),
+                       counter.active_count, counter.resolved_count,
+                       expected.active_count, expected.resolved_count
+                FROM expected
+                FULL JOIN {self.model._meta.db_table} counter
+                    ON counter.provider_id = expected.provider_id AND counter.person_id = expected.person_id
+                WHERE expected.provider_id IS NULL
+                   OR (COALESCE(counter.active_count, 0), COALESCE(counter.resolved_count, 0))
+                      <> (expected.active_count, expected.resolved_count)
+                ORDER BY 1, 2
+                """,
+                params,
+            )
+            rows = cursor.fetchall()
+        return [
+            {
+                "provider_id": provider_id,
+                "person_id": person_id,
+                "stored": None if stored_active is None else (stored_active, stored_resolved),
+                "expected": None if expected_active is None else (expected_active, expected_resolved),
+            }
+            for provider_id, person_id, stored_active, stored_resolved, expected_active, expected_resolved in rows
+        ]
+
+    def reconcile(self) -> list[dict]:
+        """
+        Repair the drifted counter rows and return them (see drift()).
+
+        The table is locked against concurrent counter writes meanwhile, so a
+        help sent or resolved during the repair is counted exactly once.
+        """
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {self.model._meta.db_table} IN SHARE ROW EXCLUSIVE MODE")
+            drifted = self.drift()
+            stale = [row for row in drifted if row["expected"] is None]
+            for row in stale:
+                self.filter(provider_id=row["provider_id"], person_id=row["person_id"]).delete()
+            self.bulk_create(
+                [
+                    self.model(
+                        provider_id=row["provider_id"],
+                        person_id=row["person_id"],
+                        active_count=row["expected"][0],
+                        resolved_count=row["expected"][1],
+                    )
+                    for row in drifted
+                    if row["expected"] is not None
+                ],
+                update_conflicts=True,
+                unique_fields=["provider", "person"],
+                update_fields=["active_count", "resolved_count"],
+            )
+        return drifted
+
+
+class ProviderHelpCounter(models.Model):
+    """
+    Active and resolved help requests per provider/person pair, so the help
+    counts are read from one row per linked person instead of counting
+    observations.
+
+    Kept in step by SendHelpView and MarkHelpAsResolvedView, and by the link
+    signals (linking, unlinking and account deletion): rows only exist for
+    linked pairs, which is what lets counts_for() skip the link check.
+    """
+
+    pk = models.CompositePrimaryKey("provider_id", "person_id")
+    provider = models.ForeignKey(
+        Provider,
+        on_delete=models.CASCADE,
+        related_name="help_counters",
+        db_index=False,  # Leading column of the primary key.
+        db_comment="Provider the help requests were sent to",
+    )
+    person = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        related_name="help_counters",
+        db_comment="Person who sent the help requests",
+    )
+    active_count = models.PositiveIntegerField(default=0, db_comment="Help requests still ACTIVE")
+    resolved_count = models.PositiveIntegerField(default=0, db_comment="Help requests RESOLVED")
+
+    objects = ProviderHelpCounterManager()
+
+    class Meta:
+        db_table = "provider_help_counter"
+        db_table_comment = "Help request counts per provider and person, maintained with the observations."
+
+
+class InterestArea(TimestampedModel):
+    observation = models.OneToOneField(
+        Observation,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="interest_area",
+        db_comment="INTEREST_AREA Observation backing this area",
+    )
+    person = models.ForeignKey(
+        Person,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name="interest_areas",
+        db_comment="Owner of the area (empty for the seeded templates)",
+    )
+    name = models.CharField(max_length=255, db_comment="Name of the interest area")
+    shared_with_provider = models.BooleanField(default=False, db_comment="Visibility to linked providers")
+
+    class Meta:
+        db_table = "interest_area"
+        db_table_comment = "Interest areas followed by a person."
+        constraints = [
+            models.UniqueConstraint(fields=["person", "name"], name="uq_interest_area_person_name"),
+        ]
+
+
+class InterestAreaTrigger(TimestampedModel):
+    interest_area_trigger_id = models.AutoField(primary_key=True, db_comment="Primary key of Interest Area Trigger")
+    interest_area = models.ForeignKey(
+        InterestArea,
+        on_delete=models.CASCADE,
+        related_name="triggers",
+        db_comment="Interest area asking this question",
+    )
+    name = models.TextField(db_comment="Question shown to the person")
+    type = models.CharField(max_length=10, default="boolean", db_comment="Answer type: boolean, text, int or scale")
+    response = models.TextField(blank=True, null=True, db_comment="Latest answer given by the person")
+    position = models.PositiveSmallIntegerField(default=0, db_comment="Order of the trigger within its area")
+
+    class Meta:
+        db_table = "interest_area_trigger"
+        db_table_comment = "Questions (triggers) attached to an interest area."
+
+
+class InterestAreaMark(TimestampedModel):
+    interest_area = models.ForeignKey(
+        InterestArea,
+        on_delete=models.CASCADE,
+        related_name="marks",
+        db_comment="Interest area marked as attention point",
+    )
+    provider = models.ForeignKey(
+        Provider,
+        on_delete=models.CASCADE,
+        related_name="interest_area_marks",
+        db_comment="Provider who marked the area",
+    )
+
+    class Meta:
+        db_table = "interest_area_mark"
+        db_table_comment = "Providers that marked an interest area as attention point."
+        constraints = [
+            models.UniqueConstraint(fields=["interest_area", "provider"], name="uq_interest_area_mark"),
+        ]
@@ -0,0 +1,159 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over (ordering_field, primary key), newest first.
+
+    Pagination is opt-in: the full list is returned, as before, unless the
+    request sends ``cursor`` or ``page_size``. Each page is fetched with a
+    range condition on the ordering columns instead of an OFFSET, so with the
+    matching index every page costs the same no matter how deep the client has
+    scrolled. Rows without a date come first, like ``order_by("-field")``.
+
+    Response body: ``{"next": <url or null>, "results": [...]}``.
+    """
+
+    ordering_field = "observation_date"
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def __init__(self):
+        self.request = None
+        self.page = []
+        self.next_position = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        pk_field = queryset.model._meta.pk.name
+
+        queryset = queryset.order_by(f"-{self.ordering_field}", f"-{pk_field}")
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.after(position, pk_field))
+
+        results = list(queryset[: page_size + 1])
+        self.page = results[:page_size]
+        self.next_position = None
+        if len(results) > page_size:
+            last = self.page[-1]
+            self.next_position = (getattr(last, self.ordering_field), last.pk)
+        return self.page
+
+    def after(self, position, pk_field):
+        """Condition selecting the rows that come after ``position`` in the page order."""
+        value, pk = position
+        if value is None:
+            return Q(**{f"{self.ordering_field}__isnull": False}) | Q(
+                **{f"{self.ordering_field}__isnull": True, f"{pk_field}__lt": pk}
+            )
+        # The outer <= bounds the index range scan; the OR breaks ties on the primary key.
+        return Q(**{f"{self.ordering_field}__lte": value}) & (
+            Q(**{f"{self.ordering_field}__lt": value}) | Q(**{f"{pk_field}__lt": pk})
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def encode_cursor(self, position):
+        value, pk = position
+        payload = json.dumps({"d": value.isoformat() if value is not None else None, "i": pk})
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)))
+            value = payload["d"]
+            pk = int(payload["i"])
+            if value is not None:
+                value = parse_datetime(value)
+                if value is None:
+                    raise ValueError(payload["d"])
+        except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, ValueError):
+            raise ValidationError({self.cursor_query_param: "Invalid cursor."})
+        return value, pk
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Opaque cursor taken from the `next` link of the previous page.",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": f"Entries per page (default {self.page_size}, max {self.max_page_size}).",
+                "schema": {"type": "integer"},
+            },
+        ]
+
+
+class VisitKeysetPagination(KeysetPagination):
+    ordering_field = "visit_start_date"
+
+
+# For APIViews, which drf-spectacular does not inspect for a paginator.
+KEYSET_PAGINATION_PARAMETERS = [
+    OpenApiParameter(
+        name=KeysetPagination.cursor_query_param,
+        description="Opaque cursor taken from the `next` link of the previous page. "
+        "When cursor or page_size is given the response is a page: {next, results}.",
+        required=False,
+        type=str,
+    ),
+    OpenApiParameter(
+        name=KeysetPagination.page_size_query_param,
+        description=f"Entries per page (default {KeysetPagination.page_size}, max {KeysetPagination.max_page_size})",
+        required=False,
+        type=int,
+    ),
+]
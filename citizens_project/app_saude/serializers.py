@@ -1,17 +1,16 @@
 import json
 import logging
-import re
 
 from django.contrib.auth import get_user_model
-from django.db import transaction
-from django.db.models import Prefetch
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
 from .models import *
-from .utils.concept import get_concept_by_code
+from .utils.concept import get_concept_by_code, get_related_concepts
+from .utils.interest_area import build_interest_area_index, serialize_interest_area
 
 User = get_user_model()
 
@@ -332,27 +331,21 @@ class ConceptRetrieveSerializer(BaseRetrieveSerializer):
 
     @extend_schema_field(ConceptRelatedSerializer)
     def get_related_concept(self, obj):
+        # List views resolve every relationship up front (see get_related_concepts)
+        related_concepts = self.context.get("related_concepts")
+        if related_concepts is not None:
+            related = related_concepts.get(obj.concept_id)
+            return ConceptRetrieveSerializer(related).data if related else None
+
         relationship_id = self.context.get("relationship_id")
         lang = self.context.get("lang")
 
         if not relationship_id or not lang:
             return None
 
-        rel = (
-            ConceptRelationship.objects.select_related("concept_2")
-            .prefetch_related(
-                Prefetch(
-                    "concept_2__concept_synonym_concept_set",
-                    queryset=ConceptSynonym.objects.filter(language_concept__concept_code=lang),
-                    to_attr="translated_synonyms",
-                )
-            )
-            .filter(relationship_id=relationship_id)
-            .first()
-        )
-
-        if rel:
-            return ConceptRetrieveSerializer(rel.concept_2, context=self.context).data
+        related = get_related_concepts([obj.concept_id], relationship_id, lang).get(obj.concept_id)
+        if related:
+            return ConceptRetrieveSerializer(related).data
 
         return None
 
@@ -637,6 +630,10 @@ class PersonProviderUnlinkResponseSerializer(serializers.Serializer):
 
 
 class HelpCreateSerializer(serializers.ModelSerializer):
+    # A plain id: SendHelpView checks it against the person's linked providers,
+    # which saves a lookup per help request.
+    provider = serializers.IntegerField(source="provider_id")
+
     class Meta:
         model = Observation
         fields = [
@@ -666,6 +663,22 @@ class ProviderPersonSummarySerializer(serializers.Serializer):
     last_help_date = serializers.DateTimeField(allow_null=True)
 
 
+class ProviderPersonsQuerySerializer(serializers.Serializer):
+    ordering = serializers.ChoiceField(
+        choices=["name", "-name", "last_visit_date", "-last_visit_date", "last_help_date", "-last_help_date"],
+        required=False,
+        help_text="Sort field; prefix with '-' for descending order (default: name)",
+    )
+    last_visit_date_after = serializers.DateTimeField(required=False, help_text="Only persons last visited on/after")
+    last_visit_date_before = serializers.DateTimeField(required=False, help_text="Only persons last visited on/before")
+    last_help_date_after = serializers.DateTimeField(
+        required=False, help_text="Only persons whose last help is on/after"
+    )
+    last_help_date_before = serializers.DateTimeField(
+        required=False, help_text="Only persons whose last help is on/before"
+    )
+
+
 class HelpCountSerializer(serializers.Serializer):
     help_count = serializers.IntegerField()
 
@@ -686,12 +699,27 @@ class InterestAreaTriggerSerializer(serializers.Serializer):
 
 
 class InterestAreaSerializer(serializers.Serializer):
-    name = serializers.CharField(required=True)
+    name = serializers.CharField(required=True, max_length=255)
     marked_by = serializers.ListField(child=serializers.CharField(), required=False, default=[])
     shared_with_provider = serializers.BooleanField(required=False, default=False)
     triggers = InterestAreaTriggerSerializer(many=True, required=False, allow_empty=True)
 
 
+def _save_interest_area_triggers(interest_area, triggers):
+    InterestAreaTrigger.objects.bulk_create(
+        [
+            InterestAreaTrigger(
+                interest_area=interest_area,
+                name=trigger["name"],
+                type=trigger.get("type", "boolean"),
+                response=trigger.get("response"),
+                position=position,
+            )
+            for position, trigger in enumerate(triggers)
+        ]
+    )
+
+
 class InterestAreaCreateSerializer(serializers.Serializer):
     interest_area = InterestAreaSerializer()
 
@@ -701,25 +729,32 @@ class InterestAreaCreateSerializer(serializers.Serializer):
             person = get_object_or_404(Person, user=user)
 
             # Check if the interest area already exists for the person
-            interest_name = validated_data["interest_area"].get("name")
-            existing = Observation.objects.filter(
-                person=person,
-                observation_concept=get_concept_by_code("INTEREST_AREA"),
-                value_as_string__icontains=f'"name": "{interest_name}"',
-            ).exists()
-            if existing:
+            interest_data = validated_data["interest_area"]
+            interest_name = interest_data.get("name")
+            if InterestArea.objects.filter(person=person, name=interest_name).exists():
                 raise serializers.ValidationError({"interest_area": "An interest area with this name already exists."})
 
-            interest_area_observation = Observation.objects.create(
-                person=person,
-                observation_concept=get_concept_by_code("INTEREST_AREA"),
-                value_as_string=json.dumps(validated_data["interest_area"], ensure_ascii=False),
-                observation_date=timezone.now(),
-            )
+            # marked_by is owned by providers (MarkAttentionPointView) and is not taken from the person here.
+            with transaction.atomic():
+                interest_area_observation = Observation.objects.create(
+                    person=person,
+                    observation_concept=get_concept_by_code("INTEREST_AREA"),
+                    value_as_string=interest_name,
+                    observation_date=timezone.now(),
+                )
+                interest_area = InterestArea.objects.create(
+                    observation=interest_area_observation,
+                    person=person,
+                    name=interest_name,
+                    shared_with_provider=interest_data.get("shared_with_provider", False),
+                )
+                _save_interest_area_triggers(interest_area, interest_data.get("triggers", []))
             return interest_area_observation
 
         except serializers.ValidationError:
             raise
+        except IntegrityError:
+            raise serializers.ValidationError({"interest_area": "An interest area with this name already exists."})
         except Exception:
             raise serializers.ValidationError({"error": "An unexpected error occurred while processing your request."})
 
@@ -727,12 +762,10 @@ class InterestAreaCreateSerializer(serializers.Serializer):
 class InterestAreaRetrieveSerializer(serializers.Serializer):
     def to_representation(self, validated_data):
         try:
-            interest_area_data = json.loads(validated_data.value_as_string)
-
             return {
                 "observation_id": validated_data.observation_id,
                 "person_id": validated_data.person_id,
-                "interest_area": interest_area_data,
+                "interest_area": serialize_interest_area(validated_data.interest_area),
             }
 
         except Exception as e:
@@ -745,11 +778,31 @@ class InterestAreaUpdateSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         try:
             updated_interest_area = validated_data.get("interest_area", {})
-            instance.value_as_string = json.dumps(updated_interest_area, ensure_ascii=False)
-            instance.observation_date = timezone.now()
-            instance.save()
+            interest_name = updated_interest_area["name"]
+            interest_area = instance.interest_area
+
+            if (
+                InterestArea.objects.filter(person_id=instance.person_id, name=interest_name)
+                .exclude(observation=instance)
+                .exists()
+            ):
+                raise serializers.ValidationError({"interest_area": "An interest area with this name already exists."})
+
+            with transaction.atomic():
+                interest_area.name = interest_name
+                interest_area.shared_with_provider = updated_interest_area.get("shared_with_provider", False)
+                interest_area.save(update_fields=["name", "shared_with_provider", "updated_at"])
+
+                interest_area.triggers.all().delete()
+                _save_interest_area_triggers(interest_area, updated_interest_area.get("triggers", []))
+
+                instance.value_as_string = interest_name
+                instance.observation_date = timezone.now()
+                instance.save()
 
             return instance
+        except serializers.ValidationError:
+            raise
         except Exception as e:
             raise serializers.ValidationError(f"Error updating interest area: {str(e)}")
 
@@ -821,36 +874,40 @@ class DiaryRetrieveSerializer(serializers.Serializer):
         except Exception:
             return {}
 
+    def to_representation(self, diary):
+        # Parse the payload once per diary; every method field below reads from it.
+        self._diary_data = self._load_json(diary)
+        return super().to_representation(diary)
+
+    def _get_interest_area_index(self, person_id):
+        # One query per person for the whole render, shared by every diary through the context.
+        indexes = self.context.setdefault("interest_area_index", {})
+        if person_id not in indexes:
+            indexes[person_id] = build_interest_area_index(person_id)
+        return indexes[person_id]
+
     def get_text(self, diary):
-        data = self._load_json(diary)
-        return data.get("text", "")
+        return self._diary_data.get("text", "")
 
     def get_text_shared(self, diary):
-        data = self._load_json(diary)
-        return data.get("text_shared", False)
+        return self._diary_data.get("text_shared", False)
 
     def get_date_range_type(self, diary):
-        data = self._load_json(diary)
-        return data.get("date_range_type", "today")
+        return self._diary_data.get("date_range_type", "today")
 
     def get_interest_areas(self, diary):
-        data = self._load_json(diary)
-        interest_areas = data.get("interest_areas", [])
-        person_id = self.context.get("person_id")
-
-        for i, area in enumerate(interest_areas):
-            interest_area = Observation.objects.filter(
-                person_id=person_id,
-                observation_concept=get_concept_by_code("INTEREST_AREA"),
-                value_as_string__regex=rf'"name":\s*"{re.escape(area["name"])}"',
-            ).first()
+        interest_areas = self._diary_data.get("interest_areas", [])
+        person_id = self.context.get("person_id", diary.person_id)
+        index = self._get_interest_area_index(person_id)
+
+        for area in interest_areas:
+            interest_area = index.get(area.get("name"))
             if interest_area:
-                interest_area_data = json.loads(interest_area.value_as_string)
-                interest_areas[i]["observation_id"] = interest_area.observation_id
-                interest_areas[i]["marked_by"] = interest_area_data.get("marked_by", [])
+                area["observation_id"] = interest_area["observation_id"]
+                area["marked_by"] = interest_area["marked_by"]
             else:
-                interest_areas[i]["observation_id"] = None
-                interest_areas[i]["marked_by"] = []
+                area["observation_id"] = None
+                area["marked_by"] = []
         return interest_areas
 
 
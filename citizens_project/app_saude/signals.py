@@ -0,0 +1,99 @@
+from django.core.management.base import CommandError
+from django.db.models.signals import post_delete, post_save, pre_migrate, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    Concept,
+    ConceptRelationship,
+    ConceptSynonym,
+    FactRelationship,
+    PersonProviderLink,
+    ProviderHelpCounter,
+)
+from .utils.concept import concept_registry, get_concept_by_code
+from .utils.partitioning import observation_partitioning
+from .utils.vocabulary import invalidate_vocabulary_bundle
+
+
+@receiver(post_save, sender=Concept)
+@receiver(post_delete, sender=Concept)
+def invalidate_concept_registry(sender, **kwargs):
+    concept_registry.invalidate()
+
+
+@receiver(post_save, sender=Concept)
+@receiver(post_delete, sender=Concept)
+@receiver(post_save, sender=ConceptSynonym)
+@receiver(post_delete, sender=ConceptSynonym)
+@receiver(post_save, sender=ConceptRelationship)
+@receiver(post_delete, sender=ConceptRelationship)
+def invalidate_vocabulary(sender, **kwargs):
+    # The bundle is rebuilt on the next request (or at the end of seed_all).
+    invalidate_vocabulary_bundle()
+
+
+@receiver(pre_migrate)
+def refuse_migrating_partitioned_observation(sender, using, plan=None, **kwargs):
+    # Partitioned, observation has no primary key and interest_area no foreign key to it,
+    # which any later migration touching them would trip over halfway through.
+    if sender.label != "app_saude" or not any(migration.app_label == sender.label for migration, _ in plan or ()):
+        return
+    scheme = observation_partitioning(using)
+    if scheme:
+        raise CommandError(
+            f"A tabela observation está particionada por {scheme}. Rode partition_observation --undo, "
+            f"depois migrate, e particione de novo com partition_observation --by {scheme}."
+        )
+
+
+@receiver(pre_save, sender=FactRelationship)
+@receiver(pre_save, sender=PersonProviderLink)
+def remember_linked_ids(sender, instance, **kwargs):
+    # An update (e.g. through FactRelationshipViewSet) can move the row to other
+    # ids, whose cached sets and help counters must follow.
+    saved = FactRelationship.objects.filter(pk=instance.pk).first() if instance.pk is not None else None
+    instance._saved_fact_ids = (saved.fact_id_1, saved.fact_id_2) if saved else None
+    instance._saved_as_link = saved is not None and is_person_provider_link(saved)
+
+
+@receiver(post_save, sender=FactRelationship)
+@receiver(post_save, sender=PersonProviderLink)
+@receiver(post_delete, sender=FactRelationship)
+@receiver(post_delete, sender=PersonProviderLink)
+def invalidate_linked_ids(sender, instance, **kwargs):
+    # Covers link/unlink as well as the queryset deletes in AccountView.delete,
+    # which send post_delete for every removed row, and updates turning a row
+    # into a link or out of one.
+    if is_person_provider_link(instance) or getattr(instance, "_saved_as_link", False):
+        PersonProviderLink.objects.invalidate()
+
+
+def is_person_provider_link(instance) -> bool:
+    return (
+        instance.relationship_concept_id == get_concept_by_code("PERSON_PROVIDER").concept_id
+        and instance.domain_concept_1_id == get_concept_by_code("PERSON").concept_id
+        and instance.domain_concept_2_id == get_concept_by_code("PROVIDER").concept_id
+    )
+
+
+@receiver(post_save, sender=FactRelationship)
+@receiver(post_save, sender=PersonProviderLink)
+def count_linked_helps(sender, instance, created, **kwargs):
+    # A person linking (again) to a provider brings their earlier helps back into the provider's counts.
+    # An update that turns the row into a link, out of one, or moves it to other ids does both.
+    saved_ids = getattr(instance, "_saved_fact_ids", None)
+    saved_as_link = not created and getattr(instance, "_saved_as_link", False)
+    is_link = is_person_provider_link(instance)
+    moved = saved_ids != (instance.fact_id_1, instance.fact_id_2)
+    if saved_as_link and (moved or not is_link):
+        ProviderHelpCounter.objects.forget(person_id=saved_ids[0], provider_id=saved_ids[1])
+    if is_link and (created or moved or not saved_as_link):
+        ProviderHelpCounter.objects.rebuild(person_id=instance.fact_id_1, provider_id=instance.fact_id_2)
+
+
+@receiver(post_delete, sender=FactRelationship)
+@receiver(post_delete, sender=PersonProviderLink)
+def forget_unlinked_helps(sender, instance, **kwargs):
+    # Runs in the transaction of the unlink (or of AccountView.delete).
+    if is_person_provider_link(instance):
+        ProviderHelpCounter.objects.forget(person_id=instance.fact_id_1, provider_id=instance.fact_id_2)
@@ -0,0 +1,522 @@
+"""
+Query-count regression tests.
+
+Every endpoint of citizens_project/urls.py is requested against the same data
+at two sizes (SMALL and LARGE rows in each related collection). The number of
+queries must not change with the size, and must match query_counts.json, so an
+N+1 fails here instead of in production.
+
+After an intended change in the number of queries, rewrite the baseline with:
+
+    UPDATE_QUERY_COUNTS=1 python manage.py test app_saude.test_query_counts
+
+The same requests are repeated with observation partitioned by concept (see
+the partition_observation command), which the ORM must not notice.
+"""
+
+import io
+import json
+import os
+from collections.abc import Callable
+from datetime import timedelta
+from pathlib import Path
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import *
+from .tests import create_linked_person, create_provider
+from .utils.concept import concept_registry, get_concept_by_code
+
+User = get_user_model()
+
+BASELINE_PATH = Path(__file__).with_name("query_counts.json")
+UPDATE_BASELINE = os.environ.get("UPDATE_QUERY_COUNTS") == "1"
+
+SMALL = 10
+LARGE = 1000
+
+PASSWORD = "query-counts"
+METRICS_TOKEN = "query-counts"
+
+# The seeded concepts have fixed ids that the sequence does not know about.
+FIRST_CONCEPT_ID = 2_100_000_000
+
+# Routes that are not requested, and why. Everything under admin/ and
+# account/ (django.contrib.admin, allauth) is third-party and skipped as well.
+EXCLUDED_ROUTES = {
+    "auth/login/google/": "validates the token against Google",
+    "api/schema/": "API documentation",
+    "": "API documentation",
+    "api/redoc/": "API documentation",
+    "dev-login-as-provider/": "only answers with DEBUG=True",
+    "dev-login-as-person/": "only answers with DEBUG=True",
+    "api/full-person/(?P<pk>[^/.]+)/$": "onboarding only accepts POST on the list route",
+    "api/full-provider/(?P<pk>[^/.]+)/$": "onboarding only accepts POST on the list route",
+    "provider/help/stream/": "streams until the client disconnects (tested in tests.py)",
+}
+EXCLUDED_PREFIXES = ("admin/", "account/")
+
+
+class World:
+    """
+    The data the endpoints are requested against.
+
+    ``person`` and ``provider`` are linked and make most of the requests;
+    grow() adds ``count`` rows to each collection they can see: linked persons
+    (with a help request and a visit each) and providers, diaries, interest
+    areas, measurements, drug exposures, concepts and care sites.
+    """
+
+    def __init__(self):
+        self.provider = create_provider("provider", registration=1)
+        self.person = create_linked_person(self.provider, "person", social_name="Pessoa")
+        # Not linked to the person; generates the link codes.
+        self.other_provider = create_provider("other", registration=2)
+        self.admin = User.objects.create_user(username="admin", password=PASSWORD, is_staff=True, is_superuser=True)
+        # No profile yet, for the onboarding endpoints.
+        self.newcomer = User.objects.create_user(username="newcomer")
+        self.concept_class = ConceptClass.objects.create(concept_class_id="QueryCount", concept_class_name="QC")
+        self.location = Location.objects.create(city="Recife")
+        self.size = 0
+
+    def grow(self, count):
+        start, self.size = self.size, self.size + count
+        now = timezone.now()
+        indexes = range(start, self.size)
+        link_concepts = {
+            "domain_concept_1_id": get_concept_by_code("PERSON").concept_id,
+            "domain_concept_2_id": get_concept_by_code("PROVIDER").concept_id,
+            "relationship_concept_id": get_concept_by_code("PERSON_PROVIDER").concept_id,
+        }
+
+        # Persons linked to the provider, each with a help request and a visit.
+        users = User.objects.bulk_create(User(username=f"person-{i}", first_name=f"P{i}") for i in indexes)
+        persons = Person.objects.bulk_create(
+            Person(user=user, birth_datetime=now - timedelta(days=9000)) for user in users
+        )
+        PersonProviderLink.objects.bulk_create(
+            PersonProviderLink(fact_id_1=person.person_id, fact_id_2=self.provider.provider_id, **link_concepts)
+            for person in persons
+        )
+        Observation.objects.bulk_create(
+            Observation(
+                person=person,
+                provider=self.provider,
+                observation_concept_id=get_concept_by_code("HELP").concept_id,
+                value_as_concept_id=get_concept_by_code("ACTIVE").concept_id,
+                value_as_string="Preciso de ajuda",
+                observation_date=now - timedelta(minutes=i),
+            )
+            for i, person in zip(indexes, persons)
+        )
+        VisitOccurrence.objects.bulk_create(
+            VisitOccurrence(person=person, provider=self.provider, visit_start_date=now + timedelta(days=i + 1))
+            for i, person in zip(indexes, persons)
+        )
+
+        # Providers linked to the person.
+        users = User.objects.bulk_create(User(username=f"provider-{i}", first_name=f"D{i}") for i in indexes)
+        providers = Provider.objects.bulk_create(
+            Provider(user=user, social_name=f"Dra. {i}", professional_registration=1000 + i)
+            for i, user in zip(indexes, users)
+        )
+        PersonProviderLink.objects.bulk_create(
+            PersonProviderLink(fact_id_1=self.person.person_id, fact_id_2=provider.provider_id, **link_concepts)
+            for provider in providers
+        )
+
+        # The person's interest areas (two triggers each, marked by the provider) and diaries.
+        areas = Observation.objects.bulk_create(
+            Observation(
+                person=self.person,
+                observation_concept_id=get_concept_by_code("INTEREST_AREA").concept_id,
+                value_as_string=f"Área {i}",
+                observation_date=now - timedelta(minutes=i),
+            )
+            for i in indexes
+        )
+        areas = InterestArea.objects.bulk_create(
+            InterestArea(
+                observation=observation,
+                person=self.person,
+                name=observation.value_as_string,
+                shared_with_provider=True,
+            )
+            for observation in areas
+        )
+        InterestAreaTrigger.objects.bulk_create(
+            InterestAreaTrigger(interest_area=area, name=f"Pergunta {position}", response="true", position=position)
+            for area in areas
+            for position in range(2)
+        )
+        InterestAreaMark.objects.bulk_create(
+            InterestAreaMark(interest_area=area, provider=self.provider) for area in areas
+        )
+        Observation.objects.bulk_create(
+            Observation(
+                person=self.person,
+                observation_concept_id=get_concept_by_code("diary_entry").concept_id,
+                observation_type_concept_id=get_concept_by_code("diary_entry_type").concept_id,
+                value_as_string=json.dumps(
+                    {
+                        "date_range_type": "today",
+                        "text": f"Diário {area.name}",
+                        "text_shared": True,
+                        "interest_areas": [
+                            {
+                                "name": area.name,
+                                "shared_with_provider": True,
+                                "triggers": [{"name": "Pergunta 0", "type": "boolean", "response": "true"}],
+                            }
+                        ],
+                    }
+                ),
+                observation_date=now - timedelta(minutes=i),
+                shared_with_provider=True,
+            )
+            for i, area in zip(indexes, areas)
+        )
+
+        # The person's clinical records.
+        Measurement.objects.bulk_create(
+            Measurement(person=self.person, measurement_date=now - timedelta(minutes=i)) for i in indexes
+        )
+        DrugExposure.objects.bulk_create(DrugExposure(person=self.person, quantity=i) for i in indexes)
+
+        # Concepts with a Portuguese synonym and a relationship each.
+        portuguese = Concept.objects.get(concept_code="297504001")
+        concepts = Concept.objects.bulk_create(
+            Concept(
+                concept_id=FIRST_CONCEPT_ID + i,
+                concept_name=f"Conceito {i}",
+                concept_code=f"QC{i}",
+                concept_class=self.concept_class,
+            )
+            for i in indexes
+        )
+        ConceptSynonym.objects.bulk_create(
+            ConceptSynonym(concept=concept, concept_synonym_name=f"Sinônimo {i}", language_concept=portuguese)
+            for i, concept in zip(indexes, concepts)
+        )
+        ConceptRelationship.objects.bulk_create(
+            ConceptRelationship(concept_1=concept, concept_2=portuguese, relationship_id="has_value_type")
+            for concept in concepts
+        )
+
+        CareSite.objects.bulk_create(CareSite(care_site_name=f"UBS {i}", location=self.location) for i in indexes)
+
+    # Objects the detail endpoints point at.
+
+    @property
+    def diary(self):
+        return Observation.objects.filter(
+            person=self.person, observation_concept_id=get_concept_by_code("diary_entry").concept_id
+        ).first()
+
+    @property
+    def interest_area(self):
+        return self.person.interest_areas.first()
+
+    @property
+    def help(self):
+        return Observation.objects.filter(
+            provider=self.provider, observation_concept_id=get_concept_by_code("HELP").concept_id
+        ).first()
+
+    def link_code(self):
+        client = APIClient()
+        client.force_authenticate(self.other_provider.user)
+        return client.post(reverse("generate-link-code"), secure=True).data["code"]
+
+
+class Case(NamedTuple):
+    name: str
+    # World attribute holding the user that makes the request ("admin", "person"...), None for anonymous.
+    user: str | None
+    path: Callable[[World], str]
+    method: str = "get"
+    data: Callable[[World], object] = lambda world: None
+    status: int = 200
+    headers: dict = {}
+
+
+CASES = [
+    # Authentication
+    Case(
+        "admin-login",
+        None,
+        lambda w: reverse("admin_login"),
+        "post",
+        lambda w: {"username": "admin", "password": PASSWORD},
+    ),
+    Case(
+        "logout",
+        "person",
+        lambda w: reverse("logout"),
+        "post",
+        lambda w: {"refresh": str(RefreshToken.for_user(w.person.user))},
+        status=205,
+    ),
+    Case(
+        "token-refresh",
+        None,
+        lambda w: reverse("token_refresh"),
+        "post",
+        lambda w: {"refresh": str(RefreshToken.for_user(w.person.user))},
+    ),
+    # Accounts
+    Case("switch-theme", "person", lambda w: reverse("switch-theme"), "post"),
+    Case("account", "person", lambda w: reverse("account")),
+    Case("user-entity", "person", lambda w: reverse("user-entity")),
+    Case("person-list", "person", lambda w: reverse("person-list")),
+    Case("person-detail", "person", lambda w: reverse("person-detail", args=[w.person.pk])),
+    Case("provider-list", "provider", lambda w: reverse("provider-list")),
+    Case("provider-detail", "provider", lambda w: reverse("provider-detail", args=[w.provider.pk])),
+    Case(
+        "full-person",
+        "newcomer",
+        lambda w: reverse("full-person-list"),
+        "post",
+        lambda w: {
+            "person": {"social_name": "Nova", "gender_concept": None, "ethnicity_concept": None, "race_concept": None},
+            "location": {"city": "Recife"},
+            "observations": [],
+            "drug_exposures": [],
+        },
+        status=201,
+    ),
+    Case(
+        "full-provider",
+        "newcomer",
+        lambda w: reverse("full-provider-list"),
+        "post",
+        lambda w: {"provider": {"social_name": "Dra. Nova", "professional_registration": 999999}},
+        status=201,
+    ),
+    # Vocabulary
+    Case("vocabulary-list", "person", lambda w: reverse("vocabulary-list")),
+    Case("vocabulary-detail", "person", lambda w: reverse("vocabulary-detail", args=[Vocabulary.objects.first().pk])),
+    Case("conceptclass-list", "person", lambda w: reverse("conceptclass-list")),
+    Case("conceptclass-detail", "person", lambda w: reverse("conceptclass-detail", args=["QueryCount"])),
+    Case(
+        "concept-list",
+        "person",
+        lambda w: reverse("concept-list"),
+        data=lambda w: {"class": "QueryCount", "lang": "297504001", "relationship": "has_value_type"},
+    ),
+    Case("concept-detail", "person", lambda w: reverse("concept-detail", args=[Concept.objects.first().pk])),
+    Case("conceptsynonym-list", "person", lambda w: reverse("conceptsynonym-list")),
+    Case(
+        "conceptsynonym-detail",
+        "person",
+        lambda w: reverse("conceptsynonym-detail", args=[ConceptSynonym.objects.first().pk]),
+    ),
+    Case("domain-list", "person", lambda w: reverse("domain-list")),
+    Case("domain-detail", "person", lambda w: reverse("domain-detail", args=[Domain.objects.first().pk])),
+    Case("vocabulary-bundle", "person", lambda w: reverse("vocabulary-bundle")),
+    # Simple OMOP resources
+    Case("api-root", "person", lambda w: reverse("api-root")),
+    Case("location-list", "person", lambda w: reverse("location-list")),
+    Case("location-detail", "person", lambda w: reverse("location-detail", args=[w.location.pk])),
+    Case("caresite-list", "person", lambda w: reverse("caresite-list")),
+    Case("caresite-detail", "person", lambda w: reverse("caresite-detail", args=[CareSite.objects.first().pk])),
+    Case("drugexposure-list", "person", lambda w: reverse("drugexposure-list")),
+    Case(
+        "drugexposure-detail",
+        "person",
+        lambda w: reverse("drugexposure-detail", args=[w.person.drugexposure_set.first().pk]),
+    ),
+    Case("observation-list", "person", lambda w: reverse("observation-list")),
+    Case("observation-detail", "person", lambda w: reverse("observation-detail", args=[w.diary.pk])),
+    Case("visitoccurrence-list", "provider", lambda w: reverse("visitoccurrence-list")),
+    Case(
+        "visitoccurrence-detail",
+        "provider",
+        lambda w: reverse("visitoccurrence-detail", args=[w.provider.visitoccurrence_set.first().pk]),
+    ),
+    Case("measurement-list", "person", lambda w: reverse("measurement-list")),
+    Case(
+        "measurement-detail",
+        "person",
+        lambda w: reverse("measurement-detail", args=[w.person.measurement_set.first().pk]),
+    ),
+    Case("factrelationship-list", "person", lambda w: reverse("factrelationship-list")),
+    Case(
+        "factrelationship-detail",
+        "person",
+        lambda w: reverse("factrelationship-detail", args=[FactRelationship.objects.first().pk]),
+    ),
+    # Linking
+    Case("generate-link-code", "provider", lambda w: reverse("generate-link-code"), "post", status=201),
+    Case(
+        "provider-by-link-code",
+        "person",
+        lambda w: reverse("provider-by-link-code"),
+        "post",
+        lambda w: {"code": w.link_code()},
+    ),
+    Case(
+        "person-link-code", "person", lambda w: reverse("person-link-code"), "post", lambda w: {"code": w.link_code()}
+    ),
+    Case(
+        "person-provider-unlink",
+        "person",
+        lambda w: reverse("person-provider-unlink", args=[w.person.pk, w.provider.pk]),
+        "post",
+    ),
+    Case("person-providers", "person", lambda w: reverse("person-providers")),
+    Case("provider-persons", "provider", lambda w: reverse("provider-persons")),
+    # Help requests and visits
+    Case(
+        "send-help",
+        "person",
+        lambda w: reverse("send-help"),
+        "post",
+        lambda w: [{"provider": w.provider.pk, "value_as_string": "Preciso de ajuda"}],
+        status=201,
+    ),
+    Case("get-help", "provider", lambda w: reverse("get-help")),
+    Case("resolve-help", "provider", lambda w: reverse("resolve-help", args=[w.help.pk]), "post"),
+    Case("provider-help-count", "provider", lambda w: reverse("provider-help-count")),
+    Case("next-scheduled-visit", "provider", lambda w: reverse("next-scheduled-visit")),
+    # Diaries and interest areas
+    Case("diary", "person", lambda w: reverse("diary")),
+    Case("diary-detail", "person", lambda w: reverse("diary-detail", args=[w.diary.pk])),
+    Case("person-diaries", "person", lambda w: reverse("person-diaries")),
+    Case("acs-diaries", "provider", lambda w: reverse("acs-diaries", args=[w.person.pk])),
+    Case("acs-diary-detail", "provider", lambda w: reverse("acs-diary-detail", args=[w.person.pk, w.diary.pk])),
+    Case(
+        "interest-area-list",
+        "person",
+        lambda w: reverse("interest-area-list"),
+        data=lambda w: {"person_id": w.person.pk},
+    ),
+    Case(
+        "interest-area-detail",
+        "person",
+        lambda w: reverse("interest-area-detail", args=[w.interest_area.pk]),
+    ),
+    Case(
+        "mark-attention-point",
+        "provider",
+        lambda w: "/person/interest-areas/mark-attention-point/",
+        "patch",
+        lambda w: {"area_id": w.interest_area.pk, "is_attention_point": False},
+    ),
+    # Operations
+    Case("omop-export", "admin", lambda w: reverse("omop-export", args=["observation"])),
+    Case("metrics", None, lambda w: reverse("metrics"), headers={"Authorization": f"Bearer {METRICS_TOKEN}"}),
+]
+
+
+def registered_routes(patterns=None, prefix=""):
+    """Routes of urls.py (without the format suffix variants), as in ResolverMatch.route."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    routes = set()
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern).removeprefix("^")
+        if isinstance(pattern, URLResolver):
+            if not route.startswith(EXCLUDED_PREFIXES):
+                routes |= registered_routes(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern) and "format" not in pattern.pattern.regex.groupindex:
+            routes.add(route)
+    return routes
+
+
+# The generation checks of the per-process caches run at most once per
+# interval, whatever the request; they are kept out of the counts.
+@override_settings(
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+    CACHE_GENERATION_CHECK_SECONDS=3600,
+    METRICS_TOKEN=METRICS_TOKEN,
+)
+class QueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for seed in ["seed_domains", "seed_concept_classes", "seed_vocabularies", "seed_concepts"]:
+            call_command(seed, stdout=io.StringIO())
+        concept_registry.clear()
+        concept_registry.load()
+        cls.world = World()
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+
+    def count_queries(self, case):
+        """Number of queries of one request; whatever it writes is rolled back."""
+        client = APIClient()
+        if case.user:
+            user = getattr(self.world, case.user)
+            # Persons and providers authenticate as their user.
+            client.force_authenticate(getattr(user, "user", user))
+
+        with transaction.atomic():
+            cache.clear()
+            path = case.path(self.world)
+            data = case.data(self.world)
+            cache.clear()
+            # A link written by an earlier case made the watch re-read its generation.
+            PersonProviderLink.objects.generation.read()
+            with CaptureQueriesContext(connection) as queries:
+                if case.method == "get":
+                    response = client.get(path, data, secure=True, headers=case.headers)
+                else:
+                    response = getattr(client, case.method)(
+                        path, data, format="json", secure=True, headers=case.headers
+                    )
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            transaction.set_rollback(True)
+
+        self.assertEqual(response.status_code, case.status, f"{case.name}: {getattr(response, 'data', '')}")
+        return len(queries)
+
+    def test_every_endpoint_has_a_case(self):
+        self.world.grow(1)
+        requested = {resolve(urlsplit(case.path(self.world)).path).route for case in CASES}
+        missing = registered_routes() - requested - set(EXCLUDED_ROUTES)
+        self.assertFalse(missing, f"Add a case to CASES (or to EXCLUDED_ROUTES) for: {sorted(missing)}")
+
+    def test_query_count_does_not_grow_with_data(self):
+        self.world.grow(SMALL)
+        small = {case.name: self.count_queries(case) for case in CASES}
+        self.world.grow(LARGE - SMALL)
+        large = {case.name: self.count_queries(case) for case in CASES}
+
+        if UPDATE_BASELINE:
+            BASELINE_PATH.write_text(json.dumps(large, indent=2, sort_keys=True) + "\n")
+        baseline = json.loads(BASELINE_PATH.read_text())
+
+        for case in CASES:
+            with self.subTest(case.name):
+                self.assertEqual(
+                    small[case.name],
+                    large[case.name],
+                    f"{case.name} runs {small[case.name]} queries with {SMALL} rows and "
+                    f"{large[case.name]} with {LARGE}",
+                )
+                self.assertEqual(
+                    large[case.name],
+                    baseline.get(case.name),
+                    f"{case.name} no longer matches {BASELINE_PATH.name}; if intended, run with UPDATE_QUERY_COUNTS=1",
+                )
+
+
+class PartitionedObservationQueryCountTests(QueryCountTests):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        call_command("partition_observation", "--by", "concept", stdout=io.StringIO())
@@ -0,0 +1,285 @@
+"""
+Query-plan regression tests.
+
+Each query of app_saude.utils.hot_queries is EXPLAINed against data where one
+person and one provider are far heavier than the rest, and must be served by
+the partial index registered for it. To see the plans on a real database:
+
+    python manage.py explain_hot_queries
+
+With observation partitioned (partition_observation), each query must be
+pruned to the partitions that can hold its rows.
+"""
+
+import io
+import uuid
+from datetime import timedelta
+from unittest import mock
+
+from django.apps import apps as global_apps
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_pre_migrate_signal
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Count, Max
+from django.test import TestCase
+from django.utils import timezone
+
+from .management.commands import partition_observation
+from .models import *
+from .tests import create_linked_person, create_provider
+from .utils.concept import concept_registry, get_concept_by_code
+from .utils.hot_queries import HOT_QUERIES, indexes_in_plan, query_plan, sample_parameters
+from .utils.partitioning import (
+    DEFAULT_PARTITION,
+    MONTHS_AHEAD,
+    extend_month_partitions,
+    month_partition_name,
+    month_start,
+    observation_partitioning,
+    rebuild_observation,
+    upcoming_months,
+)
+
+PERSONS = 200
+HEAVY_ROWS = 500
+
+
+def scan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from scan_nodes(child)
+
+
+def scanned_tables(plan: dict) -> set[str]:
+    return {node["Relation Name"] for node in scan_nodes(plan) if "Relation Name" in node}
+
+
+def create_heavy_data():
+    for seed in ["seed_domains", "seed_concept_classes", "seed_vocabularies", "seed_concepts"]:
+        call_command(seed, stdout=io.StringIO())
+    concept_registry.clear()
+    concept_registry.load()
+
+    now = timezone.now()
+    concepts = {
+        code: get_concept_by_code(code).concept_id
+        for code in [
+            "diary_entry",
+            "HELP",
+            "ACTIVE",
+            "RESOLVED",
+            "INTEREST_AREA",
+            "PROVIDER_LINK_CODE",
+            "CLINICIAN_GENERATED",
+        ]
+    }
+    provider = create_provider("provider", registration=1)
+    heavy_person = create_linked_person(provider, "heavy")
+    persons = [heavy_person] + [create_linked_person(provider, f"person{i}") for i in range(PERSONS)]
+    other_providers = [create_provider(f"other{i}", registration=i + 2) for i in range(20)]
+
+    observations = []
+    for i in range(HEAVY_ROWS):
+        when = now - timedelta(hours=i)
+        observations += [
+            Observation(person=heavy_person, observation_concept_id=concepts["diary_entry"], observation_date=when),
+            Observation(person=heavy_person, observation_concept_id=concepts["INTEREST_AREA"], observation_date=when),
+            Observation(
+                person=persons[i % len(persons)],
+                provider=provider,
+                observation_concept_id=concepts["HELP"],
+                value_as_concept_id=concepts["ACTIVE"] if i % 4 == 0 else concepts["RESOLVED"],
+                observation_source_value=f"idempotency-key:{uuid.UUID(int=i)}",
+                observation_date=when,
+            ),
+        ]
+    for i, person in enumerate(persons):
+        observations += [
+            Observation(
+                person=person,
+                observation_concept_id=concepts["diary_entry"],
+                observation_date=now - timedelta(days=day),
+                shared_with_provider=day % 2 == 0,
+            )
+            for day in range(10)
+        ]
+        observations += [
+            Observation(
+                person=person,
+                observation_concept_id=concepts["INTEREST_AREA"],
+                observation_date=now - timedelta(days=day),
+            )
+            for day in range(3)
+        ]
+        observations.append(
+            Observation(
+                person=person,
+                provider=other_providers[i % len(other_providers)],
+                observation_concept_id=concepts["HELP"],
+                value_as_concept_id=concepts["ACTIVE"],
+                observation_date=now,
+            )
+        )
+    observations += [
+        Observation(
+            provider=other_provider,
+            observation_concept_id=concepts["PROVIDER_LINK_CODE"],
+            observation_type_concept_id=concepts["CLINICIAN_GENERATED"],
+            value_as_string=f"{i:06X}",
+            observation_date=now,
+        )
+        for i, other_provider in enumerate(other_providers)
+    ]
+    Observation.objects.bulk_create(observations)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {Observation._meta.db_table}")
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_heavy_data()
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+
+    def test_partial_index_conditions_match_seeded_concepts(self):
+        self.assertEqual(
+            {
+                "PROVIDER_LINK_CODE": PROVIDER_LINK_CODE_CONCEPT_ID,
+                "diary_entry": DIARY_ENTRY_CONCEPT_ID,
+                "HELP": HELP_CONCEPT_ID,
+                "ACTIVE": ACTIVE_CONCEPT_ID,
+                "INTEREST_AREA": INTEREST_AREA_CONCEPT_ID,
+            },
+            {
+                code: get_concept_by_code(code).concept_id
+                for code in ["PROVIDER_LINK_CODE", "diary_entry", "HELP", "ACTIVE", "INTEREST_AREA"]
+            },
+        )
+
+    def test_hot_queries_use_their_index(self):
+        sample = sample_parameters()
+        for hot_query in HOT_QUERIES:
+            with self.subTest(hot_query.name):
+                plan = query_plan(hot_query.build(sample))
+                self.assertNotIn(
+                    "Seq Scan", {node["Node Type"] for node in scan_nodes(plan)}, f"{hot_query.name}: {plan}"
+                )
+                self.assertIn(hot_query.index, indexes_in_plan(plan))
+
+
+class PartitionPruningTests(TestCase):
+    # Partition each hot query must be pruned to, with observation partitioned by concept.
+    CONCEPT_PARTITIONS = {
+        "diaries": "observation_diary",
+        "shared-diaries": "observation_diary",
+        "received-helps": "observation_help",
+        "last-active-help": "observation_help",
+        "help-replay": "observation_help",
+        "link-code": "observation_link_code",
+        "provider-link-code": "observation_link_code",
+        "interest-areas": "observation_interest_area",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        create_heavy_data()
+        cls.rows_by_concept = dict(
+            Observation.objects.values_list("observation_concept_id").annotate(rows=Count("pk")).order_by()
+        )
+        cls.last_id = Observation.objects.aggregate(last=Max("pk"))["last"]
+        call_command("partition_observation", "--by", "concept", stdout=io.StringIO())
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+
+    def partition_of(self, observation_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tableoid::regclass::text FROM observation WHERE observation_id = %s", [observation_id]
+            )
+            return cursor.fetchone()[0]
+
+    def test_existing_rows_are_copied_and_ids_continue(self):
+        self.assertEqual(observation_partitioning(), "concept")
+        self.assertEqual(
+            dict(Observation.objects.values_list("observation_concept_id").annotate(rows=Count("pk")).order_by()),
+            self.rows_by_concept,
+        )
+        diary = Observation.objects.filter(observation_concept_id=DIARY_ENTRY_CONCEPT_ID).first()
+        self.assertEqual(self.partition_of(diary.pk), "observation_diary")
+
+        observation = Observation.objects.create(observation_concept_id=HELP_CONCEPT_ID)
+        self.assertGreater(observation.pk, self.last_id)
+        self.assertEqual(self.partition_of(observation.pk), "observation_help")
+
+    def test_hot_queries_scan_one_partition(self):
+        sample = sample_parameters()
+        for hot_query in HOT_QUERIES:
+            with self.subTest(hot_query.name):
+                plan = query_plan(hot_query.build(sample))
+                self.assertEqual(scanned_tables(plan), {self.CONCEPT_PARTITIONS[hot_query.name]})
+
+    def test_month_partitions_prune_on_observation_date(self):
+        rebuild_observation("month")
+        sample = sample_parameters()
+        queries = {hot_query.name: hot_query.build(sample) for hot_query in HOT_QUERIES}
+
+        # Only the link code lookup filters on the date; the others read every month.
+        recent = {month_partition_name(month) for month in upcoming_months(MONTHS_AHEAD)}
+        recent.add(month_partition_name(month_start(timezone.now() - timedelta(minutes=10))))
+        self.assertLessEqual(scanned_tables(query_plan(queries["link-code"])), recent | {DEFAULT_PARTITION})
+        self.assertIn(DEFAULT_PARTITION, scanned_tables(query_plan(queries["diaries"])))
+
+    def test_new_month_partitions_take_their_rows_from_default(self):
+        rebuild_observation("month")
+        when = timezone.now() + timedelta(days=400)
+        observation = Observation.objects.create(observation_concept_id=DIARY_ENTRY_CONCEPT_ID, observation_date=when)
+        self.assertEqual(self.partition_of(observation.pk), DEFAULT_PARTITION)
+
+        self.assertGreater(extend_month_partitions(months_ahead=15), 0)
+
+        self.assertEqual(self.partition_of(observation.pk), month_partition_name(month_start(when.date())))
+
+    def test_undo_restores_plain_table(self):
+        call_command("partition_observation", "--undo", stdout=io.StringIO())
+
+        self.assertIsNone(observation_partitioning())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Observation._meta.db_table)
+            interest_area_constraints = connection.introspection.get_constraints(cursor, InterestArea._meta.db_table)
+        self.assertTrue(any(constraint["primary_key"] for constraint in constraints.values()))
+        self.assertIn(
+            ("observation", "observation_id"),
+            [constraint["foreign_key"] for constraint in interest_area_constraints.values()],
+        )
+        self.assertEqual(
+            dict(Observation.objects.values_list("observation_concept_id").annotate(rows=Count("pk")).order_by()),
+            self.rows_by_concept,
+        )
+
+    def migrate_app_saude(self, *migrations):
+        loader = MigrationLoader(connection)
+        plan = [(loader.get_migration("app_saude", name), False) for name in migrations]
+        emit_pre_migrate_signal(0, False, connection.alias, apps=global_apps, plan=plan)
+
+    def test_migrate_refuses_while_partitioned(self):
+        latest = MigrationLoader(connection).graph.leaf_nodes("app_saude")[0][1]
+        with self.assertRaisesMessage(CommandError, "partition_observation --undo"):
+            self.migrate_app_saude(latest)
+
+        self.migrate_app_saude()
+        call_command("partition_observation", "--undo", stdout=io.StringIO())
+        self.migrate_app_saude(latest)
+
+    def test_partitioning_refuses_pending_migrations(self):
+        call_command("partition_observation", "--undo", stdout=io.StringIO())
+        with mock.patch.object(partition_observation, "pending_migrations", return_value=["0099_next"]):
+            with self.assertRaisesMessage(CommandError, "0099_next"):
+                call_command("partition_observation", "--by", "month", stdout=io.StringIO())
+        self.assertIsNone(observation_partitioning())
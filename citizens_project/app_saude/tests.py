@@ -1 +1,1598 @@
-# Create your tests here.
+import asyncio
+import atexit
+import base64
+import csv
+import io
+import json
+import logging
+import re
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from google.auth import crypt, jwt
+from libs.google import GoogleAuthClient, GoogleUserData
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from citizens_project.logs import ExtraFormatter, JsonFormatter, QueueListenerHandler, SamplingFilter
+
+from .management.commands import load_athena
+from .middleware import RequestMetricsMiddleware
+from .models import *
+from .utils import help_events
+from .utils.concept import concept_registry
+from .utils.help_events import help_event_broker
+from .utils.population import PopulationGenerator, PopulationSpec
+from .utils.seeding import seed_rows
+from .utils.vocabulary import bundle_cache_key, get_vocabulary_bundle, rebuild_vocabulary_bundle, vocabulary_generation
+
+User = get_user_model()
+
+TEST_CONCEPTS = [
+    (2000004002, "PERSON_PROVIDER"),
+    (2000005001, "PERSON"),
+    (2000005002, "PROVIDER"),
+    (2000006000, "diary_entry"),
+    (2000006003, "diary_entry_type"),
+    (2000007000, "HELP"),
+    (2000007001, "ACTIVE"),
+    (2000007002, "RESOLVED"),
+    (2000008000, "INTEREST_AREA"),
+]
+
+
+def create_test_concepts():
+    for concept_id, code in TEST_CONCEPTS:
+        Concept.objects.create(concept_id=concept_id, concept_code=code, concept_name=code)
+
+
+def create_provider(username="provider", registration=1):
+    user = User.objects.create_user(username=username, first_name="Ana", last_name="Souza")
+    return Provider.objects.create(user=user, social_name=f"Dra. {username}", professional_registration=registration)
+
+
+def create_linked_person(provider, username, **person_fields):
+    user = User.objects.create_user(username=username, first_name=username.title(), last_name="Silva")
+    person = Person.objects.create(user=user, **person_fields)
+    FactRelationship.objects.create(
+        fact_id_1=person.person_id,
+        domain_concept_1_id=2000005001,
+        fact_id_2=provider.provider_id,
+        domain_concept_2_id=2000005002,
+        relationship_concept_id=2000004002,
+    )
+    return person
+
+
+def create_help(person, provider, when, active=True):
+    return Observation.objects.create(
+        person=person,
+        provider=provider,
+        observation_concept_id=2000007000,
+        value_as_concept_id=2000007001 if active else 2000007002,
+        observation_date=when,
+        value_as_string="Preciso de ajuda",
+    )
+
+
+class ConceptRegistryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+
+    def rename_elsewhere(self, name):
+        """What another process does: change the row (no signal reaches this one) and bump the generation."""
+        Concept.objects.filter(concept_code="HELP").update(concept_name=name)
+        CacheGeneration.objects.bump("concepts")
+
+    def test_invalidation_by_another_process_is_picked_up_after_the_check_interval(self):
+        self.rename_elsewhere("Ajuda")
+
+        with override_settings(CACHE_GENERATION_CHECK_SECONDS=3600):
+            self.assertEqual(concept_registry.get_by_code("HELP").concept_name, "HELP")
+        with override_settings(CACHE_GENERATION_CHECK_SECONDS=0):
+            self.assertEqual(concept_registry.get_by_code("HELP").concept_name, "Ajuda")
+
+    def test_saving_a_concept_bumps_the_generation(self):
+        before = CacheGeneration.objects.current("concepts")
+
+        Concept.objects.filter(concept_code="HELP").get().save()
+
+        self.assertEqual(CacheGeneration.objects.current("concepts"), before + 1)
+
+    def test_refresh_concepts_reaches_the_other_processes(self):
+        before = CacheGeneration.objects.current("concepts")
+
+        call_command("refresh_concepts", stdout=io.StringIO())
+
+        self.assertEqual(CacheGeneration.objects.current("concepts"), before + 1)
+        self.assertEqual(concept_registry.generation.current(), before + 1)
+
+
+class VocabularyBundleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+
+    def setUp(self):
+        cache.clear()
+        vocabulary_generation.forget()
+
+    def test_bundle_of_an_older_generation_is_not_served(self):
+        old = rebuild_vocabulary_bundle()
+        # Another process changes a concept and bumps the generation; nothing reaches this one's cache.
+        Concept.objects.filter(concept_code="HELP").update(concept_name="Ajuda")
+        CacheGeneration.objects.bump("vocabulary")
+
+        with override_settings(CACHE_GENERATION_CHECK_SECONDS=3600):
+            self.assertEqual(get_vocabulary_bundle()["etag"], old["etag"])
+        with override_settings(CACHE_GENERATION_CHECK_SECONDS=0):
+            self.assertNotEqual(get_vocabulary_bundle()["etag"], old["etag"])
+
+    def test_concept_change_invalidates_at_once_in_this_process(self):
+        old = rebuild_vocabulary_bundle()
+
+        with override_settings(CACHE_GENERATION_CHECK_SECONDS=3600):
+            Concept.objects.filter(concept_code="HELP").get().save()
+            self.assertGreater(CacheGeneration.objects.current("vocabulary"), 0)
+            self.assertIsNone(cache.get(bundle_cache_key(vocabulary_generation.current())))
+            self.assertEqual(get_vocabulary_bundle()["etag"], old["etag"])  # Same content, same ETag.
+
+    def test_bundle_is_cached_with_a_finite_timeout(self):
+        with mock.patch.object(cache, "set") as cache_set:
+            rebuild_vocabulary_bundle()
+
+        self.assertEqual(cache_set.call_args.kwargs["timeout"], settings.VOCABULARY_BUNDLE_CACHE_TIMEOUT)
+
+
+class SeedRowsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.portuguese = Concept.objects.create(concept_id=4181536, concept_code="pt", concept_name="Portuguese")
+        ConceptClass.objects.create(concept_class_id="Gender", concept_class_name="Gender")
+
+    def concept_rows(self, **overrides):
+        rows = [
+            {"concept_id": 1, "concept_name": "Sim", "concept_code": "YES", "concept_class_id": "Gender"},
+            {"concept_id": 2, "concept_name": "Não", "concept_code": "NO", "concept_class_id": None},
+        ]
+        rows[0].update(overrides)
+        return rows
+
+    def seed_concepts(self, rows):
+        return seed_rows(
+            Concept,
+            rows,
+            fields=("concept_name", "concept_code", "concept_class_id"),
+            keep_when_none=("concept_class_id",),
+        )
+
+    def test_missing_rows_are_created_and_changed_rows_updated(self):
+        created = self.seed_concepts(self.concept_rows())
+        updated = self.seed_concepts(self.concept_rows(concept_name="Yes"))
+
+        self.assertEqual((created.created, created.updated), (2, 0))
+        self.assertEqual((updated.created, updated.updated), (0, 1))
+        self.assertEqual(Concept.objects.get(pk=1).concept_name, "Yes")
+
+    def test_an_unchanged_seed_only_reads(self):
+        self.seed_concepts(self.concept_rows())
+
+        with CaptureQueriesContext(connection) as queries:
+            result = self.seed_concepts(self.concept_rows())
+
+        self.assertFalse(result.changed)
+        self.assertEqual(len(queries), 1)
+
+    def test_none_keeps_the_stored_value_of_keep_when_none_fields(self):
+        self.seed_concepts(self.concept_rows())
+
+        result = self.seed_concepts(self.concept_rows(concept_class_id=None))
+
+        self.assertFalse(result.changed)
+        self.assertEqual(Concept.objects.get(pk=1).concept_class_id, "Gender")
+
+    def test_update_existing_false_only_creates(self):
+        self.seed_concepts(self.concept_rows())
+
+        result = seed_rows(Concept, self.concept_rows(concept_name="Yes"), update_existing=False)
+
+        self.assertFalse(result.changed)
+        self.assertEqual(Concept.objects.get(pk=1).concept_name, "Sim")
+
+    def test_rows_keyed_by_other_fields_are_matched_on_them(self):
+        self.seed_concepts(self.concept_rows())
+        existing = ConceptSynonym.objects.create(
+            concept_id=1, language_concept=self.portuguese, concept_synonym_name="Sim"
+        )
+        rows = [
+            {"concept_id": 1, "language_concept_id": self.portuguese.pk, "concept_synonym_name": "Sim!"},
+            {"concept_id": 2, "language_concept_id": self.portuguese.pk, "concept_synonym_name": "Não"},
+        ]
+
+        result = seed_rows(
+            ConceptSynonym, rows, key=("concept_id", "language_concept_id"), fields=("concept_synonym_name",)
+        )
+
+        self.assertEqual((result.created, result.updated), (1, 1))
+        existing.refresh_from_db()
+        self.assertEqual(existing.concept_synonym_name, "Sim!")
+        self.assertEqual(ConceptSynonym.objects.count(), 2)
+
+    def test_changes_invalidate_the_concept_registry(self):
+        with mock.patch.object(concept_registry, "invalidate") as invalidate:
+            self.seed_concepts(self.concept_rows())
+            self.seed_concepts(self.concept_rows())
+
+        invalidate.assert_called_once_with()
+
+
+# A tiny Athena download: one row per line, tab separated, header first.
+ATHENA_FIXTURE = {
+    "VOCABULARY": [
+        "vocabulary_id\tvocabulary_name\tvocabulary_reference\tvocabulary_version\tvocabulary_concept_id",
+        "SNOMED\tSystematic Nomenclature of Medicine\tSNOMED International\t2024-01-31\t44819097",
+    ],
+    "DOMAIN": [
+        "domain_id\tdomain_name\tdomain_concept_id",
+        "Condition\tCondition\t19",
+    ],
+    "CONCEPT_CLASS": [
+        "concept_class_id\tconcept_class_name\tconcept_class_concept_id",
+        "Clinical Finding\tClinical Finding\t44819034",
+    ],
+    "CONCEPT": [
+        "concept_id\tconcept_name\tdomain_id\tvocabulary_id\tconcept_class_id\tstandard_concept\tconcept_code"
+        "\tvalid_start_date\tvalid_end_date\tinvalid_reason",
+        "4181536\tPortuguese language\tLanguage\tSNOMED\tQualifier Value\tS\t297504001\t20020131\t20991231\t",
+        "201820\tDiabetes mellitus\tCondition\tSNOMED\tClinical Finding\tS\t73211009\t20020131\t20991231\t",
+        "201826\tType 2 diabetes mellitus\tCondition\tSNOMED\tClinical Finding\tS\t44054006\t20020131" "\t20991231\t",
+    ],
+    "CONCEPT_SYNONYM": [
+        "concept_id\tconcept_synonym_name\tlanguage_concept_id",
+        "201826\tDiabetes tipo 2\t4181536",
+        "999999\tConceito ausente\t4181536",
+    ],
+    "CONCEPT_RELATIONSHIP": [
+        "concept_id_1\tconcept_id_2\trelationship_id\tvalid_start_date\tvalid_end_date\tinvalid_reason",
+        "201826\t201820\tIs a\t19700101\t20991231\t",
+        "201820\t201826\tSubsumes\t19700101\t20991231\t",
+        "201826\t4181536\tMaps to\t19700101\t20170428\tD",
+    ],
+}
+
+
+class LoadAthenaTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = Path(directory.name)
+        self.checkpoint = self.source / ".load_athena_checkpoint.json"
+        self.write_fixture(ATHENA_FIXTURE)
+
+    def write_fixture(self, files):
+        for name, lines in files.items():
+            (self.source / f"{name}.csv").write_text("\n".join(lines) + "\n")
+
+    def load(self, *args):
+        out = io.StringIO()
+        call_command("load_athena", str(self.source), *args, stdout=out)
+        return out.getvalue()
+
+    def stage_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tablename FROM pg_tables WHERE tablename LIKE 'athena_stage_%%'")
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_files_are_staged_and_merged(self):
+        self.load()
+
+        diabetes = Concept.objects.get(pk=201826)
+        self.assertEqual(diabetes.concept_name, "Type 2 diabetes mellitus")
+        self.assertEqual((diabetes.domain_id, diabetes.vocabulary_id), ("Condition", "SNOMED"))
+        self.assertEqual(diabetes.concept_class_id, "Clinical Finding")
+        # Classes missing from CONCEPT_CLASS.csv become NULL.
+        self.assertIsNone(Concept.objects.get(pk=4181536).concept_class_id)
+        # Concepts referenced by vocabularies, domains and classes get a placeholder.
+        self.assertEqual(Concept.objects.filter(pk__in=[44819097, 19, 44819034]).count(), 3)
+        self.assertEqual(
+            list(ConceptSynonym.objects.values_list("concept_id", "concept_synonym_name", "language_concept_id")),
+            [(201826, "Diabetes tipo 2", 4181536)],
+        )
+        self.assertEqual(
+            set(ConceptRelationship.objects.values_list("concept_1_id", "concept_2_id", "relationship_id")),
+            {(201826, 201820, "Is a"), (201820, 201826, "Subsumes")},
+        )
+        self.assertEqual(self.stage_tables(), set())
+        self.assertFalse(self.checkpoint.exists())
+
+    def load_until_synonyms(self):
+        """Run the import, failing like a lost connection when it gets to the synonyms merge."""
+        merge = load_athena.Command.merge
+
+        def fail_on_synonyms(command, step, *args):
+            if step == "synonyms":
+                raise RuntimeError("conexão perdida")
+            return merge(command, step, *args)
+
+        with mock.patch.object(load_athena.Command, "merge", fail_on_synonyms), self.assertRaises(RuntimeError):
+            self.load()
+
+    def test_an_interrupted_import_resumes_from_the_checkpoint(self):
+        self.load_until_synonyms()
+
+        steps = json.loads(self.checkpoint.read_text())["steps"]
+        self.assertIn("merge:concepts", steps)
+        self.assertNotIn("merge:synonyms", steps)
+        self.assertEqual(steps["copy:CONCEPT"]["rows"], 3)
+        self.assertIn("athena_stage_concept_synonym", self.stage_tables())
+
+        out = self.load()
+
+        self.assertIn("CONCEPT.csv: já copiado (3 linhas), pulando", out)
+        self.assertIn("Mesclagem 'concepts': já concluída, pulando", out)
+        self.assertEqual(ConceptSynonym.objects.count(), 1)
+        self.assertEqual(ConceptRelationship.objects.count(), 2)
+        self.assertFalse(self.checkpoint.exists())
+
+    def test_a_file_changed_since_the_checkpoint_is_copied_again(self):
+        self.load_until_synonyms()
+        self.write_fixture({"CONCEPT_SYNONYM": [*ATHENA_FIXTURE["CONCEPT_SYNONYM"], "201820\tDiabetes\t4181536"]})
+
+        out = self.load()
+
+        self.assertIn("CONCEPT_SYNONYM.csv: 3 linhas copiadas", out)
+        self.assertIn("CONCEPT.csv: já copiado (3 linhas), pulando", out)
+        self.assertEqual(ConceptSynonym.objects.count(), 2)
+
+    def rename_diabetes(self):
+        concepts = ATHENA_FIXTURE["CONCEPT"]
+        self.write_fixture(
+            {"CONCEPT": [*concepts[:-1], concepts[-1].replace("Type 2 diabetes mellitus", "Diabetes mellitus type 2")]}
+        )
+
+    def test_a_resumed_import_merges_again_after_a_new_download(self):
+        self.load_until_synonyms()
+        self.rename_diabetes()
+
+        out = self.load()
+
+        self.assertNotIn("Mesclagem 'concepts': já concluída", out)
+        self.assertEqual(Concept.objects.get(pk=201826).concept_name, "Diabetes mellitus type 2")
+
+    def test_kept_staging_does_not_skip_the_merges_of_a_new_download(self):
+        self.load("--keep-staging")
+        self.assertIn("merge:concepts", json.loads(self.checkpoint.read_text())["steps"])
+        self.rename_diabetes()
+
+        out = self.load("--keep-staging")
+
+        self.assertIn("CONCEPT.csv: 3 linhas copiadas", out)
+        self.assertNotIn("já concluída", out)
+        self.assertEqual(Concept.objects.get(pk=201826).concept_name, "Diabetes mellitus type 2")
+
+    def test_restart_ignores_the_checkpoint(self):
+        self.load_until_synonyms()
+
+        out = self.load("--restart")
+
+        self.assertIn("CONCEPT.csv: 3 linhas copiadas", out)
+        self.assertNotIn("já concluída", out)
+        self.assertEqual(Concept.objects.filter(pk__in=[201820, 201826, 4181536]).count(), 3)
+
+    def test_a_new_download_is_merged_over_the_previous_one(self):
+        self.load()
+        concepts = ATHENA_FIXTURE["CONCEPT"]
+        self.write_fixture(
+            {
+                "CONCEPT": [
+                    *concepts[:-1],
+                    concepts[-1].replace("Type 2 diabetes mellitus", "Diabetes mellitus type 2"),
+                ],
+                "CONCEPT_SYNONYM": [*ATHENA_FIXTURE["CONCEPT_SYNONYM"], "201820\tDiabetes\t4181536"],
+            }
+        )
+        unchanged = Concept.objects.get(pk=201820).updated_at
+
+        self.load()
+
+        self.assertEqual(Concept.objects.get(pk=201826).concept_name, "Diabetes mellitus type 2")
+        self.assertEqual(Concept.objects.get(pk=201820).updated_at, unchanged)
+        self.assertEqual(Concept.objects.filter(pk__in=[201820, 201826, 4181536]).count(), 3)
+        self.assertEqual(ConceptSynonym.objects.count(), 2)
+        self.assertEqual(ConceptRelationship.objects.count(), 2)
+
+
+class InterestAreaMigrationTests(TransactionTestCase):
+    """0029 moves the interest area JSON of the observations into their own tables, and back."""
+
+    before = [("app_saude", "0028_interest_area_tables")]
+    after = [("app_saude", "0029_move_interest_area_json")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_json_is_moved_to_tables_and_back(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model("auth", "User")
+        Observation = apps.get_model("app_saude", "Observation")
+        concept = apps.get_model("app_saude", "Concept").objects.create(
+            concept_id=2000008000, concept_code="INTEREST_AREA", concept_name="INTEREST_AREA"
+        )
+        provider = apps.get_model("app_saude", "Provider").objects.create(
+            user=User.objects.create(username="provider"), social_name="Dra. Ana", professional_registration=1
+        )
+        person = apps.get_model("app_saude", "Person").objects.create(user=User.objects.create(username="maria"))
+        area = {
+            "name": "Sono",
+            "marked_by": ["Dra. Ana", "Ex-profissional"],
+            "shared_with_provider": True,
+            "triggers": [{"name": "Dormiu bem?", "type": "boolean", "response": True}, "not a trigger"],
+        }
+        sleep, duplicate, broken = [
+            Observation.objects.create(person=person, observation_concept=concept, value_as_string=value)
+            for value in [json.dumps(area), json.dumps({"name": "Sono"}), "{not json"]
+        ]
+
+        apps = self.migrate(self.after)
+        InterestArea = apps.get_model("app_saude", "InterestArea")
+
+        moved = InterestArea.objects.get(observation_id=sleep.pk)
+        self.assertEqual((moved.name, moved.shared_with_provider), ("Sono", True))
+        self.assertEqual(
+            list(moved.triggers.values_list("name", "type", "response", "position")),
+            [("Dormiu bem?", "boolean", "True", 0)],
+        )
+        # Names that no longer match a provider are dropped.
+        self.assertEqual(list(moved.marks.values_list("provider_id", flat=True)), [provider.pk])
+        # (person, name) is unique: the later duplicate gets its id as a suffix.
+        self.assertEqual(InterestArea.objects.get(observation_id=duplicate.pk).name, f"Sono ({duplicate.pk})")
+        self.assertEqual(InterestArea.objects.get(observation_id=broken.pk).name, f"Área {broken.pk}")
+        self.assertEqual(apps.get_model("app_saude", "Observation").objects.get(pk=sleep.pk).value_as_string, "Sono")
+
+        apps = self.migrate(self.before)
+
+        restored = json.loads(apps.get_model("app_saude", "Observation").objects.get(pk=sleep.pk).value_as_string)
+        self.assertEqual(
+            restored,
+            {
+                "name": "Sono",
+                "marked_by": ["Dra. Ana"],
+                "shared_with_provider": True,
+                "triggers": [{"name": "Dormiu bem?", "type": "boolean", "response": "True"}],
+            },
+        )
+
+
+class ManagedObservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.person = Person.objects.create(user=User.objects.create_user(username="maria"))
+        cls.area = InterestArea.objects.create(
+            observation=Observation.objects.create(
+                person=cls.person, observation_concept_id=2000008000, value_as_string="Sono"
+            ),
+            person=cls.person,
+            name="Sono",
+        )
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+        self.client = APIClient()
+        self.client.force_authenticate(self.person.user)
+
+    def test_interest_area_observations_are_not_written_through_the_generic_endpoint(self):
+        data = {"person": self.person.pk, "observation_concept": 2000008000, "value_as_string": "Lazer"}
+        detail = reverse("observation-detail", args=[self.area.pk])
+
+        responses = [
+            self.client.post(reverse("observation-list"), data, format="json", secure=True),
+            self.client.patch(detail, {"value_as_string": "Lazer"}, format="json", secure=True),
+            self.client.delete(detail, secure=True),
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [400, 400, 400])
+        self.assertIn("observation_concept", responses[0].data)
+        self.assertEqual(Observation.objects.get(pk=self.area.pk).value_as_string, "Sono")
+        self.assertEqual(InterestArea.objects.count(), 1)
+        self.assertEqual(self.client.get(detail, secure=True).status_code, 200)
+
+    def test_other_observations_still_are(self):
+        data = {"person": self.person.pk, "observation_concept": 2000006000, "value_as_string": "Hoje"}
+
+        response = self.client.post(reverse("observation-list"), data, format="json", secure=True)
+
+        self.assertEqual(response.status_code, 201)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.person = Person.objects.create(user=User.objects.create_user(username="maria"))
+        now = timezone.now()
+        dates = [None, now, now - timedelta(days=1), now, None, now - timedelta(days=2), now]
+        cls.observations = [
+            Observation.objects.create(person=cls.person, observation_concept_id=2000006000, observation_date=date)
+            for date in dates
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.person.user)
+
+    def expected_order(self):
+        # NULL dates first, then newest first, ties broken by the highest id.
+        return [
+            observation.pk
+            for observation in sorted(
+                self.observations,
+                key=lambda observation: (
+                    observation.observation_date is not None,
+                    -(observation.observation_date.timestamp() if observation.observation_date else 0),
+                    -observation.pk,
+                ),
+            )
+        ]
+
+    def test_following_next_links_returns_every_row_once_in_order(self):
+        url = reverse("observation-list") + "?page_size=2"
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url, secure=True)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 2)
+            ids += [row["observation_id"] for row in response.data["results"]]
+            url, pages = response.data["next"], pages + 1
+
+        self.assertEqual(ids, self.expected_order())
+        self.assertEqual(pages, 4)
+
+    def test_without_cursor_or_page_size_the_full_list_is_returned(self):
+        response = self.client.get(reverse("observation-list"), secure=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), len(self.observations))
+
+    def test_invalid_cursors_are_rejected(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+        for cursor in ["!!!", encode(["not", "a", "dict"]), encode({"d": None}), encode({"d": "ontem", "i": 1})]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse("observation-list"), {"cursor": cursor}, secure=True)
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("cursor", response.data)
+
+
+class ConceptRelationshipEnrichmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        portuguese = Concept.objects.create(concept_code="pt", concept_name="Portuguese")
+        cls.mood = Concept.objects.create(concept_code="mood", concept_name="Mood")
+        cls.sleep = Concept.objects.create(concept_code="sleep", concept_name="Sleep")
+        cls.weight = Concept.objects.create(concept_code="weight", concept_name="Weight")
+        cls.scale = Concept.objects.create(concept_code="scale", concept_name="Scale")
+        cls.hours = Concept.objects.create(concept_code="hours", concept_name="Hours")
+        cls.text = Concept.objects.create(concept_code="text", concept_name="Text")
+        ConceptSynonym.objects.create(concept=cls.scale, language_concept=portuguese, concept_synonym_name="Escala")
+        ConceptRelationship.objects.create(concept_1=cls.mood, concept_2=cls.scale, relationship_id="has_value_type")
+        ConceptRelationship.objects.create(concept_1=cls.sleep, concept_2=cls.hours, relationship_id="has_value_type")
+        ConceptRelationship.objects.create(concept_1=cls.sleep, concept_2=cls.text, relationship_id="has_value_type")
+        ConceptRelationship.objects.create(concept_1=cls.weight, concept_2=cls.text, relationship_id="subsumes")
+        cls.user = User.objects.create_user(username="maria")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def related(self, **params):
+        response = self.client.get(
+            reverse("concept-list"), {"code": "mood,sleep,weight", "lang": "pt", **params}, secure=True
+        )
+        self.assertEqual(response.status_code, 200)
+        return {row["concept_code"]: row["related_concept"] for row in response.data}
+
+    def test_each_concept_gets_its_own_related_concept(self):
+        related = self.related(relationship="has_value_type")
+
+        self.assertEqual(related["mood"]["concept_id"], self.scale.concept_id)
+        self.assertEqual(related["mood"]["translated_name"], "Escala")
+        # With several relationships of the kind, the oldest one wins.
+        self.assertEqual(related["sleep"]["concept_id"], self.hours.concept_id)
+        self.assertEqual(related["sleep"]["translated_name"], "Hours")
+        self.assertIsNone(related["weight"])
+
+    def test_without_relationship_nothing_is_related(self):
+        self.assertEqual(self.related(), {"mood": None, "sleep": None, "weight": None})
+
+    def test_relationships_are_fetched_once_for_the_whole_list(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.related(relationship="has_value_type")
+        relationship_queries = [query for query in queries if ConceptRelationship._meta.db_table in query["sql"]]
+
+        self.assertEqual(len(relationship_queries), 1)
+
+
+class OmopExportViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.care_site = CareSite.objects.create(care_site_name="UBS Centro")
+        cls.provider = create_provider()
+        Provider.objects.filter(pk=cls.provider.pk).update(care_site=cls.care_site)
+        cls.linked = create_linked_person(cls.provider, "maria")
+        cls.unlinked = Person.objects.create(user=User.objects.create_user(username="joao"))
+        day = timezone.make_aware(timezone.datetime(2025, 3, 10, 14, 30))
+        cls.observations = [
+            Observation.objects.create(
+                person=cls.linked, observation_concept_id=2000006000, observation_date=day, value_as_string="Dia, bom"
+            ),
+            Observation.objects.create(
+                person=cls.linked, observation_concept_id=2000006000, observation_date=day + timedelta(days=2)
+            ),
+            Observation.objects.create(person=cls.unlinked, observation_concept_id=2000006000, observation_date=day),
+        ]
+        cls.admin = User.objects.create_user(username="admin", is_staff=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, table, **params):
+        return self.client.get(reverse("omop-export", args=[table]), params, secure=True)
+
+    def rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode()
+        return list(csv.DictReader(io.StringIO(content)))
+
+    def test_a_table_is_exported_as_csv(self):
+        response = self.export("observation")
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="observation.csv"')
+        rows = self.rows(response)
+        self.assertEqual([int(row["observation_id"]) for row in rows], [o.pk for o in self.observations])
+        first = rows[0]
+        self.assertEqual(first["person_id"], str(self.linked.pk))
+        self.assertEqual(first["observation_date"], "2025-03-10")
+        self.assertEqual(first["observation_datetime"], self.observations[0].observation_date.isoformat())
+        self.assertEqual(first["value_as_string"], "Dia, bom")
+        self.assertEqual(rows[1]["value_as_string"], "")
+
+    def test_account_data_is_left_out(self):
+        rows = self.rows(self.export("person"))
+
+        self.assertEqual(
+            list(rows[0]),
+            [
+                "person_id",
+                "year_of_birth",
+                "gender_concept_id",
+                "race_concept_id",
+                "ethnicity_concept_id",
+                "location_id",
+            ],
+        )
+
+    def test_rows_are_filtered_by_date_and_care_site(self):
+        by_date = self.rows(self.export("observation", start="2025-03-11", end="2025-03-12"))
+        by_care_site = self.rows(self.export("observation", care_site=self.care_site.pk))
+        links = self.rows(self.export("fact_relationship", care_site=self.care_site.pk))
+
+        self.assertEqual([int(row["observation_id"]) for row in by_date], [self.observations[1].pk])
+        self.assertEqual([int(row["person_id"]) for row in by_care_site], [self.linked.pk, self.linked.pk])
+        self.assertEqual([int(row["fact_id_1"]) for row in links], [self.linked.pk])
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(self.export("concept").status_code, 404)
+        self.assertEqual(self.export("observation", start="10/03/2025").status_code, 400)
+        self.assertEqual(self.export("observation", care_site="centro").status_code, 400)
+
+    async def test_asgi_requests_are_streamed_asynchronously(self):
+        token = await sync_to_async(AccessToken.for_user)(self.admin)
+        response = await self.async_client.get(
+            reverse("omop-export", args=["observation"]), secure=True, headers={"Authorization": f"Bearer {token}"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        # A synchronous iterator would be buffered in full by Django before sending.
+        self.assertTrue(response.is_async)
+        content = b"".join([piece async for piece in response.streaming_content]).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([int(row["observation_id"]) for row in rows], [o.pk for o in self.observations])
+
+    def test_only_admins_can_export(self):
+        self.client.force_authenticate(self.linked.user)
+        self.assertEqual(self.export("observation").status_code, 403)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.export("observation").status_code, 401)
+
+
+class RequestMetricsMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="maria")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def server_timing(self, response):
+        match = re.fullmatch(r'app;dur=([\d.]+), db;dur=([\d.]+);desc="(\d+) queries"', response["Server-Timing"])
+        self.assertIsNotNone(match, response["Server-Timing"])
+        return float(match[1]), float(match[2]), int(match[3])
+
+    def test_server_timing_reports_app_and_database_time(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("observation-list"), secure=True)
+
+        app_ms, db_ms, query_count = self.server_timing(response)
+        self.assertEqual(query_count, len(queries))
+        self.assertGreater(query_count, 0)
+        self.assertGreaterEqual(app_ms, 0)
+        self.assertGreater(db_ms, 0)
+
+    def test_requests_within_budget_are_not_logged(self):
+        with self.assertNoLogs("app_saude", "WARNING"):
+            self.client.get(reverse("observation-list"), secure=True)
+
+    @override_settings(REQUEST_QUERY_BUDGET=0)
+    def test_requests_over_the_query_budget_are_logged(self):
+        with self.assertLogs("app_saude", "WARNING") as logs:
+            response = self.client.get(reverse("observation-list"), secure=True)
+
+        record = next(record for record in logs.records if record.action == "request_over_budget")
+        self.assertEqual(record.query_count, self.server_timing(response)[2])
+        self.assertTrue(record.route.startswith("api/observation/"))
+        self.assertEqual(record.user_id, self.user.id)
+        self.assertIn("SELECT", record.slowest_sql)
+
+    @override_settings(REQUEST_LATENCY_BUDGET_MS=-1)
+    def test_requests_over_the_latency_budget_are_logged(self):
+        with self.assertLogs("app_saude", "WARNING") as logs:
+            self.client.get(reverse("observation-list"), secure=True)
+
+        self.assertIn("request_over_budget", [record.action for record in logs.records])
+
+    def test_queries_of_async_requests_are_counted(self):
+        async def get_response(request):
+            await sync_to_async(list)(User.objects.all())
+            await sync_to_async(list)(Observation.objects.all())
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(get_response)
+        response = async_to_sync(middleware)(RequestFactory().get("/"))
+
+        self.assertEqual(self.server_timing(response)[2], 2)
+
+
+class MetricsViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.provider = create_provider()
+        cls.person = create_linked_person(cls.provider, "maria")
+        ProviderHelpCounter.objects.filter(provider=cls.provider, person=cls.person).update(
+            active_count=2, resolved_count=5
+        )
+
+    def scrape(self, **headers):
+        return self.client.get(reverse("metrics"), secure=True, headers=headers)
+
+    @override_settings(METRICS_TOKEN="", DEBUG=False)
+    def test_without_a_token_metrics_are_closed_in_production(self):
+        self.assertEqual(self.scrape().status_code, 403)
+
+    @override_settings(METRICS_TOKEN="", DEBUG=True)
+    def test_without_a_token_metrics_are_open_in_debug(self):
+        self.assertEqual(self.scrape().status_code, 200)
+
+    @override_settings(METRICS_TOKEN="segredo")
+    def test_the_token_is_required_when_set(self):
+        self.assertEqual(self.scrape().status_code, 401)
+        self.assertEqual(self.scrape(Authorization="Bearer outro").status_code, 401)
+        self.assertEqual(self.scrape(Authorization="Bearer segredo").status_code, 200)
+
+    @override_settings(METRICS_TOKEN="segredo")
+    def test_active_helps_are_read_from_the_counters(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.scrape(Authorization="Bearer segredo")
+
+        self.assertIn(b"saude_active_help_observations 2.0", response.content)
+        self.assertIn(b"saude_persons 1.0", response.content)
+        self.assertFalse(any(Observation._meta.db_table in query["sql"] for query in queries))
+
+
+def make_record(name="app_saude", level=logging.INFO, msg="Help sent", args=(), exc_info=None, **extra):
+    return logging.getLogger(name).makeRecord(name, level, __file__, 1, msg, args, exc_info, extra=extra)
+
+
+class LoggingTests(SimpleTestCase):
+    def test_json_records_carry_the_extra_fields(self):
+        record = make_record(
+            msg="Help sent to %s", args=("Dra. Ana",), user_id=7, when=timezone.datetime(2025, 3, 10), action="sent"
+        )
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], "app_saude")
+        self.assertEqual(entry["message"], "Help sent to Dra. Ana")
+        self.assertEqual(entry["timestamp"][-6:], "+00:00")
+        self.assertEqual((entry["user_id"], entry["action"]), (7, "sent"))
+        # Values JSON cannot encode are written with str().
+        self.assertEqual(entry["when"], "2025-03-10 00:00:00")
+        self.assertNotIn("args", entry)
+        self.assertNotIn("levelno", entry)
+
+    def test_json_records_carry_the_traceback(self):
+        try:
+            raise ValueError("sem conexão")
+        except ValueError:
+            record = make_record(level=logging.ERROR, exc_info=sys.exc_info())
+
+        entry = json.loads(JsonFormatter().format(record))
+
+        self.assertIn("ValueError: sem conexão", entry["exc_info"])
+
+    def test_text_records_end_with_the_extra_fields(self):
+        line = ExtraFormatter().format(make_record(user_id=7, action="sent"))
+
+        self.assertTrue(line.endswith("INFO app_saude: Help sent | user_id=7 action=sent"), line)
+
+    def test_queue_handler_writes_the_formatted_records(self):
+        stream = io.StringIO()
+        handler = QueueListenerHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        handler.handle(make_record(msg="Help sent to %s", args=({"id": 1},), user_id=7))
+        # Drains the queue; stopping is not registered again for exit.
+        handler.listener.stop()
+        atexit.unregister(handler.listener.stop)
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual((entry["message"], entry["user_id"]), ("Help sent to {'id': 1}", 7))
+
+    def test_sampling_keeps_a_fraction_of_the_matching_debug_records(self):
+        sampling = SamplingFilter("request_metrics=0.25, app_saude.views=0, broken")
+
+        with mock.patch("random.random", return_value=0.2):
+            self.assertTrue(sampling.filter(make_record(level=logging.DEBUG, action="request_metrics")))
+        with mock.patch("random.random", return_value=0.3):
+            self.assertFalse(sampling.filter(make_record(level=logging.DEBUG, action="request_metrics")))
+            # The action wins over the logger name; the logger's parents match too.
+            self.assertFalse(sampling.filter(make_record("app_saude.views.help", logging.DEBUG)))
+            self.assertFalse(sampling.filter(make_record("app_saude.views", logging.DEBUG, action="request_metrics")))
+        self.assertEqual(sampling.rates, {"request_metrics": 0.25, "app_saude.views": 0.0})
+
+    def test_sampling_keeps_other_records(self):
+        sampling = SamplingFilter("app_saude=0")
+
+        self.assertTrue(sampling.filter(make_record(level=logging.INFO)))
+        self.assertTrue(sampling.filter(make_record("django.request", logging.DEBUG)))
+        self.assertFalse(sampling.filter(make_record(level=logging.DEBUG)))
+        self.assertTrue(SamplingFilter("").filter(make_record(level=logging.DEBUG)))
+
+
+class PersonProviderLinkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.provider = create_provider()
+        cls.person = create_linked_person(cls.provider, "maria")
+        cls.other_person = Person.objects.create(user=User.objects.create_user(username="joana"))
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+        cache.clear()
+        PersonProviderLink.objects.generation.forget()
+
+    def test_only_person_provider_relationships_are_links(self):
+        # Same ids, another kind of relationship.
+        FactRelationship.objects.create(
+            fact_id_1=self.other_person.person_id,
+            domain_concept_1_id=2000005001,
+            fact_id_2=self.provider.provider_id,
+            domain_concept_2_id=2000005002,
+            relationship_concept_id=2000006003,
+        )
+
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.provider_id), {self.person.person_id})
+        self.assertEqual(PersonProviderLink.objects.providers_for(self.person.person_id), {self.provider.provider_id})
+        self.assertTrue(PersonProviderLink.objects.is_linked(self.person.person_id, self.provider.provider_id))
+        self.assertFalse(PersonProviderLink.objects.is_linked(self.other_person.person_id, self.provider.provider_id))
+        self.assertEqual(PersonProviderLink.objects.count(), 1)
+
+    def test_link_is_idempotent_and_unlink_counts_the_removed_links(self):
+        link, created = PersonProviderLink.objects.link(self.other_person.person_id, self.provider.provider_id)
+        again, created_again = PersonProviderLink.objects.link(self.other_person.person_id, self.provider.provider_id)
+
+        self.assertEqual((created, created_again, again.pk), (True, False, link.pk))
+        self.assertEqual((link.person_id, link.provider_id), (self.other_person.person_id, self.provider.provider_id))
+        self.assertEqual(PersonProviderLink.objects.unlink(self.other_person.person_id, self.provider.provider_id), 1)
+        self.assertEqual(PersonProviderLink.objects.unlink(self.other_person.person_id, self.provider.provider_id), 0)
+        self.assertTrue(PersonProviderLink.objects.is_linked(self.person.person_id, self.provider.provider_id))
+
+
+class LinkedIdsCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.provider = create_provider()
+        cls.other_provider = create_provider("other", registration=2)
+        cls.person = create_linked_person(cls.provider, "maria")
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+        cache.clear()
+        PersonProviderLink.objects.generation.forget()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_id_sets_are_cached(self):
+        PersonProviderLink.objects.persons_for(self.provider.provider_id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.provider_id), {self.person.pk})
+
+    def test_link_and_unlink_invalidate_both_sides(self):
+        self.assertEqual(PersonProviderLink.objects.providers_for(self.person.pk), {self.provider.pk})
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.other_provider.pk), set())
+
+        PersonProviderLink.objects.link(self.person.pk, self.other_provider.pk)
+        self.assertEqual(
+            PersonProviderLink.objects.providers_for(self.person.pk), {self.provider.pk, self.other_provider.pk}
+        )
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.other_provider.pk), {self.person.pk})
+
+        response = self.client_for(self.person.user).post(
+            reverse("person-provider-unlink", args=[self.person.pk, self.provider.pk]), secure=True
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(PersonProviderLink.objects.providers_for(self.person.pk), {self.other_provider.pk})
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), set())
+
+    def test_account_deletion_invalidates_the_providers_sets(self):
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), {self.person.pk})
+
+        response = self.client_for(self.person.user).delete(reverse("account"), secure=True)
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), set())
+
+    def test_moving_a_link_invalidates_its_previous_ids(self):
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), {self.person.pk})
+        self.assertEqual(PersonProviderLink.objects.providers_for(self.person.pk), {self.provider.pk})
+
+        link = FactRelationship.objects.get(fact_id_1=self.person.pk, fact_id_2=self.provider.pk)
+        link.fact_id_2 = self.other_provider.pk
+        link.save()
+
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), set())
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.other_provider.pk), {self.person.pk})
+        self.assertEqual(PersonProviderLink.objects.providers_for(self.person.pk), {self.other_provider.pk})
+
+    def unlink_in_another_worker(self):
+        # What this process sees of an unlink committed elsewhere: the row is gone and the
+        # generation bumped, while its own watch still holds the generation it read before.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {FactRelationship._meta.db_table} WHERE fact_id_1 = %s AND fact_id_2 = %s",
+                [self.person.pk, self.provider.pk],
+            )
+        ProviderHelpCounter.objects.forget(person_id=self.person.pk, provider_id=self.provider.pk)
+        CacheGeneration.objects.bump("person_provider_link")
+
+    def test_unlink_in_another_worker_reaches_the_cached_sets(self):
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), {self.person.pk})
+        self.unlink_in_another_worker()
+
+        with override_settings(CACHE_GENERATION_CHECK_SECONDS=3600):
+            self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), {self.person.pk})
+        with override_settings(CACHE_GENERATION_CHECK_SECONDS=0):
+            self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), set())
+
+    @override_settings(CACHE_GENERATION_CHECK_SECONDS=3600)
+    def test_stale_sets_do_not_authorize_an_unlinked_pair(self):
+        help_observation = create_help(self.person, self.provider, timezone.now())
+        PersonProviderLink.objects.persons_for(self.provider.pk)
+        PersonProviderLink.objects.providers_for(self.person.pk)
+        self.unlink_in_another_worker()
+
+        provider_client = self.client_for(self.provider.user)
+        diaries = provider_client.get(reverse("acs-diaries", args=[self.person.pk]), secure=True)
+        resolve = provider_client.post(reverse("resolve-help", args=[help_observation.pk]), secure=True)
+        send = self.client_for(self.person.user).post(
+            reverse("send-help"),
+            [{"provider": self.provider.pk, "value_as_string": "Preciso de ajuda"}],
+            format="json",
+            secure=True,
+        )
+
+        self.assertEqual(PersonProviderLink.objects.persons_for(self.provider.pk), {self.person.pk})
+        self.assertEqual((diaries.status_code, resolve.status_code, send.status_code), (404, 404, 403))
+        self.assertFalse(ProviderHelpCounter.objects.filter(provider_id=self.provider.pk).exists())
+
+
+class ProviderPersonsViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.provider = create_provider()
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+        self.client = APIClient()
+        self.client.force_authenticate(self.provider.user)
+
+    def add_persons(self, count):
+        now = timezone.now()
+        offset = Person.objects.count()
+        for i in range(offset, offset + count):
+            person = create_linked_person(self.provider, f"person{i}", social_name=f"Pessoa {i:03d}")
+            VisitOccurrence.objects.create(
+                person=person, provider=self.provider, visit_start_date=now - timedelta(days=i)
+            )
+            create_help(person, self.provider, now - timedelta(hours=i))
+
+    def get_persons(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("provider-persons"), params, secure=True)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_patients(self):
+        self.add_persons(2)
+        response, few_patients_queries = self.get_persons()
+        self.assertEqual(len(response.data), 2)
+
+        self.add_persons(25)
+        response, many_patients_queries = self.get_persons(ordering="-last_help_date")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 27)
+        self.assertEqual(few_patients_queries, many_patients_queries)
+
+    def test_summary_uses_latest_visit_and_active_help(self):
+        now = timezone.now()
+        person = create_linked_person(self.provider, "maria", birth_datetime=now - timedelta(days=365 * 30 + 10))
+        VisitOccurrence.objects.create(person=person, provider=self.provider, visit_start_date=now - timedelta(days=3))
+        VisitOccurrence.objects.create(person=person, provider=self.provider, visit_start_date=now - timedelta(days=1))
+        create_help(person, self.provider, now - timedelta(days=2))
+        create_help(person, self.provider, now, active=False)
+        other_provider = create_provider("other", registration=2)
+        VisitOccurrence.objects.create(person=person, provider=other_provider, visit_start_date=now)
+
+        response, _ = self.get_persons()
+
+        self.assertEqual(response.status_code, 200)
+        summary = response.data[0]
+        self.assertEqual(summary["name"], "Maria Silva")
+        self.assertEqual(summary["age"], 30)
+        self.assertEqual(summary["last_visit_date"], (now - timedelta(days=1)).isoformat().replace("+00:00", "Z"))
+        self.assertEqual(summary["last_help_date"], (now - timedelta(days=2)).isoformat().replace("+00:00", "Z"))
+
+    def test_ordering_and_date_filters(self):
+        self.add_persons(4)
+
+        response, _ = self.get_persons(ordering="last_help_date")
+        self.assertEqual([p["name"] for p in response.data], ["Pessoa 003", "Pessoa 002", "Pessoa 001", "Pessoa 000"])
+
+        cutoff = (timezone.now() - timedelta(days=1, hours=12)).isoformat()
+        response, _ = self.get_persons(last_visit_date_after=cutoff)
+        self.assertEqual([p["name"] for p in response.data], ["Pessoa 000", "Pessoa 001"])
+
+    def test_invalid_ordering_is_rejected(self):
+        response, _ = self.get_persons(ordering="age")
+        self.assertEqual(response.status_code, 400)
+
+
+class SendHelpViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.providers = [create_provider(f"provider{i}", registration=i) for i in range(3)]
+        cls.person = create_linked_person(cls.providers[0], "maria")
+        for provider in cls.providers[1:]:
+            FactRelationship.objects.create(
+                fact_id_1=cls.person.person_id,
+                domain_concept_1_id=2000005001,
+                fact_id_2=provider.provider_id,
+                domain_concept_2_id=2000005002,
+                relationship_concept_id=2000004002,
+            )
+        cls.stranger = create_provider("stranger", registration=99)
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+        self.client = APIClient()
+        self.client.force_authenticate(self.person.user)
+
+    def send_help(self, providers, **headers):
+        data = [{"provider": provider.provider_id, "value_as_string": "Preciso de ajuda"} for provider in providers]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("send-help"), data, format="json", secure=True, headers=headers)
+        return response, len(queries)
+
+    def helps(self):
+        return Observation.objects.filter(person=self.person, observation_concept_id=2000007000)
+
+    def test_whole_care_team_is_alerted_with_one_insert(self):
+        response, one_provider_queries = self.send_help(self.providers[:1])
+        self.assertEqual(response.status_code, 201)
+
+        response, care_team_queries = self.send_help(self.providers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(help["provider"] for help in response.data), [p.provider_id for p in self.providers])
+        self.assertEqual(one_provider_queries, care_team_queries)
+        self.assertEqual(self.helps().filter(value_as_concept_id=2000007001).count(), 4)
+
+    def test_retry_with_same_idempotency_key_returns_first_alert(self):
+        first, _ = self.send_help(self.providers, idempotency_key="alert-1")
+        retry, _ = self.send_help(self.providers, idempotency_key="alert-1")
+        other, _ = self.send_help(self.providers[:1], idempotency_key="alert-2")
+
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertNotIn("Idempotent-Replayed", first)
+        self.assertEqual(
+            [help["observation_id"] for help in retry.data], [help["observation_id"] for help in first.data]
+        )
+        self.assertEqual(len(other.data), 1)
+        self.assertEqual(self.helps().count(), 4)
+
+    def test_non_linked_provider_is_rejected(self):
+        response, _ = self.send_help([self.providers[0], self.stranger])
+
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.helps().exists())
+
+    def test_invalid_idempotency_key_is_rejected(self):
+        response, _ = self.send_help(self.providers, idempotency_key="x" * 201)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.helps().exists())
+
+
+class ProviderHelpCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_test_concepts()
+        cls.provider = create_provider()
+        cls.person = create_linked_person(cls.provider, "maria")
+
+    def setUp(self):
+        concept_registry.clear()
+        concept_registry.load()
+        cache.clear()
+        PersonProviderLink.objects.generation.forget()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def send_help(self):
+        data = [{"provider": self.provider.provider_id, "value_as_string": "Preciso de ajuda"}]
+        response = self.client_for(self.person.user).post(reverse("send-help"), data, format="json", secure=True)
+        return response.data[0]["observation_id"]
+
+    def help_count(self):
+        response = self.client_for(self.provider.user).get(reverse("provider-help-count"), secure=True)
+        return response.data["help_count"]
+
+    def counts(self):
+        return ProviderHelpCounter.objects.counts_for(self.provider.provider_id)
+
+    def unlink(self):
+        return self.client_for(self.person.user).post(
+            reverse("person-provider-unlink", args=[self.person.person_id, self.provider.provider_id]), secure=True
+        )
+
+    def test_sent_and_resolved_helps_are_counted(self):
+        help_id = self.send_help()
+        self.send_help()
+        self.assertEqual(self.help_count(), 2)
+
+        resolve = reverse("resolve-help", args=[help_id])
+        self.assertEqual(self.client_for(self.provider.user).post(resolve, secure=True).status_code, 200)
+        self.assertEqual(self.client_for(self.provider.user).post(resolve, secure=True).status_code, 400)
+
+        self.assertEqual(self.help_count(), 1)
+        self.assertEqual(self.counts(), {"active": 1, "resolved": 1, "total": 2})
+        self.assertEqual(ProviderHelpCounter.objects.drift(), [])
+
+    def test_unlink_drops_counter_and_relink_recounts(self):
+        help_id = self.send_help()
+        self.assertEqual(self.unlink().status_code, 200)
+        self.assertFalse(ProviderHelpCounter.objects.filter(person=self.person).exists())
+
+        # A help sent or resolved after passing the link check just before the unlink is not counted.
+        ProviderHelpCounter.objects.record_sent([Observation.objects.get(pk=help_id)])
+        ProviderHelpCounter.objects.record_resolved(Observation.objects.get(pk=help_id))
+        self.assertFalse(ProviderHelpCounter.objects.filter(person=self.person).exists())
+
+        PersonProviderLink.objects.link(self.person.person_id, self.provider.provider_id)
+
+        self.assertEqual(self.counts(), {"active": 1, "resolved": 0, "total": 1})
+
+    def test_account_deletion_drops_counters(self):
+        self.send_help()
+
+        response = self.client_for(self.person.user).delete(reverse("account"), secure=True)
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ProviderHelpCounter.objects.filter(person=self.person).exists())
+
+    def test_help_observations_are_not_written_through_the_generic_endpoint(self):
+        help_id = self.send_help()
+        client = self.client_for(self.person.user)
+        detail = reverse("observation-detail", args=[help_id])
+        data = {"person": self.person.pk, "provider": self.provider.pk, "observation_concept": 2000007000}
+
+        responses = [
+            client.post(reverse("observation-list"), data, format="json", secure=True),
+            client.patch(detail, {"value_as_concept": 2000007002}, format="json", secure=True),
+            client.delete(detail, secure=True),
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [400, 400, 400])
+        self.assertIn("/help/send/", str(responses[0].data["observation_concept"]))
+        self.assertEqual(self.counts(), {"active": 1, "resolved": 0, "total": 1})
+        self.assertEqual(ProviderHelpCounter.objects.drift(), [])
+
+    def test_moving_a_link_moves_its_counts(self):
+        self.send_help()
+        other = create_provider("other", registration=2)
+        create_help(self.person, other, timezone.now(), active=False)
+        link = PersonProviderLink.objects.between(self.person.person_id, self.provider.provider_id).get()
+
+        link.fact_id_2 = other.provider_id
+        link.save()
+
+        self.assertFalse(ProviderHelpCounter.objects.filter(provider=self.provider).exists())
+        self.assertEqual(
+            ProviderHelpCounter.objects.counts_for(other.provider_id), {"active": 0, "resolved": 1, "total": 1}
+        )
+        self.assertEqual(ProviderHelpCounter.objects.drift(), [])
+
+    def test_a_row_turned_into_or_out_of_a_link_updates_the_counts(self):
+        self.send_help()
+        link = FactRelationship.objects.get(fact_id_1=self.person.person_id, fact_id_2=self.provider.provider_id)
+
+        link.relationship_concept_id = 2000006000
+        link.save()
+        self.assertEqual(self.counts(), {"active": 0, "resolved": 0, "total": 0})
+
+        link.relationship_concept_id = 2000004002
+        link.save()
+        self.assertEqual(self.counts(), {"active": 1, "resolved": 0, "total": 1})
+        self.assertEqual(ProviderHelpCounter.objects.drift(), [])
+
+    def test_generated_populations_are_counted(self):
+        PopulationGenerator(PopulationSpec(persons=20, providers=3, helps_per_person=3, seed=1)).generate()
+
+        self.assertTrue(ProviderHelpCounter.objects.exclude(provider=self.provider).exists())
+        self.assertEqual(ProviderHelpCounter.objects.drift(), [])
+
+    def test_reconcile_repairs_drift(self):
+        self.send_help()
+        create_help(self.person, self.provider, timezone.now(), active=False)
+        stranger = create_provider("stranger", registration=2)
+        ProviderHelpCounter.objects.create(provider=stranger, person=self.person, active_count=3)
+        out = io.StringIO()
+
+        call_command("reconcile_help_counters", "--dry-run", stdout=out)
+        self.assertEqual(len(ProviderHelpCounter.objects.drift()), 2)
+
+        call_command("reconcile_help_counters", stdout=out)
+        self.assertEqual(ProviderHelpCounter.objects.drift(), [])
+        self.assertEqual(self.counts(), {"active": 1, "resolved": 1, "total": 2})
+        self.assertFalse(ProviderHelpCounter.objects.filter(provider=stranger).exists())
+        self.assertIn("2 contadores corrigidos", out.getvalue())
+
+
+class HelpEventStreamTests(TransactionTestCase):
+    """End to end through Postgres: NOTIFY is only delivered on commit, hence no TestCase."""
+
+    @classmethod
+    def tearDownClass(cls):
+        # The listener's connection would keep the test database from being dropped.
+        help_event_broker.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        create_test_concepts()
+        concept_registry.clear()
+        concept_registry.load()
+        self.provider = create_provider()
+        self.person = create_linked_person(self.provider, "maria")
+
+    def send_help(self, person=None, provider=None):
+        client = APIClient()
+        client.force_authenticate((person or self.person).user)
+        data = [{"provider": (provider or self.provider).provider_id, "value_as_string": "Preciso de ajuda"}]
+        return client.post(reverse("send-help"), data, format="json", secure=True).data[0]["observation_id"]
+
+    def resolve_help(self, help_id):
+        client = APIClient()
+        client.force_authenticate(self.provider.user)
+        return client.post(reverse("resolve-help", args=[help_id]), secure=True)
+
+    async def open_stream(self):
+        token = await sync_to_async(AccessToken.for_user)(self.provider.user)
+        return await self.async_client.get(
+            reverse("provider-help-stream"),
+            secure=True,
+            headers={"Authorization": f"Bearer {token}", "Accept": "text/event-stream"},
+        )
+
+    async def test_stream_pushes_created_and_resolved_helps(self):
+        response = await self.open_stream()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = response.streaming_content
+        try:
+            self.assertEqual(await anext(stream), b"retry: 5000\n\n")
+            self.assertEqual(await anext(stream), b'event: help_count\ndata: {"help_count": 0}\n\n')
+            self.assertTrue(await asyncio.to_thread(help_event_broker.listening.wait, 5))
+
+            help_id = await sync_to_async(self.send_help)()
+            created = await asyncio.wait_for(anext(stream), 5)
+            resolved = await sync_to_async(self.resolve_help)(help_id)
+            self.assertEqual(resolved.status_code, 200)
+            resolved = await asyncio.wait_for(anext(stream), 5)
+        finally:
+            await stream.aclose()
+
+        ids = f'{{"observation_id": {help_id}, "person_id": {self.person.person_id}, "provider_id": {self.provider.provider_id}}}'
+        self.assertEqual(created.decode(), f"event: help_created\ndata: {ids}\n\n")
+        self.assertEqual(resolved.decode(), f"event: help_resolved\ndata: {ids}\n\n")
+
+    async def test_other_providers_events_are_not_streamed(self):
+        other_provider = await sync_to_async(create_provider)("other", registration=2)
+        other_person = await sync_to_async(create_linked_person)(other_provider, "joao")
+        response = await self.open_stream()
+        stream = response.streaming_content
+        try:
+            await anext(stream)
+            await anext(stream)
+            self.assertTrue(await asyncio.to_thread(help_event_broker.listening.wait, 5))
+
+            await sync_to_async(self.send_help)(other_person, other_provider)
+            help_id = await sync_to_async(self.send_help)()
+            event = await asyncio.wait_for(anext(stream), 5)
+        finally:
+            await stream.aclose()
+
+        self.assertIn(f'"observation_id": {help_id}'.encode(), event)
+
+    async def test_helps_are_counted_once_the_listener_is_listening(self):
+        await asyncio.to_thread(help_event_broker.stop)
+        connection_params = help_events.listen_connection_params
+
+        def slow_connection_params():
+            time.sleep(0.5)
+            return connection_params()
+
+        listening_when_counted = []
+
+        def count_active_helps(provider_id):
+            listening_when_counted.append(help_event_broker.listening.is_set())
+            return 0
+
+        with (
+            mock.patch.object(help_events, "listen_connection_params", slow_connection_params),
+            mock.patch("app_saude.views.help_views.count_active_helps", count_active_helps),
+        ):
+            response = await self.open_stream()
+        await response.streaming_content.aclose()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(listening_when_counted, [True])
+
+    async def test_stream_is_unavailable_while_the_listener_cannot_connect(self):
+        with mock.patch.object(help_event_broker, "wait_listening", mock.AsyncMock(return_value=False)):
+            response = await self.open_stream()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertNotIn(self.provider.provider_id, help_event_broker._subscriptions)
+
+    def test_wsgi_server_answers_not_implemented(self):
+        client = APIClient()
+        client.force_authenticate(self.provider.user)
+
+        response = client.get(reverse("provider-help-stream"), secure=True)
+
+        self.assertEqual(response.status_code, 501)
+
+
+class FakeGoogleAuthClient:
+    """
+    Local stand-in for libs.google.GoogleAuthClient: the token (or code) is
+    the user's email, and "invalid" is rejected like a bad ID token.
+    """
+
+    async def get_user_data(self, validated_data):
+        email = validated_data.get("token") or validated_data.get("code")
+        if email == "invalid":
+            raise ValueError("ID token inválido")
+        return GoogleUserData(
+            email=email, given_name="Maria", family_name="Lima", picture="https://example.com/maria.png"
+        )
+
+
+@override_settings(GOOGLE_AUTH_CLIENT="app_saude.tests.FakeGoogleAuthClient")
+class GoogleLoginViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username="ana@example.com", email="ana@example.com")
+        cls.provider = Provider.objects.create(user=user, social_name="Dra. Ana", professional_registration=1)
+
+    async def login(self, **data):
+        return await self.async_client.post("/auth/login/google/", data, content_type="application/json", secure=True)
+
+    async def test_first_login_creates_user_without_role(self):
+        response = await self.login(token="maria@example.com")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["role"], "none")
+        self.assertEqual(body["full_name"], "Maria Lima")
+        user = await User.objects.aget(pk=body["user_id"])
+        self.assertEqual(user.email, "maria@example.com")
+        self.assertIn("refresh", body)
+
+    async def test_provider_login_updates_profile(self):
+        response = await self.login(code="ana@example.com")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["role"], body["provider_id"]), ("provider", self.provider.provider_id))
+        self.assertEqual(body["full_name"], "Dra. Ana")
+        provider = await Provider.objects.select_related("user").aget(pk=self.provider.pk)
+        self.assertEqual(provider.profile_picture, "https://example.com/maria.png")
+        self.assertEqual(provider.user.first_name, "Maria")
+
+    async def test_rejected_token(self):
+        response = await self.login(token="invalid")
+
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(await User.objects.filter(username="invalid").aexists())
+
+
+def make_signing_key(key_id):
+    """An RSA signer and its public key in the format of Google's certs endpoint."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return crypt.RSASigner.from_string(private_pem, key_id=key_id), public_pem.decode()
+
+
+@override_settings(GOOGLE_OAUTH2_CLIENT_ID="test-client", GOOGLE_ID_TOKEN_CACHE_TIMEOUT=60)
+class GoogleIdTokenVerificationTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.signer, cls.public_key = make_signing_key("key-1")
+        cls.rotated_signer, cls.rotated_public_key = make_signing_key("key-2")
+
+    def setUp(self):
+        cache.clear()
+        # Local stand-in for Google's certs endpoint.
+        self.certs = {"key-1": self.public_key}
+        self.max_age = 3600
+        self.fetches = 0
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(self.certs_endpoint))
+        patcher = mock.patch("libs.google.google_http_client", return_value=http_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.google = GoogleAuthClient()
+
+    def certs_endpoint(self, request):
+        self.fetches += 1
+        return httpx.Response(200, json=self.certs, headers={"Cache-Control": f"public, max-age={self.max_age}"})
+
+    def id_token(self, signer=None, **claims):
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com",
+            "aud": "test-client",
+            "iat": now,
+            "exp": now + 3600,
+            "email": "maria@example.com",
+            **claims,
+        }
+        return jwt.encode(signer or self.signer, payload).decode()
+
+    async def test_certs_are_cached_for_their_max_age(self):
+        first = await self.google.verify_id_token(self.id_token(email="maria@example.com"))
+        second = await self.google.verify_id_token(self.id_token(email="joao@example.com"))
+
+        self.assertEqual((first["email"], second["email"]), ("maria@example.com", "joao@example.com"))
+        self.assertEqual(self.fetches, 1)
+
+    async def test_certs_without_max_age_are_not_cached(self):
+        self.max_age = 0
+
+        await self.google.verify_id_token(self.id_token(email="maria@example.com"))
+        await self.google.verify_id_token(self.id_token(email="joao@example.com"))
+
+        self.assertEqual(self.fetches, 2)
+
+    async def test_verified_token_is_reused(self):
+        token = self.id_token()
+
+        with mock.patch("libs.google.jwt.decode", wraps=jwt.decode) as decode:
+            for _ in range(3):
+                idinfo = await self.google.verify_id_token(token)
+
+        self.assertEqual(idinfo["email"], "maria@example.com")
+        self.assertEqual(decode.call_count, 1)
+
+    async def test_rotated_key_refetches_certs_once(self):
+        await self.google.verify_id_token(self.id_token())
+        self.certs["key-2"] = self.rotated_public_key
+
+        idinfo = await self.google.verify_id_token(self.id_token(signer=self.rotated_signer))
+        self.assertEqual(idinfo["email"], "maria@example.com")
+        self.assertEqual(self.fetches, 2)
+
+        unknown_signer, _ = make_signing_key("key-3")
+        with self.assertRaises(ValueError):
+            await self.google.verify_id_token(self.id_token(signer=unknown_signer))
+        self.assertEqual(self.fetches, 2)
+
+    async def test_invalid_tokens_are_rejected_and_not_cached(self):
+        forged_signer, _ = make_signing_key("key-1")
+        for token in [self.id_token(aud="other-client"), self.id_token(signer=forged_signer)]:
+            with mock.patch("libs.google.jwt.decode", wraps=jwt.decode) as decode:
+                for _ in range(2):
+                    with self.assertRaises(ValueError):
+                        await self.google.verify_id_token(token)
+            self.assertEqual(decode.call_count, 2)
@@ -0,0 +1,228 @@
+import logging
+import math
+import random
+import re
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+from unittest import mock
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ..models import Observation, PersonProviderLink, ProviderHelpCounter
+from .population import population_users
+
+logger = logging.getLogger("app_saude")
+
+# Query count reported by RequestMetricsMiddleware in the Server-Timing header.
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of ``values`` (0 < percent <= 100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    durations: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    errors: int = 0
+
+    def add(self, duration, query_count, status_code):
+        self.durations.append(duration)
+        self.queries.append(query_count)
+        if status_code >= 400:
+            self.errors += 1
+
+    def summary(self) -> dict:
+        return {
+            "scenario": self.name,
+            "requests": len(self.durations),
+            "errors": self.errors,
+            "p50_ms": round(percentile(self.durations, 50) * 1000, 1),
+            "p95_ms": round(percentile(self.durations, 95) * 1000, 1),
+            "max_ms": round(max(self.durations) * 1000, 1),
+            "queries_p50": statistics.median_low(self.queries),
+            "queries_max": max(self.queries),
+        }
+
+
+class Benchmark:
+    """
+    Run the API scenarios in-process against a generated population (see
+    generate_population) and collect latency and query counts per endpoint.
+
+    Requests go through the full Django stack (middleware, authentication,
+    serializers) with the test client; only DRF throttling is switched off,
+    since a benchmark would otherwise exhaust the per-user rate. The same
+    ``seed`` picks the same users, so runs are comparable.
+
+    With ``base_url`` the requests are sent over HTTP to a running server
+    (e.g. gunicorn) that uses the same database, authenticated with JWTs, so
+    the latency also covers what happens outside the view: opening database
+    connections, the WSGI server, the network. The query counts then come
+    from the Server-Timing header, and the server's throttling still applies.
+    """
+
+    def __init__(self, label="pop", iterations=20, warmup=2, seed=0, base_url=None):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.rng = random.Random(seed)
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.session = requests.Session() if base_url else None
+        self.tokens = {}
+        persons, providers = population_users(label)
+        self.persons = list(persons[:1000])
+        self.providers = list(providers)
+        self.results = {}
+
+    @property
+    def busiest_provider(self):
+        return self.providers[0]
+
+    def request(self, user, method, path, data=None, record_as=None, headers=None):
+        """Send one request and return its status code and decoded body."""
+        if self.base_url:
+            status_code, body, duration, query_count = self.http_request(user, method, path, data, headers)
+        else:
+            client = APIClient(raise_request_exception=False)
+            client.force_authenticate(user)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                if method == "get":
+                    response = client.get(path, data, secure=True, headers=headers)
+                else:
+                    response = getattr(client, method)(path, data, format="json", secure=True, headers=headers)
+                duration = time.perf_counter() - started
+            status_code, body, query_count = response.status_code, getattr(response, "data", None), len(queries)
+        if record_as:
+            self.results.setdefault(record_as, ScenarioResult(record_as)).add(duration, query_count, status_code)
+        return status_code, body
+
+    def http_request(self, user, method, path, data, headers=None):
+        token = self.tokens.get(user.pk)
+        if token is None:
+            token = self.tokens[user.pk] = str(AccessToken.for_user(user))
+        started = time.perf_counter()
+        response = self.session.request(
+            method.upper(),
+            self.base_url + path,
+            params=data if method == "get" else None,
+            json=data if method != "get" else None,
+            headers={**(headers or {}), "Authorization": f"Bearer {token}"},
+        )
+        duration = time.perf_counter() - started
+        match = SERVER_TIMING_QUERIES.search(response.headers.get("Server-Timing", ""))
+        is_json = response.headers.get("Content-Type", "").startswith("application/json")
+        return response.status_code, response.json() if is_json else None, duration, int(match[1]) if match else 0
+
+    # Scenarios: each call performs one iteration and records its requests.
+
+    def scenario_diaries(self, record):
+        person = self.rng.choice(self.persons)
+        self.request(person.user, "get", reverse("diary"), record_as=record and "diaries")
+
+    def scenario_provider_persons(self, record):
+        provider = self.busiest_provider
+        self.request(provider.user, "get", reverse("provider-persons"), record_as=record and "provider-persons")
+
+    def scenario_provider_help(self, record):
+        provider = self.busiest_provider
+        self.request(provider.user, "get", reverse("get-help"), record_as=record and "provider-help")
+
+    def scenario_help_count(self, record):
+        provider = self.busiest_provider
+        self.request(provider.user, "get", reverse("provider-help-count"), record_as=record and "help-count")
+
+    def scenario_concepts(self, record):
+        person = self.rng.choice(self.persons)
+        self.request(
+            person.user,
+            "get",
+            reverse("concept-list"),
+            {"class": "Gender,Race,Ethnicity", "lang": "297504001"},
+            record_as=record and "concepts",
+        )
+
+    def scenario_linking(self, record):
+        # A pair that is not linked yet, so the unlink at the end leaves the data as it was.
+        for _ in range(100):
+            provider = self.rng.choice(self.providers)
+            person = self.rng.choice(self.persons)
+            if not PersonProviderLink.objects.is_linked(person.person_id, provider.provider_id):
+                break
+        else:
+            raise ValueError("Every sampled person is already linked; generate more providers.")
+        status_code, body = self.request(
+            provider.user, "post", reverse("generate-link-code"), record_as=record and "link-code"
+        )
+        code = body.get("code") if status_code < 300 else None
+        self.request(person.user, "post", reverse("person-link-code"), {"code": code}, record_as=record and "link")
+        self.request(
+            person.user,
+            "post",
+            reverse("person-provider-unlink", args=[person.person_id, provider.provider_id]),
+            record_as=record and "unlink",
+        )
+
+    def scenario_send_help(self, record):
+        # A person alerting their whole care team, then the app retrying the same alert.
+        person = self.rng.choice(self.persons)
+        data = [
+            {"provider": provider_id, "value_as_string": "Preciso de ajuda"}
+            for provider_id in sorted(PersonProviderLink.objects.providers_for(person.person_id))
+        ]
+        headers = {"Idempotency-Key": str(uuid.UUID(int=self.rng.getrandbits(128)))}
+        status_code, body = self.request(
+            person.user, "post", reverse("send-help"), data, record_as=record and "send-help", headers=headers
+        )
+        self.request(
+            person.user, "post", reverse("send-help"), data, record_as=record and "send-help-retry", headers=headers
+        )
+        if status_code < 300:
+            # Deleting the helps leaves them in the counters: recount the pairs.
+            with transaction.atomic():
+                Observation.objects.filter(pk__in=[help["observation_id"] for help in body]).delete()
+                for item in data:
+                    ProviderHelpCounter.objects.rebuild(person_id=person.person_id, provider_id=item["provider"])
+
+    SCENARIOS = {
+        "diaries": scenario_diaries,
+        "provider-persons": scenario_provider_persons,
+        "provider-help": scenario_provider_help,
+        "help-count": scenario_help_count,
+        "concepts": scenario_concepts,
+        "linking": scenario_linking,
+        "send-help": scenario_send_help,
+    }
+
+    def run(self, scenarios=None) -> list:
+        if not self.persons or not self.providers:
+            raise ValueError("No synthetic population found; run generate_population first.")
+
+        hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        with override_settings(ALLOWED_HOSTS=hosts), mock.patch.object(APIView, "check_throttles"):
+            for name in scenarios or self.SCENARIOS:
+                scenario = self.SCENARIOS[name]
+                for _ in range(self.warmup):
+                    scenario(self, record=False)
+                for _ in range(self.iterations):
+                    scenario(self, record=True)
+
+        summaries = [result.summary() for result in self.results.values()]
+        logger.info("Benchmark finished", extra={"results": summaries, "action": "benchmark_finished"})
+        return summaries
@@ -1,11 +1,149 @@
-from app_saude.models import Concept
+import logging
+import threading
+
+from app_saude.models import Concept, ConceptRelationship, ConceptSynonym
+from django.db.models import Prefetch
+
+from .generations import GenerationWatch
+
+logger = logging.getLogger(__name__)
+
+# Concepts created by this project (see seed_concepts) live in the 2-billion
+# range reserved by OMOP for site-specific concepts. Those are the ones the
+# views resolve on every request, so they are loaded in bulk; anything else
+# (e.g. imported Athena vocabularies) is fetched on first use and memoised.
+LOCAL_CONCEPT_ID_START = 2_000_000_000
+
+
+class ConceptRegistry:
+    """
+    Process-wide cache of Concept rows keyed by concept_code and concept_id.
+
+    The registry is filled with a single query on first use and kept warm for
+    the lifetime of the process. Saves and deletes on Concept clear it through
+    the signal handlers in app_saude.signals and bump its generation, which
+    makes the other processes reload it too (see GenerationWatch); so does
+    the refresh_concepts command.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._by_id = {}
+        self._by_code = {}
+        self._ambiguous_codes = set()
+        self._loaded = False
+        self.generation = GenerationWatch("concepts")
+        self._loaded_generation = None
+
+    def load(self):
+        """Replace the registry contents with the local concepts from the database."""
+        # Read before the concepts, so a change committed in between triggers another reload.
+        generation = self.generation.read()
+        by_id = {}
+        by_code = {}
+        ambiguous_codes = set()
+        for concept in Concept.objects.filter(concept_id__gte=LOCAL_CONCEPT_ID_START):
+            by_id[concept.concept_id] = concept
+            if concept.concept_code in by_code:
+                ambiguous_codes.add(concept.concept_code)
+            by_code[concept.concept_code] = concept
+
+        for code in ambiguous_codes:
+            by_code.pop(code, None)
+
+        with self._lock:
+            self._by_id = by_id
+            self._by_code = by_code
+            self._ambiguous_codes = ambiguous_codes
+            self._loaded = True
+            self._loaded_generation = generation
+
+        logger.debug(
+            "Concept registry loaded",
+            extra={"concepts_count": len(by_id), "generation": generation, "action": "concept_registry_loaded"},
+        )
+        return len(by_id)
+
+    def clear(self):
+        """Drop every cached concept; the next lookup reloads the registry."""
+        with self._lock:
+            self._by_id = {}
+            self._by_code = {}
+            self._ambiguous_codes = set()
+            self._loaded = False
+
+    def invalidate(self):
+        """Clear the registry in this process and, by bumping its generation, in every other one."""
+        self.clear()
+        self.generation.bump()
+
+    def _stale(self):
+        return not self._loaded or self.generation.current() != self._loaded_generation
+
+    def _ensure_loaded(self):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self.load()
+
+    def get_by_id(self, concept_id: int) -> Concept:
+        self._ensure_loaded()
+        concept = self._by_id.get(concept_id)
+        if concept is None:
+            concept = Concept.objects.get(concept_id=concept_id)
+            with self._lock:
+                self._by_id[concept.concept_id] = concept
+        return concept
+
+    def get_by_code(self, concept_code: str) -> Concept:
+        self._ensure_loaded()
+        concept = self._by_code.get(concept_code)
+        if concept is None:
+            # Codes shared by several concepts keep the original behaviour of
+            # Concept.objects.get(), including MultipleObjectsReturned.
+            concept = Concept.objects.get(concept_code=concept_code)
+            if concept_code not in self._ambiguous_codes:
+                with self._lock:
+                    self._by_code[concept_code] = concept
+                    self._by_id[concept.concept_id] = concept
+        return concept
+
+
+concept_registry = ConceptRegistry()
 
 
 def get_concept_by_id(concept_id: int) -> Concept:
-    print(f"Fetching concept with ID: {concept_id}")
-    return Concept.objects.get(concept_id=concept_id)
+    return concept_registry.get_by_id(concept_id)
 
 
 def get_concept_by_code(concept_code: str) -> Concept:
-    print(f"Fetching concept with code: {concept_code}")
-    return Concept.objects.get(concept_code=concept_code)
+    return concept_registry.get_by_code(concept_code)
+
+
+def translated_synonyms_prefetch(lang: str, lookup: str = "concept_synonym_concept_set") -> Prefetch:
+    """Prefetch the synonyms in language ``lang`` into ``translated_synonyms``."""
+    return Prefetch(
+        lookup,
+        queryset=ConceptSynonym.objects.filter(language_concept__concept_code=lang),
+        to_attr="translated_synonyms",
+    )
+
+
+def get_related_concepts(concept_ids, relationship_id: str, lang: str) -> dict[int, Concept]:
+    """
+    Map each concept id to the concept it points to through ``relationship_id``.
+
+    One query for the relationships plus one for the translated synonyms of the
+    targets, whatever the number of concepts. When a concept has several
+    relationships of that kind the oldest one wins.
+    """
+    relationships = (
+        ConceptRelationship.objects.filter(relationship_id=relationship_id, concept_1_id__in=concept_ids)
+        .select_related("concept_2")
+        .prefetch_related(translated_synonyms_prefetch(lang, "concept_2__concept_synonym_concept_set"))
+        .order_by("pk")
+    )
+    related = {}
+    for relationship in relationships:
+        related.setdefault(relationship.concept_1_id, relationship.concept_2)
+    return related
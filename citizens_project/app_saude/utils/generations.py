@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import CacheGeneration
+
+
+class GenerationWatch:
+    """
+    What this process last read of one CacheGeneration row.
+
+    The row is read again at most once every CACHE_GENERATION_CHECK_SECONDS,
+    so a cache kept in process memory notices within that delay that another
+    process invalidated it, for the price of one primary-key lookup.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.generation = None
+        self.checked_at = None
+
+    def read(self) -> int:
+        self.generation = CacheGeneration.objects.current(self.name)
+        self.checked_at = time.monotonic()
+        return self.generation
+
+    def current(self) -> int:
+        """The generation, re-read from the database once the last read is older than the check interval."""
+        if self.checked_at is None or time.monotonic() - self.checked_at >= settings.CACHE_GENERATION_CHECK_SECONDS:
+            return self.read()
+        return self.generation
+
+    def forget(self):
+        """Re-read the generation on the next current()."""
+        self.checked_at = None
+
+    def bump(self):
+        """Invalidate the cache in every process: this one at once, the others once the transaction commits."""
+        CacheGeneration.objects.bump(self.name)
+        self.forget()
+        transaction.on_commit(self.forget)
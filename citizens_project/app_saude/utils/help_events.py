@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+import psycopg
+from django.db import connection, connections
+
+logger = logging.getLogger("app_saude")
+
+# Postgres channel carrying one JSON notification per created or resolved help request.
+HELP_EVENTS_CHANNEL = "help_events"
+
+# Events a slow SSE client may fall behind before new ones are dropped for it.
+SUBSCRIPTION_QUEUE_SIZE = 100
+# Seconds between attempts to reopen the LISTEN connection.
+RECONNECT_DELAY = 2
+# Seconds a notifies() call blocks before the listener checks whether it should stop.
+LISTEN_POLL_INTERVAL = 1
+# Seconds a new stream waits for the listener to be LISTENing before it gives up.
+LISTEN_READY_TIMEOUT = 5
+# Milliseconds EventSource clients wait before reconnecting a dropped stream.
+SSE_RETRY_MS = 5000
+# Seconds of silence after which a stream sends a comment, so proxies keep it open.
+SSE_HEARTBEAT_INTERVAL = 20
+
+
+def notify_help_events(event, observations):
+    """
+    NOTIFY the help_events channel about ``observations`` (one message each).
+
+    Postgres delivers the messages when the surrounding transaction commits
+    and drops them on rollback, so listeners never see an uncommitted help.
+    """
+    payloads = [
+        json.dumps(
+            {
+                "event": event,
+                "observation_id": observation.observation_id,
+                "person_id": observation.person_id,
+                "provider_id": observation.provider_id,
+            }
+        )
+        for observation in observations
+    ]
+    if not payloads:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload", [HELP_EVENTS_CHANNEL, payloads]
+        )
+
+
+class Subscription:
+    """
+    Events for one provider, handed from the listener thread to an SSE
+    stream running on ``loop``.
+    """
+
+    def __init__(self, provider_id, loop):
+        self.provider_id = provider_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The stream's event loop is gone; unsubscribe will follow.
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning(
+                "Help event dropped for slow stream",
+                extra={"provider_id": self.provider_id, "event": event, "action": "help_event_dropped"},
+            )
+
+
+class HelpEventBroker:
+    """
+    Per-process fan-out of help_events notifications to SSE subscribers.
+
+    One daemon thread per process keeps a dedicated connection (outside the
+    pool) LISTENing on the channel, started by the first subscription. Each
+    notification goes to the subscriptions of its provider. When the
+    connection drops, the thread reconnects and sends every subscriber a
+    ``resync`` event, since notifications sent in between are lost.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._thread = None
+        self._stopping = threading.Event()
+        self.listening = threading.Event()
+
+    def subscribe(self, provider_id) -> Subscription:
+        subscription = Subscription(provider_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[provider_id].add(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._listen, name="help-events-listener", daemon=True)
+                self._thread.start()
+        return subscription
+
+    async def wait_listening(self, timeout=LISTEN_READY_TIMEOUT) -> bool:
+        """Wait, off the event loop, until the listener has run LISTEN; False on timeout."""
+        if self.listening.is_set():
+            return True
+        return await asyncio.to_thread(self.listening.wait, timeout)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.provider_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.provider_id]
+
+    def publish(self, event):
+        with self._lock:
+            if event["event"] == "resync":
+                subscriptions = [
+                    s for provider_subscriptions in self._subscriptions.values() for s in provider_subscriptions
+                ]
+            else:
+                subscriptions = list(self._subscriptions.get(event["provider_id"], ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def stop(self, timeout=None):
+        """Stop the listener thread and close its connection (used by tests)."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.listening.clear()
+
+    def _listen(self):
+        connected_before = False
+        while not self._stopping.is_set():
+            try:
+                with psycopg.connect(**listen_connection_params(), autocommit=True) as listen_connection:
+                    listen_connection.execute(f"LISTEN {HELP_EVENTS_CHANNEL}")
+                    self.listening.set()
+                    if connected_before:
+                        self.publish({"event": "resync"})
+                    connected_before = True
+                    logger.info("Listening for help events", extra={"action": "help_events_listening"})
+                    while not self._stopping.is_set():
+                        for notify in listen_connection.notifies(timeout=LISTEN_POLL_INTERVAL):
+                            self.publish(json.loads(notify.payload))
+            except psycopg.Error as e:
+                self.listening.clear()
+                logger.warning(
+                    "Help events listener disconnected",
+                    extra={"error": str(e), "error_type": type(e).__name__, "action": "help_events_disconnected"},
+                )
+                self._stopping.wait(RECONNECT_DELAY)
+        self.listening.clear()
+
+
+def listen_connection_params() -> dict:
+    """Connection arguments of the default database, for a psycopg connection of its own."""
+    settings_dict = connections["default"].settings_dict
+    params = {
+        "dbname": settings_dict["NAME"],
+        "user": settings_dict["USER"],
+        "password": settings_dict["PASSWORD"],
+        "host": settings_dict["HOST"] or None,
+        "port": settings_dict["PORT"] or None,
+    }
+    if "connect_timeout" in settings_dict["OPTIONS"]:
+        params["connect_timeout"] = settings_dict["OPTIONS"]["connect_timeout"]
+    return params
+
+
+def close_request_connection():
+    """Give the calling thread's database connection back (to the pool, when there is one)."""
+    connection.close()
+
+
+def format_sse_event(event, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def help_event_stream(subscription, help_count):
+    """
+    Body of a provider's SSE stream: the current active help count, then one
+    event per help created for or resolved by the provider.
+    """
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        yield format_sse_event("help_count", {"help_count": help_count})
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), SSE_HEARTBEAT_INTERVAL)
+            except TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse_event(event["event"], {key: value for key, value in event.items() if key != "event"})
+    finally:
+        help_event_broker.unsubscribe(subscription)
+
+
+help_event_broker = HelpEventBroker()
@@ -0,0 +1,164 @@
+import json
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+
+from django.db import connection
+from django.db.models import Count, Max, QuerySet
+from django.utils import timezone
+
+from ..models import Observation, PersonProviderLink, Provider
+from .concept import get_concept_by_code
+
+PAGE_SIZE = 20
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    """
+    A query the API runs on (almost) every request of an endpoint, built the
+    way the view builds it, and the index that should serve it.
+    """
+
+    name: str
+    index: str
+    build: Callable[[dict], QuerySet]
+
+
+def concept_id(code):
+    return get_concept_by_code(code).concept_id
+
+
+HOT_QUERIES = [
+    HotQuery(
+        "diaries",
+        "idx_obs_diary_person_date",
+        lambda sample: Observation.objects.filter(
+            person_id=sample["person_id"], observation_concept_id=concept_id("diary_entry")
+        ).order_by("-observation_date", "-observation_id")[:PAGE_SIZE],
+    ),
+    HotQuery(
+        "shared-diaries",
+        "idx_obs_diary_person_date",
+        lambda sample: Observation.objects.filter(
+            person_id=sample["person_id"],
+            observation_concept_id=concept_id("diary_entry"),
+            shared_with_provider=True,
+        ).order_by("-observation_date", "-observation_id")[:PAGE_SIZE],
+    ),
+    HotQuery(
+        "received-helps",
+        "idx_obs_help_provider_date",
+        lambda sample: Observation.objects.filter(
+            provider_id=sample["provider_id"],
+            person_id__in=sample["linked_person_ids"],
+            observation_concept_id=concept_id("HELP"),
+        ).order_by("-observation_date", "-observation_id")[:PAGE_SIZE],
+    ),
+    HotQuery(
+        "last-active-help",
+        "idx_obs_help_active",
+        lambda sample: Observation.objects.filter(
+            provider_id=sample["provider_id"],
+            person_id__in=sample["linked_person_ids"],
+            observation_concept_id=concept_id("HELP"),
+            value_as_concept_id=concept_id("ACTIVE"),
+            observation_date__isnull=False,
+        )
+        .values("person_id")
+        .annotate(last=Max("observation_date")),
+    ),
+    HotQuery(
+        "help-replay",
+        "idx_obs_help_idempotency",
+        lambda sample: Observation.objects.filter(
+            person_id=sample["person_id"],
+            observation_concept_id=concept_id("HELP"),
+            observation_source_value="idempotency-key:00000000-0000-0000-0000-000000000000",
+        ),
+    ),
+    HotQuery(
+        "link-code",
+        "idx_obs_link_code",
+        lambda sample: Observation.objects.filter(
+            value_as_string=sample["link_code"],
+            observation_concept_id=concept_id("PROVIDER_LINK_CODE"),
+            observation_date__gte=timezone.now() - timedelta(minutes=10),
+        ).order_by("-observation_date")[:1],
+    ),
+    HotQuery(
+        "provider-link-code",
+        "idx_obs_link_code_provider",
+        lambda sample: Observation.objects.filter(
+            person=None,
+            provider_id=sample["provider_id"],
+            observation_concept_id=concept_id("PROVIDER_LINK_CODE"),
+            observation_type_concept_id=concept_id("CLINICIAN_GENERATED"),
+        ),
+    ),
+    HotQuery(
+        "interest-areas",
+        "idx_obs_interest_area_person",
+        lambda sample: Observation.objects.filter(
+            person_id=sample["person_id"], observation_concept_id=concept_id("INTEREST_AREA")
+        ).order_by("-observation_date"),
+    ),
+]
+
+
+def most_frequent(queryset: QuerySet, field: str):
+    """The value of ``field`` found in most rows of ``queryset``."""
+    return queryset.values(field).annotate(rows=Count("pk")).order_by("-rows").values_list(field, flat=True).first()
+
+
+def sample_parameters() -> dict:
+    """
+    Parameters for the hot queries, taken from the data so the plans are the
+    ones the heaviest users get: the provider with the most helps and its
+    linked persons, the person with the most diaries and a link code.
+    """
+    provider_id = (
+        most_frequent(
+            Observation.objects.filter(observation_concept_id=concept_id("HELP"), provider__isnull=False), "provider_id"
+        )
+        or Provider.objects.values_list("provider_id", flat=True).first()
+    )
+    linked_person_ids = sorted(PersonProviderLink.objects.persons_for(provider_id)) if provider_id else []
+    person_id = most_frequent(
+        Observation.objects.filter(observation_concept_id=concept_id("diary_entry"), person__isnull=False), "person_id"
+    )
+    link_code = (
+        Observation.objects.filter(observation_concept_id=concept_id("PROVIDER_LINK_CODE"))
+        .values_list("value_as_string", flat=True)
+        .first()
+    )
+    return {
+        "provider_id": provider_id or 0,
+        "person_id": person_id or 0,
+        "linked_person_ids": linked_person_ids or [0],
+        "link_code": link_code or "000000",
+    }
+
+
+def indexes_in_plan(plan: dict) -> set[str]:
+    """Names of the indexes scanned anywhere in a JSON EXPLAIN plan node."""
+    indexes = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", []):
+        indexes |= indexes_in_plan(child)
+    return indexes
+
+
+def query_plan(query: QuerySet) -> dict:
+    """Top node of the JSON EXPLAIN plan of ``query``."""
+    sql, params = query.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def explain_text(query: QuerySet, analyze=False) -> str:
+    """EXPLAIN of ``query`` as psql prints it; with ``analyze`` the query is run."""
+    return query.explain(analyze=analyze, buffers=analyze)
@@ -1,3 +1,55 @@
+from app_saude.models import InterestArea, InterestAreaMark, InterestAreaTrigger
+from django.db.models import Prefetch
+
+
+def interest_area_prefetches(prefix: str = "") -> list:
+    """
+    Prefetch objects loading the triggers and provider marks of interest areas.
+
+    Use prefix="interest_area__" when prefetching from an Observation queryset.
+    """
+    return [
+        Prefetch(f"{prefix}triggers", queryset=InterestAreaTrigger.objects.order_by("position", "pk")),
+        Prefetch(f"{prefix}marks", queryset=InterestAreaMark.objects.select_related("provider__user").order_by("pk")),
+    ]
+
+
+def get_marked_by(interest_area: InterestArea) -> list:
+    """
+    Names of the providers that marked the area, in marking order.
+    """
+    return [mark.provider.social_name or mark.provider.user.get_full_name() for mark in interest_area.marks.all()]
+
+
+def serialize_interest_area(interest_area: InterestArea) -> dict:
+    """
+    Build the interest area payload exposed by the API (the shape formerly stored as JSON).
+    """
+    return {
+        "name": interest_area.name,
+        "marked_by": get_marked_by(interest_area),
+        "shared_with_provider": interest_area.shared_with_provider,
+        "triggers": [
+            {"name": trigger.name, "type": trigger.type, "response": trigger.response}
+            for trigger in interest_area.triggers.all()
+        ],
+    }
+
+
+def build_interest_area_index(person_id) -> dict:
+    """
+    Map each interest area name of a person to its observation_id and marked_by list.
+
+    Diaries store a snapshot of the interest areas by name, so rendering them
+    needs the current area behind each name. Building the whole map up front
+    keeps diary lists from issuing a lookup per area.
+    """
+    areas = InterestArea.objects.filter(person_id=person_id).prefetch_related(
+        Prefetch("marks", queryset=InterestAreaMark.objects.select_related("provider__user").order_by("pk"))
+    )
+    return {area.name: {"observation_id": area.observation_id, "marked_by": get_marked_by(area)} for area in areas}
+
+
 # from app_saude.models import FactRelationship, Observation
 # from app_saude.serializers import InterestAreaSerializer, InterestAreaTriggerSerializer
 # from app_saude.utils.concept import get_concept_by_code
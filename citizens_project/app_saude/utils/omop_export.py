@@ -0,0 +1,303 @@
+import csv
+import datetime
+import io
+import logging
+from dataclasses import dataclass, field
+
+from app_saude.models import (
+    DrugExposure,
+    FactRelationship,
+    Measurement,
+    Observation,
+    Person,
+    PersonProviderLink,
+    Provider,
+    VisitOccurrence,
+)
+from asgiref.sync import sync_to_async
+from django.db import models
+from django.db.models import Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .concept import get_concept_by_code
+
+logger = logging.getLogger("app_saude")
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    """
+    One OMOP CDM table as exported: output column -> ORM field or expression.
+
+    Only OMOP columns are exported; application data that identifies a user
+    (account, social name, profile picture, exact birth date, visit notes)
+    is left out.
+
+    - ``date_field``: field the date range applies to (None: not filtered by date).
+    - ``person_field``: field holding the person id, used to scope the rows to a care site.
+    """
+
+    name: str
+    model: type
+    columns: dict = field(default_factory=dict)
+    date_field: str | None = None
+    person_field: str | None = "person_id"
+
+
+def _datetime_columns(prefix: str, source: str) -> dict:
+    return {f"{prefix}_date": TruncDate(source), f"{prefix}_datetime": source}
+
+
+EXPORT_TABLES = {
+    table.name: table
+    for table in (
+        ExportTable(
+            name="person",
+            model=Person,
+            columns={
+                "person_id": "person_id",
+                "year_of_birth": "year_of_birth",
+                "gender_concept_id": "gender_concept_id",
+                "race_concept_id": "race_concept_id",
+                "ethnicity_concept_id": "ethnicity_concept_id",
+                "location_id": "location_id",
+            },
+        ),
+        ExportTable(
+            name="observation",
+            model=Observation,
+            columns={
+                "observation_id": "observation_id",
+                "person_id": "person_id",
+                "observation_concept_id": "observation_concept_id",
+                **_datetime_columns("observation", "observation_date"),
+                "observation_type_concept_id": "observation_type_concept_id",
+                "value_as_string": "value_as_string",
+                "value_as_concept_id": "value_as_concept_id",
+                "provider_id": "provider_id",
+                "observation_source_value": "observation_source_value",
+            },
+            date_field="observation_date",
+        ),
+        ExportTable(
+            name="measurement",
+            model=Measurement,
+            columns={
+                "measurement_id": "measurement_id",
+                "person_id": "person_id",
+                "measurement_concept_id": "measurement_concept_id",
+                **_datetime_columns("measurement", "measurement_date"),
+                "measurement_type_concept_id": "measurement_type_concept_id",
+            },
+            date_field="measurement_date",
+        ),
+        ExportTable(
+            name="drug_exposure",
+            model=DrugExposure,
+            columns={
+                "drug_exposure_id": "drug_exposure_id",
+                "person_id": "person_id",
+                "drug_concept_id": "drug_concept_id",
+                # The model keeps no exposure dates; the record date stands in for the start.
+                **_datetime_columns("drug_exposure_start", "created_at"),
+                "drug_type_concept_id": "drug_type_concept_id",
+                "stop_reason": "stop_reason",
+                "quantity": "quantity",
+                "sig": "sig",
+            },
+            date_field="created_at",
+        ),
+        ExportTable(
+            name="visit_occurrence",
+            model=VisitOccurrence,
+            columns={
+                "visit_occurrence_id": "visit_occurrence_id",
+                "person_id": "person_id",
+                "visit_concept_id": "visit_concept_id",
+                **_datetime_columns("visit_start", "visit_start_date"),
+                **_datetime_columns("visit_end", "visit_end_date"),
+                "visit_type_concept_id": "visit_type_concept_id",
+                "provider_id": "provider_id",
+                "care_site_id": "care_site_id",
+            },
+            date_field="visit_start_date",
+        ),
+        ExportTable(
+            name="fact_relationship",
+            model=FactRelationship,
+            columns={
+                "domain_concept_id_1": "domain_concept_1_id",
+                "fact_id_1": "fact_id_1",
+                "domain_concept_id_2": "domain_concept_2_id",
+                "fact_id_2": "fact_id_2",
+                "relationship_concept_id": "relationship_concept_id",
+            },
+            person_field=None,
+        ),
+    )
+}
+
+
+def _day_start(day: datetime.date) -> datetime.datetime:
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def care_site_persons(care_site_id: int):
+    """Subquery of the persons linked to a provider of the care site."""
+    providers = Provider.objects.filter(care_site_id=care_site_id).values("provider_id")
+    return PersonProviderLink.objects.filter(fact_id_2__in=providers).values("fact_id_1")
+
+
+def export_queryset(table: ExportTable, start=None, end=None, care_site_id=None):
+    """
+    Rows of ``table`` as tuples in column order, ordered by primary key.
+
+    ``start``/``end`` are inclusive dates applied to the table's date field;
+    tables without one (person, fact_relationship) are not filtered by date.
+    ``care_site_id`` keeps the rows of persons linked to that care site.
+    """
+    queryset = table.model.objects.all()
+
+    if table.date_field:
+        if start:
+            queryset = queryset.filter(**{f"{table.date_field}__gte": _day_start(start)})
+        if end:
+            queryset = queryset.filter(**{f"{table.date_field}__lt": _day_start(end + datetime.timedelta(days=1))})
+
+    if care_site_id is not None:
+        persons = care_site_persons(care_site_id)
+        if table.person_field:
+            queryset = queryset.filter(**{f"{table.person_field}__in": persons})
+        else:
+            person_domain = get_concept_by_code("PERSON").concept_id
+            queryset = queryset.filter(
+                Q(domain_concept_1_id=person_domain, fact_id_1__in=persons)
+                | Q(domain_concept_2_id=person_domain, fact_id_2__in=persons)
+            )
+
+    # Expressions need an alias; prefixed so it never clashes with a model field.
+    expressions = {f"export_{name}": column for name, column in table.columns.items() if not isinstance(column, str)}
+    fields = [column if isinstance(column, str) else f"export_{name}" for name, column in table.columns.items()]
+    return queryset.annotate(**expressions).order_by("pk").values_list(*fields)
+
+
+def iter_rows(table: ExportTable, chunk_size=EXPORT_CHUNK_SIZE, **filters):
+    """
+    Stream the rows of ``table`` from a server-side cursor.
+
+    ``iterator(chunk_size=...)`` keeps only one chunk in memory at a time, so
+    memory stays flat however large the table is.
+    """
+    return export_queryset(table, **filters).iterator(chunk_size=chunk_size)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def write_csv(table: ExportTable, fileobj, chunk_size=EXPORT_CHUNK_SIZE, **filters) -> int:
+    """Write ``table`` as CSV (with header) to a text file; returns the row count."""
+    writer = csv.writer(fileobj)
+    writer.writerow(table.columns)
+    count = 0
+    for row in iter_rows(table, chunk_size=chunk_size, **filters):
+        writer.writerow([_csv_value(value) for value in row])
+        count += 1
+    return count
+
+
+def stream_csv(table: ExportTable, chunk_size=EXPORT_CHUNK_SIZE, buffer_size=64 * 1024, **filters):
+    """
+    Yield ``table`` as CSV text in pieces of about ``buffer_size`` characters.
+
+    Meant for StreamingHttpResponse: rows are written to a small buffer that
+    is flushed whenever it fills up, instead of building the whole file.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table.columns)
+    count = 0
+    for row in iter_rows(table, chunk_size=chunk_size, **filters):
+        writer.writerow([_csv_value(value) for value in row])
+        count += 1
+        if buffer.tell() >= buffer_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+    logger.info(
+        "OMOP table streamed",
+        extra={"table": table.name, "row_count": count, "filters": str(filters), "action": "omop_export_streamed"},
+    )
+
+
+async def astream_csv(table: ExportTable, **kwargs):
+    """
+    stream_csv for responses served under ASGI.
+
+    Django reads a synchronous iterator to the end before sending any of it
+    under ASGI; here each piece is produced by sync_to_async in the request's
+    sync thread, where the server-side cursor and its connection live.
+    """
+    pieces = stream_csv(table, **kwargs)
+    done = object()
+    try:
+        while (piece := await sync_to_async(next)(pieces, done)) is not done:
+            yield piece
+    finally:
+        # Closes the cursor when the client goes away mid-stream.
+        await sync_to_async(pieces.close)()
+
+
+def _output_field(table: ExportTable, column):
+    if not isinstance(column, str):
+        return column.output_field
+    model_field = table.model._meta.get_field(column)
+    return model_field.target_field if model_field.is_relation else model_field
+
+
+def write_parquet(table: ExportTable, path, chunk_size=EXPORT_CHUNK_SIZE, **filters) -> int:
+    """
+    Write ``table`` to a Parquet file, one row group per chunk; returns the row count.
+
+    Requires pyarrow, which is optional: ImportError is raised when it is missing.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def arrow_type(model_field):
+        if isinstance(model_field, models.DateTimeField):
+            return pa.timestamp("us", tz="UTC")
+        if isinstance(model_field, models.DateField):
+            return pa.date32()
+        if isinstance(model_field, models.BooleanField):
+            return pa.bool_()
+        if isinstance(model_field, models.IntegerField):
+            return pa.int64()
+        return pa.string()
+
+    schema = pa.schema([(name, arrow_type(_output_field(table, column))) for name, column in table.columns.items()])
+    count = 0
+    chunk = []
+    with pq.ParquetWriter(path, schema) as writer:
+
+        def flush():
+            writer.write_table(pa.Table.from_pylist([dict(zip(schema.names, row)) for row in chunk], schema=schema))
+
+        for row in iter_rows(table, chunk_size=chunk_size, **filters):
+            chunk.append(row)
+            count += 1
+            if len(chunk) == chunk_size:
+                flush()
+                chunk = []
+        if chunk:
+            flush()
+    return count
@@ -0,0 +1,267 @@
+import datetime
+import logging
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+
+from ..models import (
+    DIARY_ENTRY_CONCEPT_ID,
+    HELP_CONCEPT_ID,
+    INTEREST_AREA_CONCEPT_ID,
+    PROVIDER_LINK_CODE_CONCEPT_ID,
+    Observation,
+)
+
+logger = logging.getLogger("app_saude")
+
+OBSERVATION_TABLE = Observation._meta.db_table
+OLD_OBSERVATION_TABLE = f"{OBSERVATION_TABLE}_unpartitioned"
+DEFAULT_PARTITION = f"{OBSERVATION_TABLE}_default"
+
+# LIST partitions of observation_concept_id; other concepts (and NULL) go to the default partition.
+CONCEPT_PARTITIONS = {
+    f"{OBSERVATION_TABLE}_diary": DIARY_ENTRY_CONCEPT_ID,
+    f"{OBSERVATION_TABLE}_help": HELP_CONCEPT_ID,
+    f"{OBSERVATION_TABLE}_interest_area": INTEREST_AREA_CONCEPT_ID,
+    f"{OBSERVATION_TABLE}_link_code": PROVIDER_LINK_CODE_CONCEPT_ID,
+}
+
+SCHEMES = {
+    "concept": "LIST (observation_concept_id)",
+    "month": "RANGE (observation_date)",
+}
+
+# Month partitions created after the current month, so inserts do not land in the default partition.
+MONTHS_AHEAD = 3
+
+
+def observation_partitioning(using=DEFAULT_DB_ALIAS) -> str | None:
+    """
+    The scheme observation is partitioned by ("concept" or "month"), or None
+    for a plain table (or none at all, before the first migration).
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT attribute.attname
+            FROM pg_partitioned_table partitioned
+            JOIN pg_attribute attribute
+                ON attribute.attrelid = partitioned.partrelid AND attribute.attnum = partitioned.partattrs[0]
+            WHERE partitioned.partrelid = to_regclass(%s)
+            """,
+            [OBSERVATION_TABLE],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return {"observation_concept_id": "concept", "observation_date": "month"}[row[0]]
+
+
+def pending_migrations(using=DEFAULT_DB_ALIAS) -> list[str]:
+    """The app_saude migrations not applied yet, in the order migrate would apply them."""
+    executor = MigrationExecutor(connections[using])
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    return [migration.name for migration, _ in plan if migration.app_label == Observation._meta.app_label]
+
+
+def observation_partitions() -> list[tuple[str, str]]:
+    """Name and bound (FOR VALUES ...) of each partition of observation."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+            ORDER BY child.relname
+            """,
+            [OBSERVATION_TABLE],
+        )
+        return cursor.fetchall()
+
+
+def month_start(date: datetime.date) -> datetime.date:
+    return date.replace(day=1)
+
+
+def next_month(date: datetime.date) -> datetime.date:
+    return (date.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+
+def month_partition_name(month: datetime.date) -> str:
+    return f"{OBSERVATION_TABLE}_y{month.year}m{month.month:02d}"
+
+
+def create_partition(cursor, name, bound):
+    cursor.execute(f"CREATE TABLE {name} PARTITION OF {OBSERVATION_TABLE} {bound}")
+    # A unique index on observation_id alone is only possible per partition:
+    # across partitions, the identity sequence keeps the ids apart.
+    cursor.execute(f"CREATE UNIQUE INDEX {name}_observation_id_key ON {name} (observation_id)")
+
+
+def add_month_partitions(cursor, months):
+    """
+    Create the partitions of ``months`` that do not exist yet, moving the rows
+    the default partition already holds for them.
+    """
+    existing = {name for name, _ in observation_partitions()}
+    for month in sorted(months):
+        name = month_partition_name(month)
+        if name in existing:
+            continue
+        start, end = month.isoformat(), next_month(month).isoformat()
+        cursor.execute(f"CREATE TABLE {name} (LIKE {OBSERVATION_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE observation_date >= %s AND observation_date < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            [start, end],
+        )
+        cursor.execute(f"CREATE UNIQUE INDEX {name}_observation_id_key ON {name} (observation_id)")
+        cursor.execute(
+            f"ALTER TABLE {OBSERVATION_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [start, end]
+        )
+
+
+def upcoming_months(months_ahead: int) -> list[datetime.date]:
+    month = month_start(datetime.date.today())
+    months = [month]
+    for _ in range(months_ahead):
+        month = next_month(month)
+        months.append(month)
+    return months
+
+
+def extend_month_partitions(months_ahead=MONTHS_AHEAD) -> int:
+    """Create the partitions of the current and next ``months_ahead`` months; returns how many were missing."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        before = len(observation_partitions())
+        add_month_partitions(cursor, upcoming_months(months_ahead))
+    return len(observation_partitions()) - before
+
+
+def inbound_foreign_keys():
+    """The model fields with a foreign key constraint pointing at observation."""
+    return [
+        (relation.related_model, relation.field)
+        for relation in Observation._meta.related_objects
+        if relation.field.db_constraint
+    ]
+
+
+def rebuild_observation(scheme: str | None, months_ahead=MONTHS_AHEAD):
+    """
+    Recreate observation partitioned by ``scheme`` ("concept" or "month"), or
+    as a plain table when ``scheme`` is None, and copy its rows over.
+
+    Runs in one transaction holding an ACCESS EXCLUSIVE lock on observation,
+    so the API waits (or fails on its statement timeout) while the rows are
+    copied. Indexes, foreign keys, the identity sequence and the comments are
+    carried over. A partitioned table cannot have a primary key (or a foreign
+    key pointing at it) without the partition key, which is nullable here:
+    it gets a unique index on observation_id in each partition instead, and
+    the foreign keys from other tables (interest_area) are dropped. Django
+    emulates their ON DELETE CASCADE anyway; they come back with a plain table.
+    Migrations expect that plain table, so migrate refuses to run while
+    observation is partitioned (see signals.refuse_migrating_partitioned_observation).
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if scheme and observation_partitioning():
+            # Partition names would clash: go through a plain table.
+            rebuild_observation(None)
+
+        # Pending deferred foreign key checks would block the ALTER TABLEs below.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"LOCK TABLE {OBSERVATION_TABLE} IN ACCESS EXCLUSIVE MODE")
+
+        cursor.execute(
+            """
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s
+            """,
+            [OBSERVATION_TABLE, f"{OBSERVATION_TABLE}_pkey"],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype = 'f'
+            """,
+            [OBSERVATION_TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            """
+            SELECT conname, conrelid::regclass FROM pg_constraint
+            WHERE confrelid = %s::regclass AND contype = 'f'
+            """,
+            [OBSERVATION_TABLE],
+        )
+        inbound = cursor.fetchall()
+        cursor.execute("SELECT obj_description(%s::regclass, 'pg_class')", [OBSERVATION_TABLE])
+        table_comment = cursor.fetchone()[0]
+
+        for name, table in inbound:
+            cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+        cursor.execute(f"ALTER TABLE {OBSERVATION_TABLE} RENAME TO {OLD_OBSERVATION_TABLE}")
+        # Their names are reused by the new table.
+        for name, _ in indexes:
+            cursor.execute(f"DROP INDEX {name}")
+        cursor.execute(f"ALTER TABLE {OLD_OBSERVATION_TABLE} DROP CONSTRAINT IF EXISTS {OBSERVATION_TABLE}_pkey")
+
+        partition_by = f" PARTITION BY {SCHEMES[scheme]}" if scheme else ""
+        cursor.execute(
+            f"""
+            CREATE TABLE {OBSERVATION_TABLE} (
+                LIKE {OLD_OBSERVATION_TABLE}
+                INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS INCLUDING COMMENTS
+            ){partition_by}
+            """
+        )
+        if scheme == "concept":
+            for name, concept_id in CONCEPT_PARTITIONS.items():
+                create_partition(cursor, name, f"FOR VALUES IN ({int(concept_id)})")
+        if scheme:
+            create_partition(cursor, DEFAULT_PARTITION, "DEFAULT")
+        if scheme == "month":
+            cursor.execute(
+                f"SELECT DISTINCT date_trunc('month', observation_date)::date FROM {OLD_OBSERVATION_TABLE} "
+                "WHERE observation_date IS NOT NULL"
+            )
+            months = {row[0] for row in cursor.fetchall()} | set(upcoming_months(months_ahead))
+            add_month_partitions(cursor, months)
+
+        cursor.execute(f"INSERT INTO {OBSERVATION_TABLE} SELECT * FROM {OLD_OBSERVATION_TABLE}")
+        cursor.execute(f"DROP TABLE {OLD_OBSERVATION_TABLE}")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'observation_id')", [OBSERVATION_TABLE])
+        sequence = cursor.fetchone()[0]
+        if sequence.split(".")[-1] != f"{OBSERVATION_TABLE}_observation_id_seq":
+            cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {OBSERVATION_TABLE}_observation_id_seq")
+        cursor.execute(f"SELECT COALESCE(MAX(observation_id), 0) + 1 FROM {OBSERVATION_TABLE}")
+        cursor.execute(
+            f"ALTER TABLE {OBSERVATION_TABLE} ALTER COLUMN observation_id RESTART WITH {cursor.fetchone()[0]}"
+        )
+
+        if not scheme:
+            cursor.execute(
+                f"ALTER TABLE {OBSERVATION_TABLE} ADD CONSTRAINT {OBSERVATION_TABLE}_pkey PRIMARY KEY (observation_id)"
+            )
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {OBSERVATION_TABLE} ADD CONSTRAINT {name} {definition}")
+        if not scheme:
+            with connection.schema_editor(atomic=False) as schema_editor:
+                for model, field in inbound_foreign_keys():
+                    schema_editor.execute(schema_editor._create_fk_sql(model, field, "_fk_%(to_table)s_%(to_column)s"))
+        if table_comment:
+            cursor.execute(f"COMMENT ON TABLE {OBSERVATION_TABLE} IS %s", [table_comment])
+        cursor.execute(f"ANALYZE {OBSERVATION_TABLE}")
+
+    logger.info(
+        "Observation table rebuilt",
+        extra={"scheme": scheme, "partitions": len(observation_partitions()), "action": "observation_rebuilt"},
+    )
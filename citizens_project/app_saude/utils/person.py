@@ -1,7 +1,6 @@
 import logging
 
-from app_saude.models import FactRelationship, Person
-from app_saude.utils.concept import get_concept_by_code
+from app_saude.models import Person, PersonProviderLink
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 
@@ -25,14 +24,7 @@ def get_person_and_linked_providers(request_user):
     """
     person = get_object_or_404(Person, user=request_user)
 
-    linked_providers_ids = FactRelationship.objects.filter(
-        fact_id_1=person.person_id,
-        domain_concept_1_id=get_concept_by_code("PERSON").concept_id,
-        domain_concept_2_id=get_concept_by_code("PROVIDER").concept_id,
-        relationship_concept_id=get_concept_by_code("PERSON_PROVIDER").concept_id,
-    ).values_list("fact_id_2", flat=True)
-
-    return person, set(linked_providers_ids)
+    return person, PersonProviderLink.objects.providers_for(person.person_id)
 
 
 def validate_user_is_person(user):
@@ -0,0 +1,395 @@
+import json
+import logging
+import random
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+
+from app_saude.models import (
+    Concept,
+    InterestArea,
+    InterestAreaMark,
+    InterestAreaTrigger,
+    Measurement,
+    Observation,
+    Person,
+    PersonProviderLink,
+    Provider,
+    ProviderHelpCounter,
+    VisitOccurrence,
+)
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .concept import get_concept_by_code
+
+logger = logging.getLogger("app_saude")
+
+User = get_user_model()
+
+FIRST_NAMES = ["Ana", "Bruno", "Carla", "Daniel", "Elaine", "Fábio", "Gabriela", "Hugo", "Isabel", "João", "Luana"]
+LAST_NAMES = ["Silva", "Souza", "Oliveira", "Santos", "Lima", "Pereira", "Costa", "Almeida", "Ribeiro", "Gomes"]
+
+# Used when the interest area templates (seed_interests) are not in the database.
+FALLBACK_INTEREST_AREAS = {
+    "Sono": [("Dormiu bem esta noite?", "boolean"), ("Quantas horas dormiu?", "int")],
+    "Medicação": [("Você tomou sua medicação hoje?", "boolean"), ("Teve algum efeito colateral?", "boolean")],
+    "Humor e saúde emocional": [("Como você está se sentindo neste momento?", "text")],
+}
+
+TRIGGER_RESPONSES = {
+    "boolean": lambda rng: rng.choice(["true", "false"]),
+    "int": lambda rng: str(rng.randint(0, 200)),
+    "scale": lambda rng: str(rng.randint(0, 10)),
+    "text": lambda rng: rng.choice(["Bem", "Mais ou menos", "Cansado(a)", "Melhor que ontem"]),
+}
+
+
+@dataclass
+class PopulationSpec:
+    """
+    Size of a synthetic population. Per-person counts are averages; each
+    person gets a random amount between zero and twice the value.
+    """
+
+    persons: int = 1000
+    providers: int = 50
+    max_links_per_person: int = 3
+    interest_areas_per_person: int = 3
+    diaries_per_person: int = 20
+    helps_per_person: int = 2
+    visits_per_person: int = 4
+    measurements_per_person: int = 6
+    days: int = 365
+    seed: int | None = None
+    label: str = "pop"
+
+
+class PopulationGenerator:
+    """
+    Fill the database with a synthetic population using bulk inserts.
+
+    Providers get a skewed share of the persons (a few very busy providers and
+    a long tail), which is the shape that makes per-provider lists slow. Every
+    user is named ``<label>-<run>-person-<n>`` / ``<label>-<run>-provider-<n>``
+    so a population can be found again (see population_users) and benchmarked.
+    The help counters are rebuilt at the end, as bulk inserts bypass the signals
+    that maintain them.
+    """
+
+    def __init__(self, spec: PopulationSpec, batch_size: int = 2000, stdout=None):
+        self.spec = spec
+        self.batch_size = batch_size
+        self.rng = random.Random(spec.seed)
+        self.now = timezone.now()
+        self.run = uuid.uuid4().hex[:8]
+        self.stdout = stdout
+        self.counts = {}
+
+    # Helpers
+
+    def report(self, name, objs):
+        self.counts[name] = self.counts.get(name, 0) + len(objs)
+        if self.stdout:
+            self.stdout.write(f"{name}: {self.counts[name]}")
+
+    def bulk_create(self, model, objs, name):
+        created = model.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.report(name, created)
+        return created
+
+    def amount(self, average):
+        return self.rng.randint(0, 2 * average) if average else 0
+
+    def past(self, days=None):
+        return self.now - timedelta(seconds=self.rng.randint(0, (days or self.spec.days) * 86400))
+
+    def concept_id(self, code):
+        return get_concept_by_code(code).concept_id
+
+    # Generation
+
+    def generate(self) -> dict:
+        with transaction.atomic():
+            providers = self.create_providers()
+            persons = self.create_persons()
+            links = self.create_links(persons, providers)
+            areas = self.create_interest_areas(persons, links)
+            self.create_diaries(persons, areas)
+            self.create_helps(persons, links)
+            self.create_visits(persons, links)
+            self.create_measurements(persons)
+            self.count_helps()
+
+        logger.info(
+            "Synthetic population generated",
+            extra={
+                "run": self.run,
+                **{f"{name}_count": count for name, count in self.counts.items()},
+                "action": "population_generated",
+            },
+        )
+        return self.counts
+
+    def create_users(self, kind, count):
+        # One hash for every user: they log in with force_authenticate or JWTs, never a password.
+        password = make_password(None)
+        users = [
+            User(
+                username=f"{self.spec.label}-{self.run}-{kind}-{i}",
+                email=f"{self.spec.label}-{self.run}-{kind}-{i}@example.com",
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                password=password,
+            )
+            for i in range(count)
+        ]
+        return self.bulk_create(User, users, "users")
+
+    def create_providers(self):
+        users = self.create_users("provider", self.spec.providers)
+        registration_start = (
+            Provider.objects.order_by("-professional_registration")
+            .values_list("professional_registration", flat=True)
+            .first()
+            or 0
+        ) + 1
+        providers = [
+            Provider(
+                user=user, social_name=f"Dr(a). {user.first_name}", professional_registration=registration_start + i
+            )
+            for i, user in enumerate(users)
+        ]
+        return self.bulk_create(Provider, providers, "providers")
+
+    def create_persons(self):
+        users = self.create_users("person", self.spec.persons)
+        genders = list(Concept.objects.filter(concept_class_id="Gender").values_list("concept_id", flat=True)) or [None]
+        persons = []
+        for user in users:
+            birth = self.now - timedelta(days=self.rng.randint(18 * 365, 85 * 365))
+            persons.append(
+                Person(
+                    user=user,
+                    social_name=user.first_name if self.rng.random() < 0.3 else None,
+                    birth_datetime=birth,
+                    year_of_birth=birth.year,
+                    gender_concept_id=self.rng.choice(genders),
+                )
+            )
+        return self.bulk_create(Person, persons, "persons")
+
+    def create_links(self, persons, providers):
+        """Link each person to 1..max_links providers, busiest providers first (Zipf-like weights)."""
+        links = {}
+        if not providers:
+            return links
+        weights = [1 / (rank + 1) for rank in range(len(providers))]
+        link_concepts = {
+            "domain_concept_1_id": self.concept_id("PERSON"),
+            "domain_concept_2_id": self.concept_id("PROVIDER"),
+            "relationship_concept_id": self.concept_id("PERSON_PROVIDER"),
+        }
+        rows = []
+        for person in persons:
+            wanted = min(self.rng.randint(1, self.spec.max_links_per_person), len(providers))
+            chosen = set()
+            while len(chosen) < wanted:
+                chosen.add(self.rng.choices(range(len(providers)), weights)[0])
+            links[person.person_id] = [providers[i] for i in sorted(chosen)]
+            rows.extend(
+                PersonProviderLink(fact_id_1=person.person_id, fact_id_2=providers[i].provider_id, **link_concepts)
+                for i in sorted(chosen)
+            )
+        self.bulk_create(PersonProviderLink, rows, "links")
+        return links
+
+    def interest_area_templates(self):
+        templates = {}
+        for trigger in (
+            InterestAreaTrigger.objects.filter(interest_area__person=None)
+            .order_by("interest_area__name", "position")
+            .values("interest_area__name", "name", "type")
+        ):
+            templates.setdefault(trigger["interest_area__name"], []).append((trigger["name"], trigger["type"]))
+        return templates or FALLBACK_INTEREST_AREAS
+
+    def create_interest_areas(self, persons, links):
+        templates = self.interest_area_templates()
+        names = list(templates)
+        chosen = {
+            person.person_id: self.rng.sample(names, min(self.amount(self.spec.interest_areas_per_person), len(names)))
+            for person in persons
+        }
+
+        interest_area_concept = self.concept_id("INTEREST_AREA")
+        observations = []
+        for person in persons:
+            for name in chosen[person.person_id]:
+                observations.append(
+                    Observation(
+                        person=person,
+                        observation_concept_id=interest_area_concept,
+                        value_as_string=name,
+                        observation_date=self.past(),
+                    )
+                )
+        observations = self.bulk_create(Observation, observations, "interest_area_observations")
+
+        areas = [
+            InterestArea(
+                observation=observation,
+                person_id=observation.person_id,
+                name=observation.value_as_string,
+                shared_with_provider=self.rng.random() < 0.7,
+            )
+            for observation in observations
+        ]
+        areas = self.bulk_create(InterestArea, areas, "interest_areas")
+
+        triggers = []
+        marks = []
+        for area in areas:
+            for position, (name, kind) in enumerate(templates[area.name]):
+                triggers.append(
+                    InterestAreaTrigger(
+                        interest_area=area,
+                        name=name,
+                        type=kind,
+                        response=TRIGGER_RESPONSES.get(kind, TRIGGER_RESPONSES["text"])(self.rng),
+                        position=position,
+                    )
+                )
+            if area.shared_with_provider and self.rng.random() < 0.2:
+                marks.append(InterestAreaMark(interest_area=area, provider=self.rng.choice(links[area.person_id])))
+        self.bulk_create(InterestAreaTrigger, triggers, "interest_area_triggers")
+        self.bulk_create(InterestAreaMark, marks, "interest_area_marks")
+
+        by_person = {}
+        for area in areas:
+            by_person.setdefault(area.person_id, []).append(area)
+        return by_person
+
+    def create_diaries(self, persons, areas):
+        diary_concept = self.concept_id("diary_entry")
+        diary_type_concept = self.concept_id("diary_entry_type")
+        triggers = {}
+        for trigger in InterestAreaTrigger.objects.filter(
+            interest_area__person__in=[person.person_id for person in persons]
+        ).values("interest_area_id", "name", "type", "response"):
+            triggers.setdefault(trigger["interest_area_id"], []).append(
+                {"name": trigger["name"], "type": trigger["type"], "response": trigger["response"]}
+            )
+
+        batch = []
+        for person in persons:
+            person_areas = areas.get(person.person_id, [])
+            for _ in range(self.amount(self.spec.diaries_per_person)):
+                shared = self.rng.random() < 0.6
+                payload = {
+                    "date_range_type": self.rng.choice(["today", "since_last"]),
+                    "text": self.rng.choice(["Dia tranquilo.", "Dormi mal.", "Me senti melhor hoje.", ""]),
+                    "text_shared": shared and self.rng.random() < 0.5,
+                    "diary_shared": shared,
+                    "interest_areas": [
+                        {
+                            "name": area.name,
+                            "shared_with_provider": area.shared_with_provider,
+                            "triggers": triggers.get(area.pk, []),
+                        }
+                        for area in person_areas
+                        if self.rng.random() < 0.7
+                    ],
+                }
+                batch.append(
+                    Observation(
+                        person=person,
+                        observation_concept_id=diary_concept,
+                        observation_type_concept_id=diary_type_concept,
+                        value_as_string=json.dumps(payload, ensure_ascii=False),
+                        observation_date=self.past(),
+                        shared_with_provider=shared,
+                    )
+                )
+            if len(batch) >= self.batch_size:
+                self.bulk_create(Observation, batch, "diaries")
+                batch = []
+        self.bulk_create(Observation, batch, "diaries")
+
+    def create_helps(self, persons, links):
+        help_concept = self.concept_id("HELP")
+        active_concept = self.concept_id("ACTIVE")
+        resolved_concept = self.concept_id("RESOLVED")
+        helps = []
+        for person in persons:
+            for _ in range(self.amount(self.spec.helps_per_person)):
+                # Recent requests are more likely to still be open.
+                when = self.past(90)
+                active = self.rng.random() < (0.6 if (self.now - when).days < 7 else 0.1)
+                helps.append(
+                    Observation(
+                        person=person,
+                        provider=self.rng.choice(links[person.person_id]),
+                        observation_concept_id=help_concept,
+                        value_as_concept_id=active_concept if active else resolved_concept,
+                        value_as_string=self.rng.choice(["Preciso de ajuda", "Não estou bem", "Pode me ligar?"]),
+                        observation_date=when,
+                    )
+                )
+        self.bulk_create(Observation, helps, "helps")
+
+    def count_helps(self):
+        # Bulk inserts send no signals, so the links and helps above are not in the counters yet.
+        self.report("help_counters", ProviderHelpCounter.objects.reconcile())
+
+    def create_visits(self, persons, links):
+        visits = []
+        for person in persons:
+            for _ in range(self.amount(self.spec.visits_per_person)):
+                # A fifth of the visits are scheduled in the next month.
+                if self.rng.random() < 0.2:
+                    start = self.now + timedelta(seconds=self.rng.randint(3600, 30 * 86400))
+                else:
+                    start = self.past()
+                visits.append(
+                    VisitOccurrence(
+                        person=person,
+                        provider=self.rng.choice(links[person.person_id]),
+                        visit_start_date=start,
+                        visit_end_date=start + timedelta(minutes=self.rng.choice([20, 30, 45, 60])),
+                    )
+                )
+        self.bulk_create(VisitOccurrence, visits, "visits")
+
+    def create_measurements(self, persons):
+        concepts = list(Concept.objects.filter(concept_code__in=["BW", "BH"]).values_list("concept_id", flat=True))
+        measurements = [
+            Measurement(
+                person=person, measurement_concept_id=self.rng.choice(concepts or [None]), measurement_date=self.past()
+            )
+            for person in persons
+            for _ in range(self.amount(self.spec.measurements_per_person))
+        ]
+        self.bulk_create(Measurement, measurements, "measurements")
+
+
+def population_users(label: str = "pop"):
+    """Persons and providers of the synthetic populations; providers busiest (most linked persons) first."""
+    linked_persons = (
+        PersonProviderLink.objects.filter(fact_id_2=OuterRef("provider_id"))
+        .values("fact_id_2")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    persons = Person.objects.filter(user__username__startswith=f"{label}-").select_related("user").order_by("pk")
+    providers = (
+        Provider.objects.filter(user__username__startswith=f"{label}-")
+        .select_related("user")
+        .annotate(linked_persons=Coalesce(Subquery(linked_persons), 0))
+        .order_by("-linked_persons", "pk")
+    )
+    return persons, providers
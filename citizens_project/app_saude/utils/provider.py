@@ -1,6 +1,6 @@
 import logging
 
-from app_saude.models import FactRelationship, Person, Provider  # ajuste conforme necessário
+from app_saude.models import Observation, Person, PersonProviderLink, Provider, ProviderHelpCounter
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 
@@ -15,22 +15,25 @@ def get_provider_and_linked_persons(request_user):
     """
     provider = get_object_or_404(Provider, user=request_user)
 
-    linked_persons_ids = FactRelationship.objects.filter(
-        fact_id_2=provider.provider_id,
-        domain_concept_1_id=get_concept_by_code("PERSON"),
-        domain_concept_2_id=get_concept_by_code("PROVIDER"),
-        relationship_concept_id=get_concept_by_code("PERSON_PROVIDER"),
-    ).values_list("fact_id_1", flat=True)
+    return provider, PersonProviderLink.objects.persons_for(provider.provider_id)
 
-    return provider, set(linked_persons_ids)
+
+def count_active_helps(provider_id):
+    """
+    Conta os pedidos de ajuda ativos enviados ao provider pelas pessoas vinculadas,
+    a partir dos contadores mantidos em ProviderHelpCounter (que só têm linhas
+    para pares vinculados).
+    """
+    return ProviderHelpCounter.objects.counts_for(provider_id)["active"]
 
 
 def get_provider_and_linked_person_or_404(request_user, person_id):
     """
     Valida se a pessoa está vinculada ao provider logado. Retorna a pessoa ou 404.
     """
-    provider, linked_ids = get_provider_and_linked_persons(request_user)
-    if int(person_id) not in linked_ids:
+    provider = get_object_or_404(Provider, user=request_user)
+    # Direto no banco: o conjunto em cache de outro worker pode não ter visto um desvínculo recente.
+    if not PersonProviderLink.objects.is_linked(int(person_id), provider.provider_id):
         raise Http404("Esta pessoa não está vinculada a este profissional.")
     return provider, Person.objects.get(pk=person_id)
 
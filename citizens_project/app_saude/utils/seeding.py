@@ -0,0 +1,120 @@
+import logging
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.utils import timezone
+
+from .concept import concept_registry
+from .vocabulary import invalidate_vocabulary_bundle
+
+logger = logging.getLogger("app_saude")
+
+
+@dataclass
+class SeedResult:
+    model: str
+    created: int = 0
+    updated: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.created or self.updated)
+
+    def __str__(self):
+        return f"{self.model}: {self.created} criados, {self.updated} atualizados"
+
+
+def seed_rows(model, rows, *, key=None, fields=(), update_existing=True, keep_when_none=(), batch_size=1000):
+    """
+    Bring the ``model`` table in line with ``rows`` using set-based writes.
+
+    ``rows`` are dicts of attname -> value. The current state of the rows is
+    read in one query and compared in memory; only missing rows are created
+    and only rows whose ``fields`` differ are updated, so an unchanged seed
+    costs a single SELECT.
+
+    - ``key``: attnames identifying a row (the primary key by default). When
+      the key is the primary key, creates and updates go out as one
+      ``bulk_create(update_conflicts=True)``; otherwise as ``bulk_create`` plus
+      ``bulk_update``.
+    - ``update_existing=False`` only creates missing rows, like ``get_or_create``.
+    - ``keep_when_none``: fields where ``None`` means "keep the stored value".
+
+    Bulk writes do not send model signals, so the concept registry and the
+    vocabulary bundle are cleared here whenever something changed.
+    """
+    pk_name = model._meta.pk.attname
+    key = tuple(key or (pk_name,))
+    fields = tuple(fields)
+    auto_now_fields = [f.attname for f in model._meta.concrete_fields if getattr(f, "auto_now", False)]
+    result = SeedResult(model.__name__)
+
+    # Later rows win, like repeated update_or_create() calls.
+    desired = {tuple(row[k] for k in key): row for row in rows}
+    if not desired:
+        return result
+
+    existing = {}
+    columns = dict.fromkeys((pk_name, *key, *fields))
+    current_rows = (
+        model.objects.filter(**{f"{key[0]}__in": {row_key[0] for row_key in desired}})
+        .order_by(pk_name)
+        .values(*columns)
+    )
+    for current in current_rows:
+        existing.setdefault(tuple(current[k] for k in key), current)
+
+    to_create, to_update = [], []
+    for row_key, row in desired.items():
+        current = existing.get(row_key)
+        if current is None:
+            to_create.append(model(**row))
+            continue
+        if not update_existing:
+            continue
+
+        values = {
+            field: current[field] if field in keep_when_none and row.get(field) is None else row.get(field)
+            for field in fields
+        }
+        if any(values[field] != current[field] for field in fields):
+            to_update.append(model(**{**row, **values, pk_name: current[pk_name]}))
+
+    if not to_create and not to_update:
+        return result
+
+    with transaction.atomic():
+        if key == (pk_name,) and update_existing and fields:
+            model.objects.bulk_create(
+                to_create + to_update,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=[pk_name],
+                update_fields=[*fields, *auto_now_fields],
+            )
+        else:
+            model.objects.bulk_create(to_create, batch_size=batch_size)
+            if to_update:
+                now = timezone.now()
+                for obj in to_update:
+                    for field in auto_now_fields:
+                        setattr(obj, field, now)
+                model.objects.bulk_update(to_update, [*fields, *auto_now_fields], batch_size=batch_size)
+
+    result.created = len(to_create)
+    result.updated = len(to_update)
+
+    concept_registry.invalidate()
+    transaction.on_commit(concept_registry.clear)
+    invalidate_vocabulary_bundle()
+
+    logger.info(
+        "Seed rows applied",
+        extra={
+            "model": result.model,
+            "created_count": result.created,
+            "updated_count": result.updated,
+            "action": "seed_rows_applied",
+        },
+    )
+    return result
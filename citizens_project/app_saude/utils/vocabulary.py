@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import json
+import logging
+
+from app_saude.models import Concept, ConceptRelationship, ConceptSynonym
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .concept import LOCAL_CONCEPT_ID_START
+from .generations import GenerationWatch
+
+logger = logging.getLogger("app_saude")
+
+# The bundle is cached under its generation: once another process bumps it,
+# this one stops reading (and eventually evicts) the bundle it built, even
+# when the cache backend is local memory.
+vocabulary_generation = GenerationWatch("vocabulary")
+
+
+def bundle_cache_key(generation: int) -> str:
+    return f"vocabulary_bundle:{generation}"
+
+
+def bundle_concepts_filter() -> Q:
+    """
+    Concepts shipped in the bundle.
+
+    By default the project's own concepts plus every concept with a curated
+    translation, i.e. the options the apps render. VOCABULARY_BUNDLE_CLASSES
+    narrows it to the listed concept classes instead, which keeps the bundle
+    small once full Athena vocabularies are loaded.
+    """
+    classes = getattr(settings, "VOCABULARY_BUNDLE_CLASSES", None)
+    if classes:
+        return Q(concept_class_id__in=classes) | Q(concept_id__gte=LOCAL_CONCEPT_ID_START)
+    return Q(concept_id__gte=LOCAL_CONCEPT_ID_START) | Q(concept_id__in=ConceptSynonym.objects.values("concept_id"))
+
+
+def build_vocabulary_bundle() -> dict:
+    """
+    Build the vocabulary snapshot served to the apps.
+
+    Returns a dict with the ETag, the gzip-compressed JSON body and the number
+    of concepts. The version is a hash of the content, so rebuilding an
+    unchanged vocabulary yields the same ETag.
+    """
+    concept_ids = set(Concept.objects.filter(bundle_concepts_filter()).values_list("concept_id", flat=True))
+
+    relationships = sorted(
+        ConceptRelationship.objects.filter(concept_1_id__in=concept_ids).values_list(
+            "concept_1_id", "concept_2_id", "relationship_id"
+        )
+    )
+    # Relationship targets are part of the snapshot even when outside the filter
+    concept_ids.update(concept_2_id for _, concept_2_id, _ in relationships)
+
+    synonyms = {}
+    for concept_id, language, name in (
+        ConceptSynonym.objects.filter(concept_id__in=concept_ids, language_concept__isnull=False)
+        .order_by("concept_synonym_id")
+        .values_list("concept_id", "language_concept__concept_code", "concept_synonym_name")
+    ):
+        synonyms.setdefault(concept_id, {}).setdefault(language, name)
+
+    concepts = [
+        {
+            "concept_id": concept["concept_id"],
+            "concept_name": concept["concept_name"],
+            "concept_code": concept["concept_code"],
+            "concept_class": concept["concept_class_id"],
+            "vocabulary": concept["vocabulary_id"],
+            "domain": concept["domain_id"],
+            "synonyms": synonyms.get(concept["concept_id"], {}),
+        }
+        for concept in Concept.objects.filter(concept_id__in=concept_ids)
+        .order_by("concept_id")
+        .values("concept_id", "concept_name", "concept_code", "concept_class_id", "vocabulary_id", "domain_id")
+    ]
+
+    content = {
+        "concepts": concepts,
+        "relationships": [
+            {"concept_1": concept_1, "concept_2": concept_2, "relationship_id": relationship_id}
+            for concept_1, concept_2, relationship_id in relationships
+        ],
+    }
+    version = hashlib.sha256(
+        json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+    ).hexdigest()
+    body = json.dumps({"version": version, **content}, separators=(",", ":"), ensure_ascii=False).encode()
+
+    return {
+        "etag": f'"{version}"',
+        "body": gzip.compress(body, mtime=0),
+        "concepts_count": len(concepts),
+    }
+
+
+def rebuild_vocabulary_bundle() -> dict:
+    generation = vocabulary_generation.read()
+    bundle = build_vocabulary_bundle()
+    cache.set(bundle_cache_key(generation), bundle, timeout=settings.VOCABULARY_BUNDLE_CACHE_TIMEOUT)
+    logger.info(
+        "Vocabulary bundle rebuilt",
+        extra={
+            "etag": bundle["etag"],
+            "concepts_count": bundle["concepts_count"],
+            "compressed_bytes": len(bundle["body"]),
+            "generation": generation,
+            "action": "vocabulary_bundle_rebuilt",
+        },
+    )
+    return bundle
+
+
+def get_vocabulary_bundle() -> dict:
+    bundle = cache.get(bundle_cache_key(vocabulary_generation.current()))
+    if bundle is None:
+        if transaction.get_connection().in_atomic_block:
+            # Uncommitted rows may still be rolled back; don't publish them.
+            return build_vocabulary_bundle()
+        bundle = rebuild_vocabulary_bundle()
+    return bundle
+
+
+def invalidate_vocabulary_bundle():
+    # The old generation's bundle is dropped here; the other processes move to the new one once this commits.
+    cache.delete(bundle_cache_key(vocabulary_generation.current()))
+    vocabulary_generation.bump()
+    # Again on commit, so a rebuild that read the old rows mid-transaction is not kept.
+    generation = vocabulary_generation.current()
+    transaction.on_commit(lambda: cache.delete(bundle_cache_key(generation)))
@@ -1,10 +1,12 @@
 import logging
 
+from adrf.views import APIView as AsyncAPIView
 from app_saude.serializers import AuthSerializer
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate, get_user_model
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import OpenApiExample, OpenApiParameter, extend_schema
-from libs.google import GoogleUserData, google_get_user_data
+from libs.google import GoogleUserData, get_google_auth_client
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
@@ -12,6 +14,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from ..metrics import GOOGLE_LOGINS
 from ..models import *
 from ..serializers import *
 from ..utils.provider import *
@@ -20,12 +23,15 @@ User = get_user_model()
 logger = logging.getLogger("app_saude")
 
 
-class GoogleLoginView(APIView):
+class GoogleLoginView(AsyncAPIView):
     """
     Google OAuth2 Login Endpoint
 
     Authenticates users using Google OAuth2 tokens and returns JWT tokens.
     Creates new users automatically on first login.
+
+    The view is async: served over ASGI, a worker keeps handling other
+    requests while this one waits on Google.
     """
 
     serializer_class = AuthSerializer
@@ -87,7 +93,7 @@ class GoogleLoginView(APIView):
         ],
         tags=["Authentication"],
     )
-    def post(self, request, *args, **kwargs):
+    async def post(self, request, *args, **kwargs):
         try:
             logger.info(f"Google login attempt from IP: {request.META.get('REMOTE_ADDR')}")
 
@@ -99,15 +105,16 @@ class GoogleLoginView(APIView):
 
             # Get user data from google
             try:
-                user_data: GoogleUserData = google_get_user_data(validated_data)
+                user_data: GoogleUserData = await get_google_auth_client().get_user_data(validated_data)
                 logger.info(f"Successfully retrieved Google user data for email: {user_data.email}")
             except Exception as e:
                 logger.error(f"Failed to get Google user data: {str(e)}", exc_info=True)
+                GOOGLE_LOGINS.labels(outcome="google_rejected").inc()
                 return Response({"detail": "Failed to authenticate with Google"}, status=status.HTTP_401_UNAUTHORIZED)
 
             # Creates user in DB if first time login
             try:
-                user, created = User.objects.get_or_create(
+                user, created = await User.objects.aget_or_create(
                     email=user_data.email,
                     username=user_data.email,
                     defaults={
@@ -123,11 +130,12 @@ class GoogleLoginView(APIView):
                     # Update user data from Google
                     user.first_name = user_data.given_name
                     user.last_name = user_data.family_name
-                    user.save()
+                    await user.asave()
                     logger.debug(f"Updated user profile data for: {user.email}")
 
             except Exception as e:
                 logger.error(f"Failed to create/update user {user_data.email}: {str(e)}", exc_info=True)
+                GOOGLE_LOGINS.labels(outcome="user_error").inc()
                 return Response(
                     {"detail": "Failed to create user account"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
@@ -142,26 +150,26 @@ class GoogleLoginView(APIView):
 
             try:
                 # Check if user is already registered as a provider
-                if Provider.objects.filter(user=user).exists():
-                    provider = Provider.objects.get(user=user)
+                provider = await Provider.objects.filter(user=user).afirst()
+                person = None if provider else await Person.objects.filter(user=user).afirst()
+                if provider:
                     social_name = getattr(provider, "social_name", None)
                     use_dark_mode = provider.use_dark_mode
                     if profile_picture:
                         provider.profile_picture = profile_picture
-                        provider.save(update_fields=["profile_picture"])
+                        await provider.asave(update_fields=["profile_picture"])
                         logger.debug(f"Updated provider profile picture for: {user.email}")
                     provider_id = provider.provider_id
                     role = "provider"
                     logger.info(f"User {user.email} authenticated as provider: {provider_id}")
 
                 # Check if user is already registered as a person
-                elif Person.objects.filter(user=user).exists():
-                    person = Person.objects.get(user=user)
+                elif person:
                     social_name = getattr(person, "social_name", None)
                     use_dark_mode = person.use_dark_mode
                     if profile_picture:
                         person.profile_picture = profile_picture
-                        person.save(update_fields=["profile_picture"])
+                        await person.asave(update_fields=["profile_picture"])
                         logger.debug(f"Updated person profile picture for: {user.email}")
                     person_id = person.person_id
                     role = "person"
@@ -175,10 +183,12 @@ class GoogleLoginView(APIView):
 
             # Generate jwt token for the user
             try:
-                token = RefreshToken.for_user(user)
+                # Records the token for the blacklist, so it touches the database.
+                token = await sync_to_async(RefreshToken.for_user)(user)
                 logger.info(f"JWT tokens generated successfully for user: {user.email}")
             except Exception as e:
                 logger.error(f"Failed to generate JWT tokens for user {user.email}: {str(e)}", exc_info=True)
+                GOOGLE_LOGINS.labels(outcome="token_error").inc()
                 return Response(
                     {"detail": "Failed to generate authentication tokens"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
@@ -205,10 +215,12 @@ class GoogleLoginView(APIView):
             }
 
             logger.info(f"Google login successful for user: {user.email}, role: {role}")
+            GOOGLE_LOGINS.labels(outcome="success").inc()
             return Response(response, status=200)
 
         except Exception as e:
             logger.error(f"Unexpected error in Google login: {str(e)}", exc_info=True)
+            GOOGLE_LOGINS.labels(outcome="error").inc()
             return Response({"detail": "An unexpected error occurred"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
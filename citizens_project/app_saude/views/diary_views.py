@@ -8,13 +8,15 @@ from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from drf_spectacular.utils import OpenApiExample, OpenApiParameter, extend_schema
 from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from ..models import *
+from ..pagination import KEYSET_PAGINATION_PARAMETERS, KeysetPagination
 from ..serializers import *
+from ..utils.interest_area import interest_area_prefetches
 from ..utils.provider import *
 from .commons import FlexibleViewSet
 
@@ -30,7 +32,7 @@ logger = logging.getLogger("app_saude")
     
     **GET - Retrieve Personal Diary Entries:**
     - Returns ONLY diary entries belonging to the authenticated user
-    - Supports optional limit parameter for pagination
+    - Supports optional limit parameter, or cursor pagination with cursor/page_size
     - Ordered by most recent entries first
     - Complete access to personal diary content
     
@@ -62,7 +64,8 @@ logger = logging.getLogger("app_saude")
                 OpenApiExample(name="First 50 entries", value=50),
                 OpenApiExample(name="All entries", value=None),
             ],
-        )
+        ),
+        *KEYSET_PAGINATION_PARAMETERS,
     ],
 )
 class DiaryView(APIView):
@@ -120,6 +123,23 @@ class DiaryView(APIView):
                 .order_by("-observation_date")
             )
 
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(diary_entries_query, request, view=self)
+            if page is not None:
+                serializer = DiaryRetrieveSerializer(page, many=True)
+                logger.info(
+                    "Personal diary page retrieved successfully",
+                    extra={
+                        "user_id": user.id,
+                        "person_id": person.person_id,
+                        "diary_entries_count": len(page),
+                        "has_next_page": paginator.next_position is not None,
+                        "ip_address": ip_address,
+                        "action": "personal_diary_page_success",
+                    },
+                )
+                return paginator.get_paginated_response(serializer.data)
+
             # Apply limit if provided and valid
             if limit and limit.isdigit():
                 limit_int = int(limit)
@@ -169,6 +189,9 @@ class DiaryView(APIView):
                 },
             )
             return Response({"error": "Person profile not found."}, status=status.HTTP_404_NOT_FOUND)
+        except APIException:
+            # DRF errors (e.g. an invalid pagination cursor) keep their own status
+            raise
         except Exception as e:
             logger.error(
                 "Error retrieving personal diaries",
@@ -591,9 +614,14 @@ class DiaryDetailView(APIView):
     - Strict ownership validation
     - Cannot access other users' diaries
     - Person profile required
+    
+    **Pagination:**
+    - Send cursor and/or page_size to get {next, results} pages instead of the full list
     """,
+    parameters=KEYSET_PAGINATION_PARAMETERS,
     responses={
         200: DiaryRetrieveSerializer(many=True),
+        400: {"description": "Invalid pagination cursor"},
         401: {"description": "Authentication required"},
         404: {"description": "Person profile not found"},
     },
@@ -640,6 +668,23 @@ class PersonDiariesView(APIView):
                 .order_by("-observation_date")
             )
 
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(diaries, request, view=self)
+            if page is not None:
+                serializer = DiaryRetrieveSerializer(page, many=True)
+                logger.info(
+                    "Person diaries page retrieved successfully",
+                    extra={
+                        "user_id": user.id,
+                        "person_id": person.person_id,
+                        "diaries_count": len(page),
+                        "has_next_page": paginator.next_position is not None,
+                        "ip_address": ip_address,
+                        "action": "person_diaries_page_success",
+                    },
+                )
+                return paginator.get_paginated_response(serializer.data)
+
             # Calculate statistics
             total_entries = diaries.count()
             shared_entries = diaries.filter(shared_with_provider=True).count()
@@ -685,6 +730,9 @@ class PersonDiariesView(APIView):
                 },
             )
             return Response({"error": "Person profile not found."}, status=status.HTTP_404_NOT_FOUND)
+        except APIException:
+            # DRF errors (e.g. an invalid pagination cursor) keep their own status
+            raise
         except Exception as e:
             logger.error(
                 "Error retrieving person diaries",
@@ -720,9 +768,14 @@ class PersonDiariesView(APIView):
     - Filters out private/unshared diary entries
     - Cannot access entries from non-linked Persons
     - Ensures proper authorization for diary access
+    
+    **Pagination:**
+    - Send cursor and/or page_size to get {next, results} pages instead of the full list
     """,
+    parameters=KEYSET_PAGINATION_PARAMETERS,
     responses={
         200: DiaryRetrieveSerializer(many=True),
+        400: {"description": "Invalid pagination cursor"},
         401: {"description": "Authentication required"},
         403: {"description": "Provider not linked to specified Person"},
         404: {"description": "Provider profile or Person not found"},
@@ -778,6 +831,24 @@ class ProviderPersonDiariesView(APIView):
                 .order_by("-observation_date")
             )
 
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(diaries, request, view=self)
+            if page is not None:
+                serializer = DiaryRetrieveSerializer(page, many=True)
+                logger.info(
+                    "Provider person diaries page retrieved successfully",
+                    extra={
+                        "user_id": user.id,
+                        "provider_id": provider.provider_id,
+                        "person_id": person_id,
+                        "shared_diaries_count": len(page),
+                        "has_next_page": paginator.next_position is not None,
+                        "ip_address": ip_address,
+                        "action": "provider_person_diaries_page_success",
+                    },
+                )
+                return paginator.get_paginated_response(serializer.data)
+
             # Calculate statistics
             shared_count = diaries.count()
 
@@ -826,6 +897,9 @@ class ProviderPersonDiariesView(APIView):
                 {"error": "Provider-Person relationship not found or person does not exist."},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        except APIException:
+            # DRF errors (e.g. an invalid pagination cursor) keep their own status
+            raise
         except Exception as e:
             logger.error(
                 "Error retrieving provider person diaries",
@@ -916,13 +990,7 @@ class ProviderPersonDiaryDetailView(APIView):
             person = get_object_or_404(Person, person_id=person_id)
 
             # SECURITY: Validate Provider-Person relationship exists
-            relationship_exists = FactRelationship.objects.filter(
-                fact_id_1=person.person_id,
-                domain_concept_1_id=get_concept_by_code("PERSON").concept_id,
-                fact_id_2=provider.provider_id,
-                domain_concept_2_id=get_concept_by_code("PROVIDER").concept_id,
-                relationship_concept_id=get_concept_by_code("PERSON_PROVIDER").concept_id,
-            ).exists()
+            relationship_exists = PersonProviderLink.objects.is_linked(person.person_id, provider.provider_id)
 
             if not relationship_exists:
                 logger.warning(
@@ -1066,7 +1134,8 @@ class InterestAreaViewSet(FlexibleViewSet):
                 Observation.objects.filter(
                     observation_concept_id=get_concept_by_code("INTEREST_AREA").concept_id,
                 )
-                .select_related("person__user", "observation_concept")
+                .select_related("person__user", "observation_concept", "interest_area")
+                .prefetch_related(*interest_area_prefetches("interest_area__"))
                 .order_by("-observation_date")
             )
 
@@ -1452,22 +1521,17 @@ class MarkAttentionPointView(APIView):
             area_id = data["area_id"]
             is_attention_point = data["is_attention_point"]
 
-            # SECURITY: Get the interest area observation and verify it exists
-            observation = get_object_or_404(
-                Observation,
+            # SECURITY: Get the interest area and verify it exists
+            interest_area = get_object_or_404(
+                InterestArea.objects.select_related("person"),
                 observation_id=area_id,
-                observation_concept_id=get_concept_by_code("INTEREST_AREA").concept_id,
             )
 
             # SECURITY: Verify Provider is linked to the Person who owns this interest area
-            if observation.person:
-                relationship_exists = FactRelationship.objects.filter(
-                    fact_id_1=observation.person.person_id,
-                    domain_concept_1_id=get_concept_by_code("PERSON").concept_id,
-                    fact_id_2=provider.provider_id,
-                    domain_concept_2_id=get_concept_by_code("PROVIDER").concept_id,
-                    relationship_concept_id=get_concept_by_code("PERSON_PROVIDER").concept_id,
-                ).exists()
+            if interest_area.person:
+                relationship_exists = PersonProviderLink.objects.is_linked(
+                    interest_area.person_id, provider.provider_id
+                )
 
                 if not relationship_exists:
                     logger.warning(
@@ -1476,7 +1540,7 @@ class MarkAttentionPointView(APIView):
                             "user_id": user.id,
                             "provider_id": provider.provider_id,
                             "area_id": area_id,
-                            "area_person_id": observation.person.person_id,
+                            "area_person_id": interest_area.person.person_id,
                             "action": "mark_attention_point_no_relationship",
                         },
                     )
@@ -1486,7 +1550,7 @@ class MarkAttentionPointView(APIView):
                     )
 
             # Get provider name for marking
-            provider_name = get_provider_full_name(provider.provider_id)
+            provider_name = provider.social_name or user.get_full_name()
 
             logger.debug(
                 "Processing attention point marking with relationship validated",
@@ -1495,49 +1559,24 @@ class MarkAttentionPointView(APIView):
                     "provider_id": provider.provider_id,
                     "provider_name": provider_name,
                     "area_id": area_id,
-                    "area_person_id": observation.person.person_id if observation.person else None,
+                    "area_person_id": interest_area.person_id,
                     "is_attention_point": is_attention_point,
                     "action": "mark_attention_point_processing",
                 },
             )
 
-            # Parse existing interest data
-            try:
-                interest_data = json.loads(observation.value_as_string) if observation.value_as_string else {}
-            except json.JSONDecodeError:
-                logger.warning(
-                    "Invalid JSON in interest area, creating new structure",
-                    extra={
-                        "user_id": user.id,
-                        "area_id": area_id,
-                        "original_value": observation.value_as_string,
-                        "action": "mark_attention_point_json_error",
-                    },
-                )
-                interest_data = {}
-
-            # Initialize marked_by list if it doesn't exist
-            interest_data["marked_by"] = interest_data.get("marked_by", [])
-            original_marked_by = interest_data["marked_by"].copy()
-
-            # Update marking status
-            if is_attention_point:
-                if provider_name not in interest_data["marked_by"]:
-                    interest_data["marked_by"].append(provider_name)
-                    marking_action = "added"
-                else:
-                    marking_action = "already_marked"
-            else:
-                if provider_name in interest_data["marked_by"]:
-                    interest_data["marked_by"].remove(provider_name)
-                    marking_action = "removed"
+            # Update the marking with atomic transaction
+            with transaction.atomic():
+                if is_attention_point:
+                    _, created = InterestAreaMark.objects.get_or_create(interest_area=interest_area, provider=provider)
+                    marking_action = "added" if created else "already_marked"
                 else:
-                    marking_action = "not_marked"
+                    deleted, _ = InterestAreaMark.objects.filter(
+                        interest_area=interest_area, provider=provider
+                    ).delete()
+                    marking_action = "removed" if deleted else "not_marked"
 
-            # Update the observation with atomic transaction
-            with transaction.atomic():
-                observation.value_as_string = json.dumps(interest_data, ensure_ascii=False)
-                observation.save(update_fields=["value_as_string"])
+                total_markers = InterestAreaMark.objects.filter(interest_area=interest_area).count()
 
                 logger.info(
                     "Mark attention point completed successfully with security validation",
@@ -1546,12 +1585,10 @@ class MarkAttentionPointView(APIView):
                         "provider_id": provider.provider_id,
                         "provider_name": provider_name,
                         "area_id": area_id,
-                        "area_person_id": observation.person.person_id if observation.person else None,
+                        "area_person_id": interest_area.person_id,
                         "is_attention_point": is_attention_point,
                         "marking_action": marking_action,
-                        "original_marked_by": original_marked_by,
-                        "updated_marked_by": interest_data["marked_by"],
-                        "total_providers_marking": len(interest_data["marked_by"]),
+                        "total_providers_marking": total_markers,
                         "update_timestamp": timezone.now().isoformat(),
                         "ip_address": ip_address,
                         "action": "mark_attention_point_success",
@@ -1562,7 +1599,7 @@ class MarkAttentionPointView(APIView):
                     {
                         "provider_name": provider_name,
                         "is_marked": is_attention_point,
-                        "total_markers": len(interest_data["marked_by"]),
+                        "total_markers": total_markers,
                         "marking_action": marking_action,
                     },
                     status=status.HTTP_200_OK,
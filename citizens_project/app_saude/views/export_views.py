@@ -0,0 +1,88 @@
+import datetime
+import logging
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, OpenApiResponse, extend_schema
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..utils.omop_export import EXPORT_TABLES, astream_csv, stream_csv
+
+logger = logging.getLogger("app_saude")
+
+
+@extend_schema(
+    tags=["Admin Export"],
+    summary="Stream an OMOP CDM table as CSV",
+    description="""
+    Streams one OMOP table (person, observation, measurement, drug_exposure,
+    visit_occurrence or fact_relationship) as a CSV attachment.
+
+    Rows are read in chunks from a server-side cursor and written to the
+    response as they arrive, so memory use does not depend on the table size.
+    Only OMOP columns are exported; account data is left out.
+
+    **Admin only** (`is_staff`).
+    """,
+    parameters=[
+        OpenApiParameter("start", OpenApiTypes.DATE, description="First day included (YYYY-MM-DD)", required=False),
+        OpenApiParameter("end", OpenApiTypes.DATE, description="Last day included (YYYY-MM-DD)", required=False),
+        OpenApiParameter(
+            "care_site", OpenApiTypes.INT, description="Only persons linked to this care site", required=False
+        ),
+    ],
+    responses={
+        200: OpenApiResponse(OpenApiTypes.BINARY, description="CSV file"),
+        400: OpenApiResponse(description="Invalid filter"),
+        403: OpenApiResponse(description="Not an admin"),
+        404: OpenApiResponse(description="Unknown table"),
+    },
+)
+class OmopExportView(APIView):
+    """
+    OMOP CDM Export
+
+    Admin-only streaming CSV export of the person-level OMOP tables.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, table):
+        ip_address = request.META.get("REMOTE_ADDR", "Unknown")
+        export_table = EXPORT_TABLES.get(table)
+        if export_table is None:
+            return Response({"detail": f"Unknown table: {table}"}, status=status.HTTP_404_NOT_FOUND)
+
+        filters = {}
+        try:
+            for param in ("start", "end"):
+                value = request.query_params.get(param)
+                filters[param] = datetime.date.fromisoformat(value) if value else None
+            care_site = request.query_params.get("care_site")
+            filters["care_site_id"] = int(care_site) if care_site else None
+        except ValueError as e:
+            return Response({"detail": f"Invalid filter: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info(
+            "OMOP export started",
+            extra={
+                "user_id": request.user.id,
+                "table": table,
+                "filters": str(filters),
+                "ip_address": ip_address,
+                "action": "omop_export_started",
+            },
+        )
+
+        # Under ASGI a synchronous iterator would be read in full before the first byte is sent.
+        if isinstance(request._request, ASGIRequest):
+            content = astream_csv(export_table, **filters)
+        else:
+            content = stream_csv(export_table, **filters)
+        response = StreamingHttpResponse(content, content_type="text/csv")
+        response["Content-Disposition"] = f'attachment; filename="{table}.csv"'
+        return response
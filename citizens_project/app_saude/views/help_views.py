@@ -1,25 +1,44 @@
 import json
 import logging
 
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from ..models import *
+from ..pagination import KEYSET_PAGINATION_PARAMETERS, KeysetPagination
 from ..serializers import *
+from ..utils.help_events import (
+    close_request_connection,
+    format_sse_event,
+    help_event_broker,
+    help_event_stream,
+    notify_help_events,
+)
 from ..utils.person import *
 from ..utils.provider import *
 
 User = get_user_model()
 logger = logging.getLogger("app_saude")
 
+# Help requests sent with an Idempotency-Key header keep it in
+# observation_source_value, so a retry returns them instead of new ones.
+IDEMPOTENCY_KEY_SOURCE_PREFIX = "idempotency-key:"
+IDEMPOTENCY_KEY_MAX_LENGTH = 200
+
 
 @extend_schema(
     tags=["Help System"],
@@ -85,12 +104,8 @@ class HelpCountView(APIView):
             )
 
             # SECURITY: Count active helps only from linked persons to this provider
-            help_count = Observation.objects.filter(
-                person_id__in=linked_persons_ids,  # CRITICAL: Only from linked persons
-                provider_id=provider.provider_id,  # CRITICAL: Only to this provider
-                observation_concept_id=get_concept_by_code("HELP").concept_id,
-                value_as_concept_id=get_concept_by_code("ACTIVE").concept_id,
-            ).count()
+            # (the counters only hold linked pairs, see ProviderHelpCounter)
+            help_count = count_active_helps(provider.provider_id)
 
             # Use serializer for response data validation and formatting
             serializer = HelpCountSerializer({"help_count": help_count})
@@ -160,9 +175,14 @@ class HelpCountView(APIView):
     **Request Processing:**
     1. **Person Verification**: Confirms user has valid Person profile
     2. **Provider Validation**: Ensures all target providers are linked
-    3. **Bulk Creation**: Processes multiple help requests atomically
+    3. **Bulk Creation**: Creates all help requests in a single INSERT
     4. **Auto-Timestamps**: Sets observation_date to current time
     5. **Status Setting**: Marks all new requests as ACTIVE
+
+    **Retries:**
+    - Send an `Idempotency-Key` header (unique per alert) to make the call safe to retry
+    - A repeated key returns the help requests created by the first call, with an
+      `Idempotent-Replayed: true` header, instead of creating new ones
     
     **Security Features:**
     - Validates Person-Provider relationships before creating requests
@@ -171,9 +191,17 @@ class HelpCountView(APIView):
     - Complete audit logging of all operations
     """,
     request=HelpCreateSerializer(many=True),
+    parameters=[
+        OpenApiParameter(
+            "Idempotency-Key",
+            OpenApiTypes.STR,
+            OpenApiParameter.HEADER,
+            description=f"Client-generated key (up to {IDEMPOTENCY_KEY_MAX_LENGTH} characters) identifying this alert",
+        )
+    ],
     responses={
         201: ObservationRetrieveSerializer(many=True),
-        400: {"description": "Validation error in help request data"},
+        400: {"description": "Validation error in help request data or Idempotency-Key"},
         401: {"description": "Authentication required"},
         403: {"description": "Cannot send help to non-linked providers"},
         404: {"description": "Person profile not found"},
@@ -217,6 +245,13 @@ class SendHelpView(APIView):
                 },
             )
 
+            idempotency_key = request.headers.get("Idempotency-Key")
+            if idempotency_key is not None and not 0 < len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+                return Response(
+                    {"error": f"Idempotency-Key must have 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
             # Validate request data
             serializer = HelpCreateSerializer(data=request.data, many=True)
             if not serializer.is_valid():
@@ -238,15 +273,11 @@ class SendHelpView(APIView):
             data_list = serializer.validated_data
 
             # SECURITY: Validate all target providers are linked to this person
-            requested_provider_ids = set()
-            for data in data_list:
-                provider_id = data.get("provider_id")
-                if provider_id:
-                    requested_provider_ids.add(str(provider_id))
-
-            # Convert linked_providers_ids to strings for comparison
-            linked_providers_str = {str(pid) for pid in linked_providers_ids}
-            unauthorized_providers = requested_provider_ids - linked_providers_str
+            # (read from the database: the cached set may miss an unlink made in another worker)
+            requested_provider_ids = {data["provider_id"] for data in data_list}
+            unauthorized_providers = requested_provider_ids - PersonProviderLink.objects.linked_among(
+                person.person_id, requested_provider_ids
+            )
 
             if unauthorized_providers:
                 logger.warning(
@@ -254,65 +285,54 @@ class SendHelpView(APIView):
                     extra={
                         "user_id": user.id,
                         "person_id": person.person_id,
-                        "requested_providers": list(requested_provider_ids),
-                        "linked_providers": list(linked_providers_str),
-                        "unauthorized_providers": list(unauthorized_providers),
+                        "requested_providers": sorted(requested_provider_ids),
+                        "linked_providers": sorted(linked_providers_ids),
+                        "unauthorized_providers": sorted(unauthorized_providers),
                         "ip_address": ip_address,
                         "action": "send_help_unauthorized_providers",
                     },
                 )
                 return Response(
                     {
-                        "error": f"Cannot send help requests to non-linked providers: {', '.join(unauthorized_providers)}"
+                        "error": "Cannot send help requests to non-linked providers: "
+                        + ", ".join(str(provider_id) for provider_id in sorted(unauthorized_providers))
                     },
                     status=status.HTTP_403_FORBIDDEN,
                 )
 
+            help_concept_id = get_concept_by_code("HELP").concept_id
+            source_value = f"{IDEMPOTENCY_KEY_SOURCE_PREFIX}{idempotency_key}" if idempotency_key else None
             observations = []
-            current_time = timezone.now()
+            replayed = False
 
-            # Create help observations in bulk with security validation passed
             with transaction.atomic():
-                for data in data_list:
-                    try:
-                        # Set required fields for help observation
-                        observation_data = {
+                if source_value:
+                    # Retries of the same alert queue on the person's row, so the
+                    # later ones find the help requests of the first.
+                    Person.objects.select_for_update().only("person_id").get(pk=person.person_id)
+                    observations = list(
+                        Observation.objects.filter(
+                            person=person, observation_concept_id=help_concept_id, observation_source_value=source_value
+                        ).order_by("observation_id")
+                    )
+                    replayed = bool(observations)
+
+                if not replayed:
+                    active_concept_id = get_concept_by_code("ACTIVE").concept_id
+                    current_time = timezone.now()
+                    observations = Observation.objects.bulk_create(
+                        Observation(
                             **data,
-                            "person_id": person.person_id,
-                            "observation_concept_id": get_concept_by_code("HELP").concept_id,
-                            "value_as_concept_id": get_concept_by_code("ACTIVE").concept_id,
-                            "observation_date": current_time,
-                        }
-
-                        obs = Observation.objects.create(**observation_data)
-                        observations.append(obs)
-
-                        logger.debug(
-                            "Individual help request created with security validation",
-                            extra={
-                                "user_id": user.id,
-                                "person_id": person.person_id,
-                                "observation_id": obs.observation_id,
-                                "provider_id": data.get("provider_id"),
-                                "relationship_validated": True,
-                                "action": "send_help_individual_created",
-                            },
+                            person=person,
+                            observation_concept_id=help_concept_id,
+                            value_as_concept_id=active_concept_id,
+                            observation_date=current_time,
+                            observation_source_value=source_value,
                         )
-
-                    except Exception as e:
-                        logger.error(
-                            "Error creating individual help request",
-                            extra={
-                                "user_id": user.id,
-                                "person_id": person.person_id,
-                                "help_data": data,
-                                "error": str(e),
-                                "error_type": type(e).__name__,
-                                "action": "send_help_individual_error",
-                            },
-                            exc_info=True,
-                        )
-                        raise  # Re-raise to trigger transaction rollback
+                        for data in data_list
+                    )
+                    ProviderHelpCounter.objects.record_sent(observations)
+                    notify_help_events("help_created", observations)
 
             # Serialize response
             response_serializer = ObservationRetrieveSerializer(observations, many=True)
@@ -323,16 +343,19 @@ class SendHelpView(APIView):
                     "user_id": user.id,
                     "person_id": person.person_id,
                     "person_name": person.social_name,
-                    "help_requests_created": len(observations),
+                    "help_requests_created": 0 if replayed else len(observations),
                     "observation_ids": [obs.observation_id for obs in observations],
-                    "provider_ids": [data.get("provider_id") for data in data_list],
+                    "provider_ids": sorted(requested_provider_ids),
+                    "idempotency_key": idempotency_key,
+                    "replayed": replayed,
                     "all_providers_validated": True,
                     "ip_address": ip_address,
-                    "action": "send_help_success",
+                    "action": "send_help_replayed" if replayed else "send_help_success",
                 },
             )
 
-            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+            headers = {"Idempotent-Replayed": "true"} if replayed else None
+            return Response(response_serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
         except Http404:
             logger.warning(
@@ -387,9 +410,14 @@ class SendHelpView(APIView):
     - **Request Management**: Track and manage help request queue
     - **Response Planning**: Prioritize and organize responses
     - **Service History**: Review past help requests and resolutions
+    
+    **Pagination:**
+    - Send cursor and/or page_size to get {next, results} pages instead of the full list
     """,
+    parameters=KEYSET_PAGINATION_PARAMETERS,
     responses={
         200: ObservationRetrieveSerializer(many=True),
+        400: {"description": "Invalid pagination cursor"},
         401: {"description": "Authentication required"},
         404: {"description": "Provider profile not found"},
     },
@@ -438,9 +466,25 @@ class ReceivedHelpsView(APIView):
                 .order_by("-observation_date")
             )
 
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(helps, request, view=self)
+            if page is not None:
+                serializer = ObservationRetrieveSerializer(page, many=True)
+                logger.info(
+                    "Received helps page retrieved successfully",
+                    extra={
+                        "user_id": user.id,
+                        "provider_id": provider.provider_id,
+                        "helps_count": len(page),
+                        "has_next_page": paginator.next_position is not None,
+                        "ip_address": ip_address,
+                        "action": "received_helps_page_success",
+                    },
+                )
+                return paginator.get_paginated_response(serializer.data)
+
             # Count by status for logging
-            active_count = helps.filter(value_as_concept_id=get_concept_by_code("ACTIVE").concept_id).count()
-            resolved_count = helps.filter(value_as_concept_id=get_concept_by_code("RESOLVED").concept_id).count()
+            help_counts = ProviderHelpCounter.objects.counts_for(provider.provider_id)
 
             serializer = ObservationRetrieveSerializer(helps, many=True)
 
@@ -450,9 +494,9 @@ class ReceivedHelpsView(APIView):
                     "user_id": user.id,
                     "provider_id": provider.provider_id,
                     "provider_name": provider.social_name,
-                    "total_helps_count": helps.count(),
-                    "active_helps_count": active_count,
-                    "resolved_helps_count": resolved_count,
+                    "total_helps_count": help_counts["total"],
+                    "active_helps_count": help_counts["active"],
+                    "resolved_helps_count": help_counts["resolved"],
                     "linked_persons_count": len(linked_persons_ids),
                     "help_observation_ids": [help.observation_id for help in helps[:10]],  # First 10 for logging
                     "ip_address": ip_address,
@@ -473,6 +517,9 @@ class ReceivedHelpsView(APIView):
                 },
             )
             return Response({"error": "Provider profile not found."}, status=status.HTTP_404_NOT_FOUND)
+        except APIException:
+            # DRF errors (e.g. an invalid pagination cursor) keep their own status
+            raise
         except Exception as e:
             logger.error(
                 "Error during received helps retrieval",
@@ -571,6 +618,9 @@ class MarkHelpAsResolvedView(APIView):
                 provider_id=provider.provider_id,  # CRITICAL: Must be directed to this provider
                 person_id__in=linked_persons_ids,  # CRITICAL: Must be from linked person
             )
+            # The cached set may miss an unlink made in another worker.
+            if not PersonProviderLink.objects.is_linked(help_observation.person_id, provider.provider_id):
+                raise Http404("Help request from non-linked person.")
 
             logger.debug(
                 "Help request found and security validated",
@@ -605,8 +655,18 @@ class MarkHelpAsResolvedView(APIView):
 
             # Update the help observation to mark it as resolved
             with transaction.atomic():
+                # Only if its status is still the one read above, so a concurrent
+                # resolution cannot move the help from the counters twice.
+                resolved = Observation.objects.filter(
+                    pk=help_observation.pk, value_as_concept_id=original_status_id
+                ).update(value_as_concept_id=get_concept_by_code("RESOLVED").concept_id)
+                if not resolved:
+                    return Response({"error": "Help request is already resolved."}, status=status.HTTP_400_BAD_REQUEST)
                 help_observation.value_as_concept_id = get_concept_by_code("RESOLVED").concept_id
-                help_observation.save(update_fields=["value_as_concept_id"])
+                ProviderHelpCounter.objects.record_resolved(
+                    help_observation, was_active=original_status_id == get_concept_by_code("ACTIVE").concept_id
+                )
+                notify_help_events("help_resolved", [help_observation])
 
                 serializer = ObservationRetrieveSerializer(help_observation)
 
@@ -663,3 +723,148 @@ class MarkHelpAsResolvedView(APIView):
                 {"error": "An unexpected error occurred while resolving help request."},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Accepts ``Accept: text/event-stream``; error responses go out as an SSE ``error`` event.
+    """
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_sse_event("error", data)
+
+
+@extend_schema(
+    tags=["Help System"],
+    summary="Stream Help Events",
+    description="""
+    Server-Sent Events stream of the help requests of the authenticated Provider.
+
+    **Events:**
+    - `help_count`: sent first, `{"help_count": n}` with the current number of ACTIVE help requests
+    - `help_created`: a linked Person sent a help request to this Provider
+    - `help_resolved`: one of this Provider's help requests was resolved
+    - `resync`: events may have been lost (server reconnected to the database); refetch the help list
+
+    `help_created` and `help_resolved` carry `observation_id`, `person_id` and `provider_id`.
+    Comment lines (`: keep-alive`) are sent when the stream is idle.
+
+    **Usage:**
+    - Send the JWT in the Authorization header, so use a fetch-based SSE client
+      (the browser's EventSource cannot set headers)
+    - On reconnect, refetch `/provider/help/` since events are not replayed
+    - Requires the ASGI server (`SERVER_MODE=asgi`); the WSGI server answers 501
+    """,
+    responses={
+        (200, "text/event-stream"): OpenApiTypes.STR,
+        401: {"description": "Authentication required"},
+        404: {"description": "Provider profile not found"},
+        501: {"description": "Server is not running under ASGI"},
+        503: {"description": "The server could not listen for help events; retry later"},
+    },
+)
+class HelpEventStreamView(AsyncAPIView):
+    """
+    Help Events Stream for Provider
+
+    Pushes the provider's new and resolved help requests as they are committed,
+    fed by PostgreSQL LISTEN/NOTIFY through the process' help_event_broker.
+    """
+
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    async def get(self, request):
+        user = request.user
+        ip_address = request.META.get("REMOTE_ADDR", "Unknown")
+
+        # A WSGI worker would be held for as long as the stream stays open.
+        if not isinstance(request._request, ASGIRequest):
+            return Response(
+                {"error": "Help event streaming requires the ASGI server."}, status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+
+        try:
+            # SECURITY: Get provider and linked persons using utility function
+            provider, linked_persons_ids = await sync_to_async(get_provider_and_linked_persons)(user)
+
+            # Subscribe, then count once the listener has run LISTEN: a help committed
+            # after that point is pushed to the stream, one committed before is counted.
+            subscription = help_event_broker.subscribe(provider.provider_id)
+            try:
+                listening = await help_event_broker.wait_listening()
+                if listening:
+                    help_count = await sync_to_async(count_active_helps)(provider.provider_id)
+                    # The stream stays open for hours; release the connection now, not when it ends.
+                    await sync_to_async(close_request_connection)()
+            except Exception:
+                help_event_broker.unsubscribe(subscription)
+                raise
+
+            if not listening:
+                help_event_broker.unsubscribe(subscription)
+                logger.warning(
+                    "Help event stream failed - listener not connected",
+                    extra={
+                        "user_id": user.id,
+                        "provider_id": provider.provider_id,
+                        "ip_address": ip_address,
+                        "action": "help_stream_listener_unavailable",
+                    },
+                )
+                return Response(
+                    {"error": "Help events are unavailable, try again later."},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                )
+
+            logger.info(
+                "Help event stream opened",
+                extra={
+                    "user_id": user.id,
+                    "provider_id": provider.provider_id,
+                    "help_count": help_count,
+                    "linked_persons_count": len(linked_persons_ids),
+                    "ip_address": ip_address,
+                    "action": "help_stream_opened",
+                },
+            )
+
+            response = StreamingHttpResponse(
+                help_event_stream(subscription, help_count), content_type="text/event-stream"
+            )
+            response["Cache-Control"] = "no-cache"
+            # Stops nginx from buffering the events.
+            response["X-Accel-Buffering"] = "no"
+            return response
+
+        except Http404:
+            logger.warning(
+                "Help event stream failed - provider profile not found",
+                extra={
+                    "user_id": user.id,
+                    "email": user.email,
+                    "ip_address": ip_address,
+                    "action": "help_stream_no_provider_profile",
+                },
+            )
+            return Response({"error": "Provider profile not found."}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(
+                "Error opening help event stream",
+                extra={
+                    "user_id": user.id,
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "ip_address": ip_address,
+                    "action": "help_stream_error",
+                },
+                exc_info=True,
+            )
+            return Response(
+                {"error": "An unexpected error occurred while opening the help event stream."},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
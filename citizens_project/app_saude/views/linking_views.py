@@ -1,9 +1,12 @@
+import json
 import logging
 import uuid
 from datetime import timedelta
 
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
@@ -65,8 +68,7 @@ def validate_unlink_authorization(user, person_id, provider_id):
             raise Http404("Você só pode remover vínculos de seus próprios pacientes.")
 
         # Verifica se a pessoa está realmente vinculada a este provider
-        _, linked_persons_ids = get_provider_and_linked_persons(user)
-        if person_id not in linked_persons_ids:
+        if not PersonProviderLink.objects.is_linked(person_id, provider.provider_id):
             logger.warning(
                 "Tentativa de unlink não autorizada - pessoa não vinculada",
                 extra={
@@ -472,14 +474,9 @@ class PersonLinkProviderView(APIView):
             # Get provider details for logging and validation
             provider = get_object_or_404(Provider, provider_id=obs.provider_id)
 
-            # Check if relationship already exists
-            existing_relationship = FactRelationship.objects.filter(
-                fact_id_1=person.person_id,
-                domain_concept_1_id=get_concept_by_code("PERSON").concept_id,
-                fact_id_2=obs.provider_id,
-                domain_concept_2_id=get_concept_by_code("PROVIDER").concept_id,
-                relationship_concept_id=get_concept_by_code("PERSON_PROVIDER").concept_id,
-            ).exists()
+            # Create or get relationship person ↔ provider
+            relationship, created = PersonProviderLink.objects.link(person.person_id, obs.provider_id)
+            existing_relationship = not created
 
             if existing_relationship:
                 logger.info(
@@ -495,15 +492,6 @@ class PersonLinkProviderView(APIView):
                     },
                 )
 
-            # Create or get relationship person ↔ provider
-            relationship, created = FactRelationship.objects.get_or_create(
-                fact_id_1=person.person_id,
-                domain_concept_1_id=get_concept_by_code("PERSON").concept_id,
-                fact_id_2=obs.provider_id,
-                domain_concept_2_id=get_concept_by_code("PROVIDER").concept_id,
-                relationship_concept_id=get_concept_by_code("PERSON_PROVIDER").concept_id,
-            )
-
             # Mark code as used
             obs.person_id = person.person_id
             obs.save(update_fields=["person_id"])
@@ -646,13 +634,7 @@ class PersonProviderUnlinkView(APIView):
 
         try:
             # Find and count relationships to be removed
-            relationships = FactRelationship.objects.filter(
-                fact_id_1=person.person_id,
-                domain_concept_1_id=get_concept_by_code("PERSON").concept_id,
-                fact_id_2=provider.provider_id,
-                domain_concept_2_id=get_concept_by_code("PROVIDER").concept_id,
-                relationship_concept_id=get_concept_by_code("PERSON_PROVIDER").concept_id,
-            )
+            relationships = PersonProviderLink.objects.between(person.person_id, provider.provider_id)
 
             relationship_count = relationships.count()
 
@@ -793,12 +775,7 @@ class PersonProvidersView(APIView):
 
         try:
             # Get all relationships where this person is linked to providers
-            provider_ids = FactRelationship.objects.filter(
-                fact_id_1=person.person_id,
-                domain_concept_1_id=get_concept_by_code("PERSON").concept_id,
-                domain_concept_2_id=get_concept_by_code("PROVIDER").concept_id,
-                relationship_concept_id=get_concept_by_code("PERSON_PROVIDER").concept_id,
-            ).values_list("fact_id_2", flat=True)
+            provider_ids = PersonProviderLink.objects.providers_for(person.person_id)
 
             # Get provider objects with optimized query
             providers = (
@@ -857,9 +834,16 @@ class PersonProvidersView(APIView):
     - **Data da Última Visita**: Consulta/visita mais recente com este provider
     - **Data da Última Ajuda**: Solicitação de ajuda mais recente desta person
     - **Histórico de Serviços**: Resumo de interações passadas
+
+    **Ordenação e Filtros (opcionais):**
+    - `ordering`: `name`, `last_visit_date` ou `last_help_date` (prefixo `-` para ordem decrescente)
+    - `last_visit_date_after` / `last_visit_date_before`: intervalo da última visita
+    - `last_help_date_after` / `last_help_date_before`: intervalo da última ajuda ativa
     """,
+    parameters=[ProviderPersonsQuerySerializer],
     responses={
         200: ProviderPersonSummarySerializer(many=True),
+        400: {"description": "Invalid ordering or filter parameters"},
         401: {"description": "Authentication required"},
         404: {"description": "Provider profile not found or access denied"},
     },
@@ -894,14 +878,75 @@ class ProviderPersonsView(APIView):
         )
 
         try:
+            query_serializer = ProviderPersonsQuerySerializer(data=request.query_params)
+            if not query_serializer.is_valid():
+                logger.warning(
+                    "Provider's linked persons retrieval with invalid parameters",
+                    extra={
+                        "user_id": user.id,
+                        "provider_id": provider_id,
+                        "validation_errors": json.dumps(query_serializer.errors, ensure_ascii=False),
+                        "ip_address": ip_address,
+                        "action": "provider_persons_invalid_parameters",
+                    },
+                )
+                return Response(
+                    {"error": "Invalid parameters", "details": query_serializer.errors},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            params = query_serializer.validated_data
+
             # Use helper function to get linked persons
             _, linked_persons_ids = get_provider_and_linked_persons(user)
 
-            # Get persons with optimized queries
+            # Last visit and last active help come back with the person rows (one query for every person)
+            last_visit_date = (
+                VisitOccurrence.objects.filter(
+                    person=OuterRef("pk"), provider_id=provider_id, visit_start_date__isnull=False
+                )
+                .values("person")
+                .annotate(last=Max("visit_start_date"))
+                .values("last")
+            )
+            last_help_date = (
+                Observation.objects.filter(
+                    person=OuterRef("pk"),
+                    provider_id=provider_id,
+                    observation_concept_id=get_concept_by_code("HELP").concept_id,
+                    value_as_concept_id=get_concept_by_code("ACTIVE").concept_id,
+                    observation_date__isnull=False,
+                )
+                .values("person")
+                .annotate(last=Max("observation_date"))
+                .values("last")
+            )
             persons = (
-                Person.objects.filter(person_id__in=linked_persons_ids).select_related("user").order_by("social_name")
+                Person.objects.filter(person_id__in=linked_persons_ids)
+                .select_related("user")
+                .annotate(
+                    display_name=Coalesce(
+                        NullIf("social_name", Value("")),
+                        NullIf(Trim(Concat("user__first_name", Value(" "), "user__last_name")), Value("")),
+                        NullIf("user__username", Value("")),
+                    ),
+                    last_visit_date=Subquery(last_visit_date),
+                    last_help_date=Subquery(last_help_date),
+                )
             )
 
+            for field in ("last_visit_date", "last_help_date"):
+                if params.get(f"{field}_after"):
+                    persons = persons.filter(**{f"{field}__gte": params[f"{field}_after"]})
+                if params.get(f"{field}_before"):
+                    persons = persons.filter(**{f"{field}__lte": params[f"{field}_before"]})
+
+            ordering = params.get("ordering", "name")
+            ordering_field = "display_name" if ordering.lstrip("-") == "name" else ordering.lstrip("-")
+            if ordering.startswith("-"):
+                persons = persons.order_by(F(ordering_field).desc(nulls_last=True), "person_id")
+            else:
+                persons = persons.order_by(F(ordering_field).asc(nulls_last=True), "person_id")
+
             logger.debug(
                 "Provider's linked persons identified",
                 extra={
@@ -909,6 +954,7 @@ class ProviderPersonsView(APIView):
                     "provider_id": provider_id,
                     "linked_persons_count": len(linked_persons_ids),
                     "person_ids": list(linked_persons_ids),
+                    "ordering": ordering,
                     "action": "provider_persons_identified",
                 },
             )
@@ -918,101 +964,30 @@ class ProviderPersonsView(APIView):
             today = timezone.now()
 
             for person in persons:
-                try:
-                    age = None
-
-                    # Calculate age with fallback logic
-                    if hasattr(person, "birth_datetime") and person.birth_datetime:
-                        birth_date = person.birth_datetime
-                        age = today.year - birth_date.year
-                        # Adjust if birthday hasn't occurred this year
-                        if today.month < birth_date.month or (
-                            today.month == birth_date.month and today.day < birth_date.day
-                        ):
-                            age -= 1
-                    elif hasattr(person, "year_of_birth") and person.year_of_birth:
-                        age = today.year - person.year_of_birth
-
-                    # Get the last visit (consultation) with this provider
-                    last_visit = None
-                    try:
-                        visit = (
-                            VisitOccurrence.objects.filter(
-                                person=person, provider_id=provider_id, visit_start_date__isnull=False
-                            )
-                            .order_by("-visit_start_date")
-                            .first()
-                        )
-                        if visit:
-                            last_visit = visit.visit_start_date
-                    except Exception as e:
-                        logger.warning(
-                            "Error retrieving last visit for person",
-                            extra={
-                                "person_id": person.person_id,
-                                "provider_id": provider_id,
-                                "error": str(e),
-                                "action": "provider_persons_visit_error",
-                            },
-                        )
-
-                    # Get the last recorded help request
-                    last_help = None
-                    try:
-                        help_obs = (
-                            Observation.objects.filter(
-                                person=person,
-                                provider_id=provider_id,
-                                observation_concept_id=get_concept_by_code("HELP").concept_id,
-                                value_as_concept_id=get_concept_by_code("ACTIVE").concept_id,
-                                observation_date__isnull=False,
-                            )
-                            .order_by("-observation_date")
-                            .first()
-                        )
-                        if help_obs:
-                            last_help = help_obs.observation_date
-                    except Exception as e:
-                        logger.warning(
-                            "Error retrieving last help for person",
-                            extra={
-                                "person_id": person.person_id,
-                                "provider_id": provider_id,
-                                "error": str(e),
-                                "action": "provider_persons_help_error",
-                            },
-                        )
-
-                    # Determine best name to display
-                    name = person.social_name
-                    if not name and person.user:
-                        name = f"{person.user.first_name} {person.user.last_name}".strip()
-                        if not name:
-                            name = person.user.username
-
-                    person_summaries.append(
-                        {
-                            "person_id": person.person_id,
-                            "name": name or "Name not available",
-                            "age": age,
-                            "profile_picture": person.profile_picture,
-                            "last_visit_date": last_visit,
-                            "last_help_date": last_help,
-                        }
-                    )
-
-                except Exception as e:
-                    logger.warning(
-                        "Error processing individual person summary",
-                        extra={
-                            "person_id": person.person_id,
-                            "provider_id": provider_id,
-                            "error": str(e),
-                            "error_type": type(e).__name__,
-                            "action": "provider_persons_individual_error",
-                        },
-                    )
-                    # Continue processing other persons
+                age = None
+
+                # Calculate age with fallback logic
+                if person.birth_datetime:
+                    birth_date = person.birth_datetime
+                    age = today.year - birth_date.year
+                    # Adjust if birthday hasn't occurred this year
+                    if today.month < birth_date.month or (
+                        today.month == birth_date.month and today.day < birth_date.day
+                    ):
+                        age -= 1
+                elif person.year_of_birth:
+                    age = today.year - person.year_of_birth
+
+                person_summaries.append(
+                    {
+                        "person_id": person.person_id,
+                        "name": person.display_name or "Name not available",
+                        "age": age,
+                        "profile_picture": person.profile_picture,
+                        "last_visit_date": person.last_visit_date,
+                        "last_help_date": person.last_help_date,
+                    }
+                )
 
             # Use the serializer to format and validate the data
             serializer = ProviderPersonSummarySerializer(person_summaries, many=True)
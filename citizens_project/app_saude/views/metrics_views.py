@@ -0,0 +1,42 @@
+import logging
+import secrets
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from ..metrics import metrics_registry
+
+logger = logging.getLogger("app_saude")
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint.
+
+    A plain Django view rather than an APIView, so scrapes are not subject to
+    DRF authentication and throttling. The scraper must send METRICS_TOKEN as
+    ``Authorization: Bearer <token>``; without a token the endpoint is only
+    open when DEBUG is on.
+    """
+    ip_address = request.META.get("REMOTE_ADDR", "Unknown")
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            logger.warning(
+                "Metrics scrape rejected - METRICS_TOKEN not set",
+                extra={"ip_address": ip_address, "action": "metrics_token_unset"},
+            )
+            return HttpResponse(status=403)
+    else:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not secrets.compare_digest(supplied.encode(), token.encode()):
+            logger.warning(
+                "Metrics scrape rejected",
+                extra={"ip_address": ip_address, "action": "metrics_unauthorized"},
+            )
+            return HttpResponse(status=401)
+
+    return HttpResponse(generate_latest(metrics_registry()), content_type=CONTENT_TYPE_LATEST)
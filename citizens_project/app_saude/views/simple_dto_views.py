@@ -2,9 +2,11 @@ import logging
 
 from django.contrib.auth import get_user_model
 from drf_spectacular.utils import extend_schema
+from rest_framework import exceptions
 from rest_framework.permissions import IsAuthenticated
 
 from ..models import *
+from ..pagination import KeysetPagination, VisitKeysetPagination
 from ..serializers import *
 from ..utils.provider import *
 from .commons import FlexibleViewSet
@@ -72,6 +74,49 @@ class ObservationViewSet(FlexibleViewSet):
 
     queryset = Observation.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    # Observations kept in step with other tables by their own endpoints; they
+    # can be read here but not written.
+    MANAGED_CONCEPTS = {
+        "INTEREST_AREA": "/api/interest-area/",
+        # Sending and resolving also update the provider help counters.
+        "HELP": "/help/send/ and /provider/help/{help_id}/resolve/",
+    }
+
+    def check_not_managed(self, concept_id):
+        for code, endpoint in self.MANAGED_CONCEPTS.items():
+            try:
+                managed = concept_id == get_concept_by_code(code).concept_id
+            except Concept.DoesNotExist:
+                managed = False
+            if managed:
+                logger.warning(
+                    "Generic write to a managed observation rejected",
+                    extra={
+                        "user_id": self.request.user.id,
+                        "concept_code": code,
+                        "method": self.request.method,
+                        "action": "observation_managed_concept_rejected",
+                    },
+                )
+                raise exceptions.ValidationError(
+                    {"observation_concept": f"{code} observations are managed through {endpoint}."}
+                )
+
+    def perform_create(self, serializer):
+        self.check_not_managed(getattr(serializer.validated_data.get("observation_concept"), "concept_id", None))
+        super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        self.check_not_managed(serializer.instance.observation_concept_id)
+        if "observation_concept" in serializer.validated_data:
+            self.check_not_managed(getattr(serializer.validated_data["observation_concept"], "concept_id", None))
+        super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        self.check_not_managed(instance.observation_concept_id)
+        super().perform_destroy(instance)
 
     def get_queryset(self):
         """
@@ -110,6 +155,7 @@ class VisitOccurrenceViewSet(FlexibleViewSet):
 
     queryset = VisitOccurrence.objects.all()
     permission_classes = [IsAuthenticated]
+    pagination_class = VisitKeysetPagination
 
     def get_queryset(self):
         """
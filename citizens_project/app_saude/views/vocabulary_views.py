@@ -1,14 +1,21 @@
+import gzip
 import logging
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Prefetch
-from drf_spectacular.utils import OpenApiExample, OpenApiParameter, extend_schema
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from drf_spectacular.utils import OpenApiExample, OpenApiParameter, OpenApiResponse, extend_schema
 from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from ..models import *
 from ..serializers import *
+from ..utils.concept import get_related_concepts, translated_synonyms_prefetch
 from ..utils.provider import *
+from ..utils.vocabulary import get_vocabulary_bundle
 from .commons import FlexibleViewSet
 
 User = get_user_model()
@@ -152,13 +159,7 @@ class ConceptViewSet(FlexibleViewSet):
                 )
 
             # Optimize queries with prefetching for translations
-            queryset = queryset.prefetch_related(
-                Prefetch(
-                    "concept_synonym_concept_set",
-                    queryset=ConceptSynonym.objects.filter(language_concept__concept_code=lang),
-                    to_attr="translated_synonyms",
-                )
-            )
+            queryset = queryset.prefetch_related(translated_synonyms_prefetch(lang))
 
             # Store parameters for use in list method
             self._enrich_relationship_id = relationship_id
@@ -167,7 +168,6 @@ class ConceptViewSet(FlexibleViewSet):
             logger.debug(
                 "Concept queryset built successfully",
                 extra={
-                    "final_queryset_count": queryset.count(),
                     "prefetch_applied": True,
                     "action": "concept_queryset_complete",
                 },
@@ -249,71 +249,38 @@ class ConceptViewSet(FlexibleViewSet):
                 "Concept list requested",
                 extra={
                     "user_id": getattr(request.user, "id", None),
-                    "queryset_count": queryset.count(),
                     "relationship_enrichment": bool(relationship_id),
                     "language": lang,
                     "action": "concept_list_requested",
                 },
             )
 
-            results = []
+            concepts = list(queryset)
+            context = self.get_serializer_context()
 
-            for concept in queryset:
+            # Relationship enrichment for the whole page in one query, joined in memory
+            if relationship_id:
                 try:
-                    # Serialize the main concept
-                    base = ConceptRetrieveSerializer(concept).data
-
-                    # Add relationship enrichment if requested
-                    if relationship_id:
-                        try:
-                            rel = (
-                                ConceptRelationship.objects.select_related("concept_2")
-                                .prefetch_related(
-                                    Prefetch(
-                                        "concept_2__concept_synonym_concept_set",
-                                        queryset=ConceptSynonym.objects.filter(language_concept__concept_code=lang),
-                                        to_attr="translated_synonyms",
-                                    )
-                                )
-                                .filter(relationship_id=relationship_id, concept_1=concept)
-                                .first()
-                            )
-
-                            if rel:
-                                base["related_concept"] = ConceptRetrieveSerializer(rel.concept_2).data
-
-                        except Exception as e:
-                            logger.warning(
-                                "Error enriching concept with relationship",
-                                extra={
-                                    "concept_id": concept.concept_id,
-                                    "relationship_id": relationship_id,
-                                    "error": str(e),
-                                    "action": "concept_relationship_enrichment_error",
-                                },
-                            )
-                            # Continue without relationship data
-
-                    results.append(base)
-
+                    context["related_concepts"] = get_related_concepts(
+                        [concept.concept_id for concept in concepts], relationship_id, lang
+                    )
                 except Exception as e:
-                    logger.error(
-                        "Error serializing individual concept",
+                    logger.warning(
+                        "Error enriching concepts with relationship",
                         extra={
-                            "concept_id": getattr(concept, "concept_id", "Unknown"),
+                            "relationship_id": relationship_id,
                             "error": str(e),
-                            "error_type": type(e).__name__,
-                            "action": "concept_serialization_error",
+                            "action": "concept_relationship_enrichment_error",
                         },
-                        exc_info=True,
                     )
-                    # Skip this concept and continue
+                    # Continue without relationship data
+
+            results = ConceptRetrieveSerializer(concepts, many=True, context=context).data
 
             logger.info(
                 "Concept list completed successfully",
                 extra={
                     "results_count": len(results),
-                    "requested_count": queryset.count(),
                     "relationship_enrichment": bool(relationship_id),
                     "action": "concept_list_success",
                 },
@@ -359,3 +326,85 @@ class DomainViewSet(FlexibleViewSet):
     """
 
     queryset = Domain.objects.all()
+
+
+@extend_schema(
+    tags=["Data Vocabulary"],
+    summary="Vocabulary Bundle",
+    description="""
+    Returns the whole vocabulary used by the apps as a single versioned document.
+    
+    **Content:**
+    - `version`: content hash, also sent as the `ETag` header
+    - `concepts`: concept id, name, code, class, vocabulary, domain and `synonyms` by language code
+    - `relationships`: concept relationships between the shipped concepts
+    
+    **Caching:**
+    - Send the last `ETag` in `If-None-Match`; an unchanged vocabulary answers `304 Not Modified`
+    - The body is gzip-compressed when the client accepts it
+    - The bundle is rebuilt after `seed_all` and whenever concepts, synonyms or relationships change
+    """,
+    parameters=[
+        OpenApiParameter(
+            name="If-None-Match",
+            location=OpenApiParameter.HEADER,
+            description="ETag of the bundle the client already has",
+            required=False,
+            type=str,
+        )
+    ],
+    responses={
+        200: OpenApiResponse(description="Vocabulary bundle (JSON, gzip when accepted)"),
+        304: OpenApiResponse(description="Client copy is up to date"),
+        401: OpenApiResponse(description="Authentication required"),
+    },
+)
+class VocabularyBundleView(APIView):
+    """
+    Versioned Vocabulary Snapshot
+
+    Serves the cached, pre-compressed vocabulary bundle with ETag revalidation.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            bundle = get_vocabulary_bundle()
+        except Exception as e:
+            logger.error(
+                "Error building vocabulary bundle",
+                extra={
+                    "user_id": getattr(request.user, "id", None),
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "action": "vocabulary_bundle_error",
+                },
+                exc_info=True,
+            )
+            return Response({"detail": "Error retrieving vocabulary"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        etag = bundle["etag"]
+        client_etags = parse_etags(request.headers.get("If-None-Match", ""))
+        if "*" in client_etags or etag in [tag.removeprefix("W/") for tag in client_etags]:
+            response = HttpResponseNotModified()
+        elif "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = HttpResponse(bundle["body"], content_type="application/json")
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(gzip.decompress(bundle["body"]), content_type="application/json")
+
+        response["ETag"] = etag
+        response["Cache-Control"] = f"private, max-age={settings.VOCABULARY_BUNDLE_MAX_AGE}"
+        response["Vary"] = "Accept-Encoding, Authorization"
+
+        logger.debug(
+            "Vocabulary bundle served",
+            extra={
+                "user_id": getattr(request.user, "id", None),
+                "etag": etag,
+                "status_code": response.status_code,
+                "action": "vocabulary_bundle_served",
+            },
+        )
+        return response
@@ -0,0 +1,129 @@
+"""
+Logging pieces referenced from settings.LOGGING.
+
+- JsonFormatter: one JSON object per record, with the ``extra`` fields.
+- ExtraFormatter: the same data as a human-readable line.
+- QueueListenerHandler: formats and writes records on a background thread.
+- SamplingFilter: keeps a fraction of the DEBUG records of chosen loggers/actions.
+"""
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``.
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def extra_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in record.__dict__.items() if key not in RESERVED_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Structured formatter: timestamp, level, logger, message, then the
+    ``extra`` fields at the top level. Values JSON cannot encode are
+    written with ``str()``.
+    """
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(extra_fields(record))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ExtraFormatter(logging.Formatter):
+    """Human-readable line: ``[time] LEVEL logger: message | key=value ...``."""
+
+    def __init__(self):
+        super().__init__("[{asctime}] {levelname} {name}: {message}", style="{")
+
+    def formatMessage(self, record):
+        line = super().formatMessage(record)
+        extras = extra_fields(record)
+        if extras:
+            line += " | " + " ".join(f"{key}={value}" for key, value in extras.items())
+        return line
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Handler that only enqueues records; a QueueListener thread formats them
+    and writes them to ``stream`` (stderr by default), keeping logging I/O off
+    the request thread.
+
+    The formatter configured for this handler is applied by the listener.
+    The thread is started per process when logging is configured, so with
+    gunicorn it must not be combined with ``--preload``.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        # Drain what is still queued when the process exits.
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Only resolve the message here; formatting happens on the listener thread.
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of DEBUG records.
+
+    ``rates`` is a comma separated list of ``key=rate`` pairs, e.g.
+    ``request_metrics=0.05,app_saude=0.5``. A key is matched first against the
+    record's ``action`` extra, then against the logger name and its parents.
+    Records above DEBUG and records without a matching key are always kept.
+    """
+
+    def __init__(self, rates=""):
+        super().__init__()
+        self.rates = {}
+        for pair in rates.split(","):
+            key, _, rate = pair.partition("=")
+            if key.strip() and rate.strip():
+                self.rates[key.strip()] = float(rate)
+
+    def rate_for(self, record) -> float | None:
+        action = getattr(record, "action", None)
+        if action in self.rates:
+            return self.rates[action]
+        name = record.name
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or not self.rates:
+            return True
+        rate = self.rate_for(record)
+        return rate is None or random.random() < rate
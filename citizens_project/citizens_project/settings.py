@@ -10,7 +10,6 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
-import logging
 import os
 from datetime import timedelta
 from pathlib import Path
@@ -66,8 +65,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "app_saude.middleware.AsyncWhiteNoiseMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "app_saude.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -96,6 +96,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "citizens_project.wsgi.application"
+ASGI_APPLICATION = "citizens_project.asgi.application"
+
+# "asgi" when gunicorn serves citizens_project.asgi with uvicorn workers (see
+# gunicorn.conf.py). Under ASGI every request runs its sync code in a thread of
+# its own, so a connection kept per thread would never be reused: use the pool.
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
 
 
 # Database
@@ -109,9 +115,78 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
         "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+        # Seconds a connection is kept for reuse (0 closes it after every request).
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "0" if SERVER_MODE == "asgi" else "60")),
+        # Test a reused connection before the request runs, dropping it if the server closed it.
+        "CONN_HEALTH_CHECKS": os.environ.get("DB_CONN_HEALTH_CHECKS", "True").lower() in ("true", "1", "yes"),
+        "OPTIONS": {"connect_timeout": int(os.environ.get("DB_CONNECT_TIMEOUT", "10"))},
     }
 }
 
+# Connection pool (psycopg 3): set DB_POOL_MAX_SIZE to keep, in every process,
+# DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE open connections that requests borrow and
+# give back, instead of opening one per request. Connections are checked
+# before being handed out (DB_CONN_HEALTH_CHECKS) and replaced after
+# DB_POOL_MAX_IDLE idle seconds or DB_POOL_MAX_LIFETIME seconds of age; a
+# request waits at most DB_POOL_TIMEOUT seconds for one. Every gunicorn worker
+# has its own pool, so workers * DB_POOL_MAX_SIZE must fit in Postgres'
+# max_connections.
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "0"))
+if DB_POOL_MAX_SIZE > 0:
+    # The pool replaces persistent connections; Django refuses both at once.
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+        "max_size": DB_POOL_MAX_SIZE,
+        "timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", "600")),
+        "max_lifetime": float(os.environ.get("DB_POOL_MAX_LIFETIME", "3600")),
+    }
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default, i.e. one cache per worker. Caches that must be
+# invalidated in every worker also check their generation in the database
+# (CACHE_GENERATION_CHECK_SECONDS). A shared backend (e.g.
+# django.core.cache.backends.redis.RedisCache) avoids rebuilding them per worker.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "citizens-project"),
+        "KEY_PREFIX": os.environ.get("CACHE_KEY_PREFIX", "saude"),
+    }
+}
+
+# Caches kept in each process (concept registry, vocabulary bundle, linked id
+# sets) check their generation in the cache_generation table at most this
+# often, to pick up invalidations made by other workers or by management
+# commands.
+CACHE_GENERATION_CHECK_SECONDS = int(os.environ.get("CACHE_GENERATION_CHECK_SECONDS", "30"))
+
+# Seconds a provider's (or person's) linked id set stays cached. Links made or
+# removed elsewhere show up after CACHE_GENERATION_CHECK_SECONDS at most.
+LINKAGE_CACHE_TIMEOUT = int(os.environ.get("LINKAGE_CACHE_TIMEOUT", "300"))
+
+# Vocabulary bundle (/vocabulary/bundle/): concept classes to ship, comma
+# separated (empty = project concepts plus every translated concept), and how
+# long clients may reuse it before revalidating with If-None-Match.
+VOCABULARY_BUNDLE_CLASSES = [c.strip() for c in os.environ.get("VOCABULARY_BUNDLE_CLASSES", "").split(",") if c.strip()]
+VOCABULARY_BUNDLE_MAX_AGE = int(os.environ.get("VOCABULARY_BUNDLE_MAX_AGE", "86400"))
+# Seconds the built bundle stays in the server cache.
+VOCABULARY_BUNDLE_CACHE_TIMEOUT = int(os.environ.get("VOCABULARY_BUNDLE_CACHE_TIMEOUT", "3600"))
+
+# Request instrumentation (app_saude.middleware.RequestMetricsMiddleware):
+# requests issuing more queries or taking longer than these are logged at WARNING.
+REQUEST_QUERY_BUDGET = int(os.environ.get("REQUEST_QUERY_BUDGET", "50"))
+REQUEST_LATENCY_BUDGET_MS = int(os.environ.get("REQUEST_LATENCY_BUDGET_MS", "1000"))
+
+# Prometheus scrape endpoint (/metrics): scrapers must send
+# "Authorization: Bearer <METRICS_TOKEN>"; when it is not set, /metrics
+# answers 403 unless DEBUG is on. Under gunicorn, gunicorn.conf.py
+# sets PROMETHEUS_MULTIPROC_DIR so the workers' samples are aggregated.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -152,6 +227,11 @@ SOCIALACCOUNT_ADAPTER = "allauth.socialaccount.adapter.DefaultSocialAccountAdapt
 GOOGLE_OAUTH2_CLIENT_ID = os.environ.get("VITE_GOOGLE_CLIENT_ID", "")
 GOOGLE_OAUTH2_CLIENT_SECRET = os.environ.get("VITE_GOOGLE_CLIENT_SECRET", "")
 
+# Class used by the login views to talk to Google (libs.google.get_google_auth_client).
+GOOGLE_AUTH_CLIENT = "libs.google.GoogleAuthClient"
+# Seconds a verified Google ID token is reused (never past its expiry); 0 turns it off.
+GOOGLE_ID_TOKEN_CACHE_TIMEOUT = int(os.environ.get("GOOGLE_ID_TOKEN_CACHE_TIMEOUT", "60"))
+
 SOCIALACCOUNT_PROVIDERS = {
     "google": {
         "APP": {
@@ -208,6 +288,7 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
+    "EXCEPTION_HANDLER": "app_saude.metrics.exception_handler",
     "DEFAULT_THROTTLE_CLASSES": [
         "rest_framework.throttling.AnonRateThrottle",
         "rest_framework.throttling.UserRateThrottle",
@@ -238,70 +319,45 @@ SIMPLE_JWT = {
 }
 
 
-class ExtraFormatter(logging.Formatter):
-    def format(self, record):
-        # Formato base
-        base_format = "[{asctime}] {levelname} {name}: {message}"
-
-        # Adicionar campos extras se existirem
-        extra_fields = []
-        for key, value in record.__dict__.items():
-            if key not in [
-                "name",
-                "msg",
-                "args",
-                "levelname",
-                "levelno",
-                "pathname",
-                "filename",
-                "module",
-                "lineno",
-                "funcName",
-                "created",
-                "msecs",
-                "relativeCreated",
-                "thread",
-                "threadName",
-                "processName",
-                "process",
-                "getMessage",
-                "exc_info",
-                "exc_text",
-                "stack_info",
-                "asctime",
-                "message",
-            ]:
-                extra_fields.append(f"{key}={value}")
-
-        if extra_fields:
-            base_format += " | " + " ".join(extra_fields)
-
-        formatter = logging.Formatter(base_format, style="{")
-        return formatter.format(record)
-
+# Logging
+# app_saude records carry structured fields through ``extra`` (see
+# citizens_project.logs). LOG_FORMAT is "json" (default) or "text";
+# LOG_SAMPLE_RATES keeps a fraction of noisy DEBUG records, e.g.
+# "request_metrics=0.05,app_saude=0.5" (keys are actions or logger names).
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG")
 
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "filters": {
+        "sampling": {
+            "()": "citizens_project.logs.SamplingFilter",
+            "rates": os.environ.get("LOG_SAMPLE_RATES", ""),
+        },
+    },
     "formatters": {
         "verbose": {
             "format": "[{asctime}] {levelname} {name}: {message}",
             "style": "{",
         },
-        "extra": {
-            "()": ExtraFormatter,
+        "json": {
+            "()": "citizens_project.logs.JsonFormatter",
+        },
+        "text": {
+            "()": "citizens_project.logs.ExtraFormatter",
         },
     },
     "handlers": {
         "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "extra",
+            "()": "citizens_project.logs.QueueListenerHandler",
+            "formatter": os.environ.get("LOG_FORMAT", "json"),
+            "filters": ["sampling"],
         },
     },
     "loggers": {
         "app_saude": {
             "handlers": ["console"],
-            "level": "DEBUG",
+            "level": LOG_LEVEL,
             "propagate": False,
         },
         "": {
@@ -1,8 +1,10 @@
 from app_saude.views.account_management_views import *
 from app_saude.views.auth_views import *
 from app_saude.views.diary_views import *
+from app_saude.views.export_views import *
 from app_saude.views.help_views import *
 from app_saude.views.linking_views import *
+from app_saude.views.metrics_views import *
 from app_saude.views.onboarding_views import *
 from app_saude.views.simple_dto_views import *
 from app_saude.views.visit_views import *
@@ -72,6 +74,7 @@ urlpatterns = [
     path("provider/help/", ReceivedHelpsView.as_view(), name="get-help"),
     path("provider/help/<int:help_id>/resolve/", MarkHelpAsResolvedView.as_view(), name="resolve-help"),
     path("provider/help-count/", HelpCountView.as_view(), name="provider-help-count"),
+    path("provider/help/stream/", HelpEventStreamView.as_view(), name="provider-help-stream"),
     path("provider/next-visit/", NextScheduledVisitView.as_view(), name="next-scheduled-visit"),
     path("diaries/", DiaryView.as_view(), name="diary"),
     path("diaries/<str:diary_id>/", DiaryDetailView.as_view(), name="diary-detail"),
@@ -83,6 +86,9 @@ urlpatterns = [
         name="acs-diary-detail",
     ),
     path("person/interest-areas/mark-attention-point/", MarkAttentionPointView.as_view()),
+    path("vocabulary/bundle/", VocabularyBundleView.as_view(), name="vocabulary-bundle"),
+    path("export/omop/<str:table>/", OmopExportView.as_view(), name="omop-export"),
+    path("metrics", metrics_view, name="metrics"),
     # Docs
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
@@ -0,0 +1,30 @@
+# Gunicorn settings, loaded automatically from the working directory.
+import os
+import shutil
+
+# Prometheus multiprocess mode: each worker writes its samples to this
+# directory and /metrics aggregates them. Must be set before the workers
+# import prometheus_client, i.e. here in the master.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus-multiproc")
+
+# SERVER_MODE=asgi serves the ASGI application with uvicorn workers: async
+# views (the Google login) then wait on the network without holding a worker,
+# and sync views run in a thread each. Anything else keeps the sync workers.
+if os.environ.get("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "citizens_project.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    wsgi_app = "citizens_project.wsgi:application"
+
+
+def on_starting(server):
+    # Samples left by a previous run would be added to the new totals.
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,14 +1,58 @@
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import time
+import weakref
 from dataclasses import dataclass
 
-import requests
+import httpx
 from django.conf import settings
-from google.auth.transport import requests as google_requests
-from google.oauth2 import id_token
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from google.auth import jwt
 from rest_framework.exceptions import APIException
 
 GOOGLE_ID_TOKEN_INFO_URL = "https://www.googleapis.com/oauth2/v3/tokeninfo"
 GOOGLE_ACCESS_TOKEN_OBTAIN_URL = "https://accounts.google.com/o/oauth2/token"
 GOOGLE_USER_INFO_URL = "https://www.googleapis.com/oauth2/v3/userinfo"
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+GOOGLE_CERTS_CACHE_KEY = "google:certs"
+# Set while a refetch forced by an unknown key id is recent, so tokens with
+# made-up key ids cannot make every login fetch the certificates.
+GOOGLE_CERTS_REFRESHED_CACHE_KEY = "google:certs:refreshed"
+GOOGLE_CERTS_MIN_REFRESH_INTERVAL = 60
+GOOGLE_ID_TOKEN_CACHE_KEY = "google:id-token:{}"
+CACHE_CONTROL_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+GOOGLE_HTTP_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+# One HTTP client (and its keep-alive connections) per event loop: an
+# httpx.AsyncClient cannot be used from a loop other than the one it was
+# first used on.
+_http_clients = weakref.WeakKeyDictionary()
+
+
+def google_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = _http_clients[loop] = httpx.AsyncClient(timeout=GOOGLE_HTTP_TIMEOUT)
+    return client
+
+
+def id_token_key_id(token: str):
+    """
+    Key id (``kid``) from the header of a JWT, without verifying it.
+    """
+    try:
+        header = token.split(".", 1)[0]
+        return json.loads(base64.urlsafe_b64decode(header + "=" * (-len(header) % 4))).get("kid")
+    except (ValueError, AttributeError):
+        return None
 
 
 @dataclass
@@ -24,76 +68,117 @@ class GoogleUserData:
     given_name: str = ""
     family_name: str = ""
 
-
-def google_get_user_data(validated_data) -> GoogleUserData:
-    if validated_data.get("code"):
-        return google_get_user_data_web(code=validated_data["code"])
-    else:
-        return google_get_user_data_mobile(token=validated_data["token"])
+    @classmethod
+    def from_claims(cls, claims: dict) -> "GoogleUserData":
+        return cls(
+            email=claims.get("email", ""),
+            name=claims.get("name", ""),
+            picture=claims.get("picture", ""),
+            given_name=claims.get("given_name", ""),
+            family_name=claims.get("family_name", ""),
+        )
 
 
-def google_get_user_data_web(code):
-    # https://github.com/MomenSherif/react-oauth/issues/252
-    redirect_uri = "postmessage"
-    access_token = google_get_access_token(code=code, redirect_uri=redirect_uri)
-    return google_get_user_info(access_token=access_token)
+class GoogleAuthClient:
+    """
+    Async client for the Google endpoints used by the login.
 
+    Views get it through get_google_auth_client(), so tests can point the
+    GOOGLE_AUTH_CLIENT setting at a fake that implements the same methods.
+    """
 
-def google_get_user_data_mobile(token) -> GoogleUserData:
-    try:
-        idinfo = id_token.verify_oauth2_token(
-            token,
-            google_requests.Request(),
-            audience=[settings.GOOGLE_OAUTH2_CLIENT_ID],
+    async def get_user_data(self, validated_data) -> GoogleUserData:
+        if validated_data.get("code"):
+            return await self.get_user_data_web(code=validated_data["code"])
+        else:
+            return await self.get_user_data_mobile(token=validated_data["token"])
+
+    async def get_user_data_web(self, code) -> GoogleUserData:
+        # https://github.com/MomenSherif/react-oauth/issues/252
+        redirect_uri = "postmessage"
+        access_token = await self.get_access_token(code=code, redirect_uri=redirect_uri)
+        return await self.get_user_info(access_token=access_token)
+
+    async def get_user_data_mobile(self, token) -> GoogleUserData:
+        try:
+            idinfo = await self.verify_id_token(token)
+        except ValueError:
+            raise Exception("ID token inválido")
+        return GoogleUserData.from_claims(idinfo)
+
+    # Same checks as google.oauth2.id_token.verify_oauth2_token, without its blocking HTTP transport
+    async def verify_id_token(self, token: str) -> dict:
+        # Mobile clients retry a login with the same token; once verified, the
+        # token's claims are reused for GOOGLE_ID_TOKEN_CACHE_TIMEOUT seconds.
+        cache_key = GOOGLE_ID_TOKEN_CACHE_KEY.format(hashlib.sha256(token.encode()).hexdigest())
+        idinfo = await cache.aget(cache_key)
+        if idinfo is not None:
+            return idinfo
+
+        certs = await cache.aget(GOOGLE_CERTS_CACHE_KEY)
+        if certs is None or (
+            # Google rotated its keys before the cached ones expired.
+            id_token_key_id(token) not in certs
+            and await cache.aadd(GOOGLE_CERTS_REFRESHED_CACHE_KEY, True, GOOGLE_CERTS_MIN_REFRESH_INTERVAL)
+        ):
+            certs = await self.fetch_certs()
+
+        idinfo = jwt.decode(token, certs=certs, audience=[settings.GOOGLE_OAUTH2_CLIENT_ID])
+        if idinfo.get("iss") not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer. 'iss' should be one of the following: {GOOGLE_ISSUERS}")
+
+        timeout = min(settings.GOOGLE_ID_TOKEN_CACHE_TIMEOUT, int(idinfo["exp"] - time.time()))
+        if timeout > 0:
+            await cache.aset(cache_key, idinfo, timeout)
+        return idinfo
+
+    async def fetch_certs(self) -> dict:
+        """
+        Fetch Google's ID token signing certificates and cache them for the
+        max-age of the response's Cache-Control (not at all without one).
+        """
+        response = await google_http_client().get(GOOGLE_CERTS_URL)
+        if response.status_code != 200:
+            raise APIException(f"Could not fetch Google certificates: {response.status_code}")
+
+        certs = response.json()
+        max_age = CACHE_CONTROL_MAX_AGE.search(response.headers.get("Cache-Control", ""))
+        if max_age and int(max_age[1]) > 0:
+            await cache.aset(GOOGLE_CERTS_CACHE_KEY, certs, int(max_age[1]))
+        return certs
+
+    # Exchange authorization token with access token
+    # https://developers.google.com/identity/protocols/oauth2/web-server#obtainingaccesstokens
+    async def get_access_token(self, code: str, redirect_uri: str) -> str:
+        data = {
+            "code": code,
+            "client_id": settings.GOOGLE_OAUTH2_CLIENT_ID,
+            "client_secret": settings.GOOGLE_OAUTH2_CLIENT_SECRET,
+            "redirect_uri": redirect_uri,
+            "grant_type": "authorization_code",
+        }
+
+        response = await google_http_client().post(GOOGLE_ACCESS_TOKEN_OBTAIN_URL, data=data)
+        if not response.is_success:
+            raise APIException(f"Could not get access token from Google: {response.json()}")
+
+        access_token = response.json()["access_token"]
+
+        return access_token
+
+    # Get user info from google
+    # https://developers.google.com/identity/protocols/oauth2/web-server#callinganapi
+    async def get_user_info(self, access_token: str) -> GoogleUserData:
+        response = await google_http_client().get(
+            GOOGLE_USER_INFO_URL,
+            params={"access_token": access_token},
         )
 
-        return GoogleUserData(
-            email=idinfo.get("email", ""),
-            name=idinfo.get("name", ""),
-            picture=idinfo.get("picture", ""),
-            given_name=idinfo.get("given_name", ""),
-            family_name=idinfo.get("family_name", ""),
-        )
-    except ValueError:
-        raise Exception("ID token inválido")
-
-
-# Exchange authorization token with access token
-# https://developers.google.com/identity/protocols/oauth2/web-server#obtainingaccesstokens
-def google_get_access_token(code: str, redirect_uri: str) -> str:
-    data = {
-        "code": code,
-        "client_id": settings.GOOGLE_OAUTH2_CLIENT_ID,
-        "client_secret": settings.GOOGLE_OAUTH2_CLIENT_SECRET,
-        "redirect_uri": redirect_uri,
-        "grant_type": "authorization_code",
-    }
-
-    response = requests.post(GOOGLE_ACCESS_TOKEN_OBTAIN_URL, data=data)
-    if not response.ok:
-        raise APIException(f"Could not get access token from Google: {response.json()}")
-
-    access_token = response.json()["access_token"]
-
-    return access_token
-
-
-# Get user info from google
-# https://developers.google.com/identity/protocols/oauth2/web-server#callinganapi
-def google_get_user_info(access_token: str) -> GoogleUserData:
-    response = requests.get(
-        GOOGLE_USER_INFO_URL,
-        params={"access_token": access_token},
-    )
-
-    if not response.ok:
-        raise APIException("Could not get user info from Google: {response.json()}")
-
-    user_info = response.json()
-    return GoogleUserData(
-        email=user_info.get("email", ""),
-        name=user_info.get("name", ""),
-        picture=user_info.get("picture", ""),
-        given_name=user_info.get("given_name", ""),
-        family_name=user_info.get("family_name", ""),
-    )
+        if not response.is_success:
+            raise APIException(f"Could not get user info from Google: {response.json()}")
+
+        return GoogleUserData.from_claims(response.json())
+
+
+def get_google_auth_client() -> GoogleAuthClient:
+    return import_string(settings.GOOGLE_AUTH_CLIENT)()